@@ -1,397 +1,62 @@
 import sys
 import os
-import paramiko
+import posixpath
 import stat  # Import the stat module for S_ISDIR
-import threading
+import time
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit, QPushButton,
-    QFileDialog, QTextEdit, QVBoxLayout, QHBoxLayout, QGroupBox,
+    QFileDialog, QPlainTextEdit, QVBoxLayout, QHBoxLayout, QGroupBox,
     QMessageBox, QGridLayout, QRadioButton, QButtonGroup,
     QProgressBar, QTreeView, QSplitter, QTabWidget,
-    QAbstractItemView, QMenu, QInputDialog
+    QAbstractItemView, QMenu, QInputDialog, QSpinBox, QCheckBox, QComboBox,
+    QTableWidget, QTableWidgetItem, QHeaderView
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QObject, QThread, QModelIndex, QDir
-from PyQt6.QtGui import QTextCursor, QColor, QStandardItemModel, QStandardItem, QFileSystemModel, QAction
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QModelIndex, QDir, QTimer
+from PyQt6.QtGui import QTextCursor, QTextCharFormat, QColor, QStandardItemModel, QStandardItem, QFileSystemModel, QAction
 import webbrowser
 
-
-class LogEmitter(QObject):
-    log_signal = pyqtSignal(str, str)  # message, color
-
-
-class FileTransferWorker(QThread):
-    # Define signals for success, error, and progress
-    transfer_finished = pyqtSignal(str)
-    transfer_error = pyqtSignal(str)
-    progress_update = pyqtSignal(int)
-
-    def __init__(self, params, log_emitter):
-        super().__init__()
-        self.ip = params['ip']
-        self.port = params['port']
-        self.username = params['username']
-        self.password = params['password']
-        self.destination = params['destination']
-        self.selected_files = params['selected_files']
-        self.selection_mode = params['selection_mode']
-        self.exclusions = params['exclusions']
-        self.log_emitter = log_emitter
-        self.stop_event = threading.Event()
-        self.total_size = 0
-        self.transferred_size = 0
-        self.common_path = ""  # Initialize as instance variable
-
-    def run(self):
-        self.log("Starting file transfer...", "blue")
-        try:
-            # Establish SSH connection
-            self.log("Establishing SSH connection...", "cyan")
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(
-                self.ip,
-                port=int(self.port),
-                username=self.username,
-                password=self.password,
-                timeout=10
-            )
-            self.log("SSH connection established.", "green")
-
-            # Fetch and display system information
-            self.fetch_system_info(ssh)
-
-            sftp = ssh.open_sftp()
-
-            # Check if destination directory exists, if not, create it
-            try:
-                sftp.chdir(self.destination)
-                self.log(f"Destination directory exists: {self.destination}", "green")
-            except IOError:
-                self.log(f"Destination directory '{self.destination}' does not exist. Creating it...", "yellow")
-                self.makedirs(sftp, self.destination)
-                self.log(f"Created directory: {self.destination}", "green")
-
-            # Calculate total size
-            self.total_size = self.calculate_total_size()
-            self.transferred_size = 0
-            self.log(f"Total size to upload: {self.total_size / (1024 * 1024):.2f} MB", "blue")
-
-            # Start uploading
-            self.common_path = os.path.commonpath(self.selected_files)  # Define as instance variable
-            if os.path.isfile(self.common_path):
-                # If the common path is a file, set the common directory
-                self.common_path = os.path.dirname(self.common_path)
-
-            for local_file in self.selected_files:
-                if self.stop_event.is_set():
-                    self.log("Transfer terminated by the user.", "yellow")
-                    self.transfer_finished.emit("terminated")
-                    return
-
-                # Determine if the path is a file or directory
-                if os.path.isfile(local_file):
-                    relative_path = os.path.relpath(local_file, self.common_path)  # Use instance variable
-                    remote_file = os.path.join(self.destination, relative_path).replace('\\', '/')
-                    self.upload_file(sftp, local_file, remote_file)
-                elif os.path.isdir(local_file):
-                    relative_dir = os.path.relpath(local_file, self.common_path)  # Use instance variable
-                    remote_dir = os.path.join(self.destination, relative_dir).replace('\\', '/')
-                    self.upload_directory(sftp, local_file, remote_dir)
-
-            sftp.close()
-            ssh.close()
-            if not self.stop_event.is_set():
-                self.log("File transfer completed successfully.", "green")
-                self.transfer_finished.emit("success")
-        except Exception as e:
-            self.log(f"Error: {str(e)}", "red")
-            self.transfer_error.emit(f"An error occurred: {str(e)}")
-        finally:
-            self.log("Transfer thread finished.", "grey")
-
-    def upload_file(self, sftp, local_path, remote_path):
-        base_name = os.path.basename(local_path)
-        if base_name in self.exclusions:
-            self.log(f"Excluded file: {base_name}", "yellow")
-            return
-
-        remote_dir = os.path.dirname(remote_path)
-        try:
-            sftp.chdir(remote_dir)
-        except IOError:
-            self.makedirs(sftp, remote_dir)
-            self.log(f"Created directory: {remote_dir}", "green")
-
-        self.log(f"Uploading {local_path} to {remote_path}", "blue")
-        try:
-            sftp.put(local_path, remote_path, callback=self.create_callback())
-            if self.stop_event.is_set():
-                self.log("Transfer terminated during file upload.", "yellow")
-                self.transfer_finished.emit("terminated")
-                return
-            self.log(f"Uploaded {base_name}", "green")
-        except Exception as e:
-            self.log(f"Failed to upload {base_name}: {str(e)}", "red")
-            self.transfer_error.emit(f"Failed to upload {base_name}: {str(e)}")
-
-    def upload_directory(self, sftp, local_dir, remote_dir):
-        base_name = os.path.basename(local_dir)
-        if base_name in self.exclusions:
-            self.log(f"Excluded directory: {base_name}", "yellow")
-            return
-
-        try:
-            sftp.chdir(remote_dir)
-        except IOError:
-            self.makedirs(sftp, remote_dir)
-            self.log(f"Created directory: {remote_dir}", "green")
-
-        for root, dirs, files in os.walk(local_dir):
-            # Apply exclusions to directories
-            dirs[:] = [d for d in dirs if d not in self.exclusions]
-
-            relative_root = os.path.relpath(root, self.common_path)  # Use instance variable
-            current_remote_dir = os.path.join(self.destination, relative_root).replace('\\', '/')
-            try:
-                sftp.chdir(current_remote_dir)
-            except IOError:
-                self.makedirs(sftp, current_remote_dir)
-                self.log(f"Created directory: {current_remote_dir}", "green")
-
-            for file in files:
-                if file in self.exclusions:
-                    self.log(f"Excluded file: {file}", "yellow")
-                    continue
-                local_file = os.path.join(root, file)
-                remote_file = os.path.join(current_remote_dir, file).replace('\\', '/')
-                self.upload_file(sftp, local_file, remote_file)
-
-    def calculate_total_size(self):
-        total = 0
-        for local_file in self.selected_files:
-            if os.path.isfile(local_file):
-                try:
-                    size = os.path.getsize(local_file)
-                    total += size
-                except Exception as e:
-                    self.log(f"Error getting size for {local_file}: {str(e)}", "red")
-            elif os.path.isdir(local_file):
-                for root, dirs, files in os.walk(local_file):
-                    # Exclude directories
-                    dirs[:] = [d for d in dirs if d not in self.exclusions]
-                    for file in files:
-                        if file in self.exclusions:
-                            continue
-                        try:
-                            size = os.path.getsize(os.path.join(root, file))
-                            total += size
-                        except Exception as e:
-                            self.log(f"Error getting size for {os.path.join(root, file)}: {str(e)}", "red")
-        return total
-
-    def create_callback(self):
-        def callback(transferred, total):
-            if self.stop_event.is_set():
-                return
-            self.transferred_size += transferred
-            if self.total_size > 0:
-                percentage = int((self.transferred_size / self.total_size) * 100)
-                self.progress_update.emit(percentage)
-        return callback
-
-    def stop(self):
-        self.stop_event.set()
-
-    def log(self, message, color="white"):
-        color_dict = {
-            "white": "#FFFFFF",
-            "green": "#00FF00",
-            "red": "#FF0000",
-            "yellow": "#FFFF00",
-            "blue": "#0000FF",
-            "cyan": "#00FFFF",
-            "magenta": "#FF00FF",
-            "grey": "#808080"
-        }
-        color_code = color_dict.get(color.lower(), "#FFFFFF")
-        self.log_emitter.log_signal.emit(message, color_code)
-
-    def fetch_system_info(self, ssh):
-        commands = {
-            "Uptime": "uptime -p",
-            "Disk Usage": "df -h /",
-            "Memory Usage": "free -h",
-            "System Info": "uname -a"
-        }
-        self.log("Fetching VPS system information...", "cyan")
-        for key, cmd in commands.items():
-            if self.stop_event.is_set():
-                self.log("Transfer terminated. Stopping system info fetch.", "yellow")
-                return
-            stdin, stdout, stderr = ssh.exec_command(cmd)
-            output = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
-            if error:
-                self.log(f"{key}: Error - {error}", "red")
-            else:
-                self.log(f"{key}: {output}", "blue")
-        self.log("System information fetched successfully.", "green")
-
-    def makedirs(self, sftp, remote_directory):
-        dirs = remote_directory.strip('/').split('/')
-        path = ""
-        for dir in dirs:
-            path += f"/{dir}"
-            try:
-                sftp.chdir(path)
-            except IOError:
-                try:
-                    sftp.mkdir(path)
-                    self.log(f"Created directory: {path}", "green")
-                except Exception as e:
-                    self.log(f"Failed to create directory {path}: {str(e)}", "red")
-
-
-class RemoteFileOperationWorker(QThread):
-    # Define signals for operation completion and errors
-    operation_finished = pyqtSignal(str, str)  # message, color
-
-    def __init__(self, operation, params):
-        super().__init__()
-        self.operation = operation  # 'download', 'delete', 'rename', 'create_dir', 'move'
-        self.params = params  # Dictionary containing necessary parameters
-
-    def run(self):
-        try:
-            ip = self.params['ip']
-            port = self.params['port']
-            username = self.params['username']
-            password = self.params['password']
-            remote_path = self.params['remote_path']
-            local_destination = self.params.get('local_destination', '')
-            new_name = self.params.get('new_name', '')
-            move_destination = self.params.get('move_destination', '')
-
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(ip, port=int(port), username=username, password=password, timeout=10)
-            sftp = ssh.open_sftp()
-
-            if self.operation == 'download':
-                self.download(sftp, remote_path, local_destination)
-            elif self.operation == 'delete':
-                self.delete(sftp, remote_path)
-            elif self.operation == 'rename':
-                self.rename(sftp, remote_path, new_name)
-            elif self.operation == 'create_dir':
-                self.create_directory(sftp, remote_path)
-            elif self.operation == 'move':
-                self.move(sftp, remote_path, move_destination)
-
-            sftp.close()
-            ssh.close()
-            if self.operation in ['download', 'delete', 'rename', 'create_dir', 'move']:
-                self.operation_finished.emit(f"{self.operation.capitalize()} operation completed successfully.", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Error during {self.operation}: {str(e)}", "red")
-
-    def download(self, sftp, remote_path, local_destination):
-        try:
-            if self.is_dir(sftp, remote_path):
-                self.recursive_download(sftp, remote_path, local_destination)
-            else:
-                filename = os.path.basename(remote_path)
-                local_path = os.path.join(local_destination, filename)
-                sftp.get(remote_path, local_path)
-                self.operation_finished.emit(f"Downloaded: {remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to download {remote_path}: {str(e)}", "red")
-
-    def recursive_download(self, sftp, remote_dir, local_dir):
-        try:
-            if not os.path.exists(local_dir):
-                os.makedirs(local_dir)
-            for item in sftp.listdir_attr(remote_dir):
-                remote_path = os.path.join(remote_dir, item.filename).replace('\\', '/')
-                local_path = os.path.join(local_dir, item.filename)
-                if stat.S_ISDIR(item.st_mode):
-                    self.recursive_download(sftp, remote_path, local_path)
-                else:
-                    sftp.get(remote_path, local_path)
-                    self.operation_finished.emit(f"Downloaded: {remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to download directory {remote_dir}: {str(e)}", "red")
-
-    def delete(self, sftp, remote_path):
-        try:
-            if self.is_dir(sftp, remote_path):
-                self.recursive_delete(sftp, remote_path)
-            else:
-                sftp.remove(remote_path)
-                self.operation_finished.emit(f"Deleted: {remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to delete {remote_path}: {str(e)}", "red")
-
-    def rename(self, sftp, remote_path, new_name):
-        try:
-            base_dir = os.path.dirname(remote_path)
-            new_remote_path = os.path.join(base_dir, new_name).replace('\\', '/')
-            sftp.rename(remote_path, new_remote_path)
-            self.operation_finished.emit(f"Renamed to: {new_remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to rename {remote_path}: {str(e)}", "red")
-
-    def create_directory(self, sftp, remote_path):
-        try:
-            sftp.mkdir(remote_path)
-            self.operation_finished.emit(f"Created directory: {remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to create directory {remote_path}: {str(e)}", "red")
-
-    def move(self, sftp, remote_path, move_destination):
-        try:
-            base_dir = os.path.dirname(remote_path)
-            item_name = os.path.basename(remote_path)
-            new_remote_path = os.path.join(move_destination, item_name).replace('\\', '/')
-            sftp.rename(remote_path, new_remote_path)
-            self.operation_finished.emit(f"Moved to: {new_remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to move {remote_path}: {str(e)}", "red")
-
-    def is_dir(self, sftp, path):
-        try:
-            return stat.S_ISDIR(sftp.stat(path).st_mode)
-        except IOError:
-            return False
-
-    def recursive_delete(self, sftp, remote_dir):
-        try:
-            for item in sftp.listdir_attr(remote_dir):
-                remote_path = os.path.join(remote_dir, item.filename).replace('\\', '/')
-                if stat.S_ISDIR(item.st_mode):
-                    self.recursive_delete(sftp, remote_path)
-                else:
-                    sftp.remove(remote_path)
-                    self.operation_finished.emit(f"Deleted: {remote_path}", "green")
-            sftp.rmdir(remote_dir)
-            self.operation_finished.emit(f"Deleted directory: {remote_dir}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to delete directory {remote_dir}: {str(e)}", "red")
-
-    def recursive_download(self, sftp, remote_dir, local_dir):
-        try:
-            if not os.path.exists(local_dir):
-                os.makedirs(local_dir)
-            for item in sftp.listdir_attr(remote_dir):
-                remote_path = os.path.join(remote_dir, item.filename).replace('\\', '/')
-                local_path = os.path.join(local_dir, item.filename)
-                if stat.S_ISDIR(item.st_mode):
-                    self.recursive_download(sftp, remote_path, local_path)
-                else:
-                    sftp.get(remote_path, local_path)
-                    self.operation_finished.emit(f"Downloaded: {remote_path}", "green")
-        except Exception as e:
-            self.operation_finished.emit(f"Failed to download directory {remote_dir}: {str(e)}", "red")
+from vps_transfer.aiotransfer import AsyncLoop
+from vps_transfer.bandwidth import BandwidthLimiter
+from vps_transfer.compression import CompressionAdvisor
+from vps_transfer.engine import RemoteOperation, UploadJob
+from vps_transfer.jobqueue import CANCELLED, DONE, FAILED, RUNNING, JobQueue
+from vps_transfer.listing import ListingCache
+from vps_transfer.logbuffer import DEBUG, ERROR, INFO, WARNING, LogBuffer
+from vps_transfer.pool import ConnectionPool
+from vps_transfer.progress import format_eta, format_rate, format_stats
+from vps_transfer.sysinfo import SystemInfoCache
+
+
+LOG_COLORS = {
+    "white": "#FFFFFF",
+    "green": "#00FF00",
+    "red": "#FF0000",
+    "yellow": "#FFFF00",
+    "blue": "#0000FF",
+    "cyan": "#00FFFF",
+    "magenta": "#FF00FF",
+    "grey": "#808080"
+}
+LOG_FLUSH_INTERVAL = 150  # ms between batched appends to the log view
+MAX_LOG_LINES = 5000  # older lines scroll out of the view; use "Save log" for everything
+JOB_VIEW_INTERVAL = 500  # ms between refreshes of the job queue view
+JOB_STATE_COLORS = {
+    RUNNING: "#00FFFF",
+    DONE: "#00FF00",
+    FAILED: "#FF0000",
+    CANCELLED: "#FFFF00"
+}
+
+
+class JobSignals(QObject):
+    """Carries JobQueue state changes from worker threads to the GUI thread."""
+    job_changed = pyqtSignal(object)  # the QueuedJob whose state changed
+
+
+class ServerSignals(QObject):
+    """Carries server status probes from background threads to the GUI thread."""
+    system_info_changed = pyqtSignal(object, object)  # (host, port, username) key, SystemInfo
+    system_info_failed = pyqtSignal(object, str)
 
 
 class FileTransferApp(QWidget):
@@ -426,13 +91,36 @@ class FileTransferApp(QWidget):
             }
         """)
 
-        # Initialize Log Emitter
-        self.log_emitter = LogEmitter()
-        self.log_emitter.log_signal.connect(self.append_log)
-
-        # Initialize workers
-        self.transfer_worker = None
-        self.remote_worker = None
+        # Workers write log lines into the buffer; the view drains it in batches
+        self.log_buffer = LogBuffer()
+        self.log_formats = {}
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_FLUSH_INTERVAL)
+
+        # Uploads and remote operations run through one queue, a few at a time
+        self.job_signals = JobSignals()
+        self.job_signals.job_changed.connect(self.on_job_changed)
+        self.job_queue = JobQueue(on_change=self.job_signals.job_changed.emit)
+        self.job_timer = QTimer(self)
+        self.job_timer.timeout.connect(self.refresh_job_view)
+        self.job_timer.start(JOB_VIEW_INTERVAL)
+
+        # Authenticated SSH connections shared by workers and the remote explorer
+        self.connection_pool = ConnectionPool()
+        # Remote Explorer listings, invalidated per path after remote operations
+        self.listing_cache = ListingCache()
+        # Link and compression speed estimates, kept across jobs
+        self.compression_advisor = CompressionAdvisor()
+        # One bandwidth limit shared by every transfer; changes apply immediately
+        self.bandwidth_limiter = BandwidthLimiter()
+        # Event loop and bounded executor for async uploads, started on first use
+        self.async_loop = AsyncLoop()
+        # Server status per host, probed in the background by jobs and the status panel
+        self.server_signals = ServerSignals()
+        self.server_signals.system_info_changed.connect(self.show_server_status)
+        self.server_signals.system_info_failed.connect(self.show_server_status_error)
+        self.system_info_cache = SystemInfoCache(on_update=self.server_signals.system_info_changed.emit)
 
         # Initialize selected files list
         self.selected_files = []
@@ -440,9 +128,6 @@ class FileTransferApp(QWidget):
         # Initialize remote base path
         self.remote_base_path = ""
 
-        # Initialize processing state
-        self.processing = False
-
         self.init_ui()
 
     def init_ui(self):
@@ -529,6 +214,147 @@ class FileTransferApp(QWidget):
         self.exclusions_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
         self.exclusions_input.setFixedHeight(30)
 
+        # Parallel upload channels and SSH sessions
+        channels_label = QLabel("Parallel channels:")
+        channels_label.setStyleSheet("color: #ffffff;")
+        self.channels_input = QSpinBox()
+        self.channels_input.setRange(1, 32)
+        self.channels_input.setValue(1)
+        self.channels_input.setToolTip("Number of SFTP channels used concurrently for uploads (1 = sequential)")
+        self.channels_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.channels_input.setFixedHeight(30)
+
+        sessions_label = QLabel("SSH sessions:")
+        sessions_label.setStyleSheet("color: #ffffff;")
+        self.sessions_input = QSpinBox()
+        self.sessions_input.setRange(1, 8)
+        self.sessions_input.setValue(1)
+        self.sessions_input.setToolTip("Number of SSH connections the parallel channels are spread over")
+        self.sessions_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.sessions_input.setFixedHeight(30)
+
+        # Segmented transfer of large files
+        segments_label = QLabel("Large file segments:")
+        segments_label.setStyleSheet("color: #ffffff;")
+        self.segments_input = QSpinBox()
+        self.segments_input.setRange(1, 16)
+        self.segments_input.setValue(1)
+        self.segments_input.setToolTip("Byte ranges a large file is split into and transferred concurrently (1 = off)")
+        self.segments_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.segments_input.setFixedHeight(30)
+
+        threshold_label = QLabel("Segment threshold (MB):")
+        threshold_label.setStyleSheet("color: #ffffff;")
+        self.threshold_input = QSpinBox()
+        self.threshold_input.setRange(16, 1024 * 1024)
+        self.threshold_input.setValue(256)
+        self.threshold_input.setToolTip("Files at least this large are transferred in segments")
+        self.threshold_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.threshold_input.setFixedHeight(30)
+
+        # Bandwidth limit and priority
+        limit_label = QLabel("Bandwidth limit:")
+        limit_label.setStyleSheet("color: #ffffff;")
+        self.limit_input = QSpinBox()
+        self.limit_input.setRange(0, 100000)
+        self.limit_input.setValue(0)
+        self.limit_input.setSuffix(" MB/s")
+        self.limit_input.setSpecialValueText("Unlimited")
+        self.limit_input.setToolTip("Total rate for all transfers and channels; can be changed while a transfer runs")
+        self.limit_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.limit_input.setFixedHeight(30)
+        self.limit_input.valueChanged.connect(self.change_bandwidth_limit)
+        self.background_checkbox = QCheckBox("Background upload")
+        self.background_checkbox.setToolTip("Give this upload a small share of the limit while downloads are running")
+
+        # Job queue concurrency
+        jobs_label = QLabel("Concurrent jobs:")
+        jobs_label.setStyleSheet("color: #ffffff;")
+        self.jobs_input = QSpinBox()
+        self.jobs_input.setRange(1, 8)
+        self.jobs_input.setValue(self.job_queue.max_workers)
+        self.jobs_input.setToolTip("Uploads, downloads and remote operations run at the same time; more are queued")
+        self.jobs_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.jobs_input.setFixedHeight(30)
+        self.jobs_input.valueChanged.connect(self.job_queue.set_max_workers)
+
+        # Content deduplication
+        dedup_label = QLabel("Dedup:")
+        dedup_label.setStyleSheet("color: #ffffff;")
+        self.dedup_checkbox = QCheckBox("Upload identical files once")
+        self.dedup_checkbox.setToolTip("Send each distinct content once and make the other copies on the server with cp --reflink=auto")
+        self.dedup_reference_input = QLineEdit()
+        self.dedup_reference_input.setPlaceholderText("Reuse files from, e.g. /var/www/releases/previous (optional)")
+        self.dedup_reference_input.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+        self.dedup_reference_input.setFixedHeight(30)
+        self.hardlink_checkbox = QCheckBox("Hard links")
+        self.hardlink_checkbox.setToolTip("Make duplicates hard links to their source instead of separate copies")
+        dedup_layout = QHBoxLayout()
+        dedup_layout.addWidget(self.dedup_checkbox)
+        dedup_layout.addWidget(self.dedup_reference_input)
+        dedup_layout.addWidget(self.hardlink_checkbox)
+
+        # Tracing and profiling
+        diagnostics_label = QLabel("Diagnostics:")
+        diagnostics_label.setStyleSheet("color: #ffffff;")
+        self.trace_checkbox = QCheckBox("Trace phases")
+        self.trace_checkbox.setToolTip("Time every phase and file operation and save a Chrome trace plus a summary to ~/.vps_transfer/traces")
+        self.profile_combo = QComboBox()
+        for name, mode in (("No profiling", None), ("CPU profile (cProfile)", 'cpu'), ("Memory profile (tracemalloc)", 'memory')):
+            self.profile_combo.addItem(name, mode)
+        self.profile_combo.setToolTip("Profile the job's worker threads; the result is saved next to the traces")
+        diagnostics_layout = QHBoxLayout()
+        diagnostics_layout.addWidget(self.trace_checkbox)
+        diagnostics_layout.addWidget(self.profile_combo)
+        diagnostics_layout.addStretch()
+
+        # Transfer mode
+        mode_label = QLabel("Transfer mode:")
+        mode_label.setStyleSheet("color: #ffffff;")
+        self.sftp_mode_radio = QRadioButton("SFTP (file by file)")
+        self.sftp_mode_radio.setChecked(True)
+        self.tar_mode_radio = QRadioButton("Tar stream (many small files)")
+        self.tar_mode_radio.setToolTip("Stream one tar archive into 'tar -x' on the server; falls back to SFTP without tar")
+        self.async_mode_radio = QRadioButton("Async (many requests in flight)")
+        self.async_mode_radio.setToolTip("Upload many files at once over a few SFTP channels without waiting on each reply")
+        self.mode_group = QButtonGroup(self)
+        self.mode_group.addButton(self.sftp_mode_radio)
+        self.mode_group.addButton(self.tar_mode_radio)
+        self.mode_group.addButton(self.async_mode_radio)
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(self.sftp_mode_radio)
+        mode_layout.addWidget(self.tar_mode_radio)
+        mode_layout.addWidget(self.async_mode_radio)
+        mode_layout.addStretch()
+
+        # Incremental sync
+        self.sync_checkbox = QCheckBox("Sync (skip unchanged files)")
+        self.sync_checkbox.setToolTip("Compare size and modification time with the server and upload only new or changed files")
+        self.checksum_checkbox = QCheckBox("Compare checksums")
+        self.checksum_checkbox.setToolTip("When sizes match but times differ, compare SHA-256 before re-uploading")
+        mode_layout.addWidget(self.sync_checkbox)
+        mode_layout.addWidget(self.checksum_checkbox)
+
+        # Block-delta uploads
+        self.delta_checkbox = QCheckBox("Delta transfer")
+        self.delta_checkbox.setToolTip("Send only the changed blocks of large files that already exist on the server (needs python3 there)")
+        mode_layout.addWidget(self.delta_checkbox)
+
+        # Resumable transfers
+        self.resume_checkbox = QCheckBox("Resume")
+        self.resume_checkbox.setToolTip("Skip files finished by an earlier, interrupted run of the same job and continue partial ones")
+        mode_layout.addWidget(self.resume_checkbox)
+
+        # Integrity verification
+        self.verify_checkbox = QCheckBox("Verify")
+        self.verify_checkbox.setToolTip("Hash every file while it transfers, compare it with a hash taken on the server and send mismatches again")
+        mode_layout.addWidget(self.verify_checkbox)
+
+        # Adaptive compression
+        self.compression_checkbox = QCheckBox("Compress")
+        self.compression_checkbox.setToolTip("Gzip files on the fly when a sample shows it will make them arrive sooner (needs gzip on the server)")
+        mode_layout.addWidget(self.compression_checkbox)
+
         # Adding widgets to settings layout
         settings_layout.addWidget(ip_label, 0, 0)
         settings_layout.addWidget(self.ip_input, 0, 1)
@@ -542,6 +368,25 @@ class FileTransferApp(QWidget):
         settings_layout.addWidget(self.dest_path, 2, 1, 1, 3)
         settings_layout.addWidget(exclusions_label, 3, 0)
         settings_layout.addWidget(self.exclusions_input, 3, 1, 1, 3)
+        settings_layout.addWidget(channels_label, 4, 0)
+        settings_layout.addWidget(self.channels_input, 4, 1)
+        settings_layout.addWidget(sessions_label, 4, 2)
+        settings_layout.addWidget(self.sessions_input, 4, 3)
+        settings_layout.addWidget(segments_label, 5, 0)
+        settings_layout.addWidget(self.segments_input, 5, 1)
+        settings_layout.addWidget(threshold_label, 5, 2)
+        settings_layout.addWidget(self.threshold_input, 5, 3)
+        settings_layout.addWidget(mode_label, 6, 0)
+        settings_layout.addLayout(mode_layout, 6, 1, 1, 3)
+        settings_layout.addWidget(limit_label, 7, 0)
+        settings_layout.addWidget(self.limit_input, 7, 1)
+        settings_layout.addWidget(self.background_checkbox, 7, 2, 1, 2)
+        settings_layout.addWidget(jobs_label, 8, 0)
+        settings_layout.addWidget(self.jobs_input, 8, 1)
+        settings_layout.addWidget(dedup_label, 9, 0)
+        settings_layout.addLayout(dedup_layout, 9, 1, 1, 3)
+        settings_layout.addWidget(diagnostics_label, 10, 0)
+        settings_layout.addLayout(diagnostics_layout, 10, 1, 1, 3)
 
         settings_group.setLayout(settings_layout)
         main_function_layout.addWidget(settings_group)
@@ -562,6 +407,11 @@ class FileTransferApp(QWidget):
         self.progress_bar.setValue(0)
         main_function_layout.addWidget(self.progress_bar)
 
+        # Combined throughput, ETA and file rate of the running jobs
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("color: #d4d4d4;")
+        main_function_layout.addWidget(self.stats_label)
+
         # Buttons Layout
         buttons_layout = QHBoxLayout()
 
@@ -587,7 +437,8 @@ class FileTransferApp(QWidget):
         self.transfer_btn.setFixedHeight(40)
 
         # Terminate Button
-        self.terminate_btn = QPushButton("Terminate Transfer")
+        self.terminate_btn = QPushButton("Terminate All")
+        self.terminate_btn.setToolTip("Cancel every queued and running job")
         self.terminate_btn.clicked.connect(self.terminate_transfer)
         self.terminate_btn.setStyleSheet("""
             QPushButton {
@@ -612,14 +463,105 @@ class FileTransferApp(QWidget):
         buttons_layout.addWidget(self.terminate_btn)
         main_function_layout.addLayout(buttons_layout)
 
+        # Job Queue Section
+        queue_group = QGroupBox("Job Queue")
+        queue_layout = QVBoxLayout()
+
+        self.job_table = QTableWidget(0, 5)
+        self.job_table.setHorizontalHeaderLabels(['Job', 'State', 'Progress', 'Throughput', 'ETA'])
+        self.job_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.job_table.verticalHeader().setVisible(False)
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.job_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.job_table.setFixedHeight(150)
+        self.job_table.setStyleSheet("""
+            QTableWidget {
+                background-color: #1e1e1e;
+                color: #d4d4d4;
+                selection-background-color: #555555;
+                selection-color: #ffffff;
+            }
+        """)
+        queue_layout.addWidget(self.job_table)
+
+        queue_buttons = QHBoxLayout()
+        cancel_job_btn = QPushButton("Cancel Selected")
+        cancel_job_btn.clicked.connect(self.cancel_selected_jobs)
+        clear_jobs_btn = QPushButton("Clear Finished")
+        clear_jobs_btn.clicked.connect(self.clear_finished_jobs)
+        for button in (cancel_job_btn, clear_jobs_btn):
+            button.setStyleSheet("""
+                QPushButton {
+                    background-color: #3c3c3c;
+                    color: #d4d4d4;
+                    border: 1px solid #5c5c5c;
+                    padding: 5px 10px;
+                    border-radius: 4px;
+                }
+                QPushButton:hover {
+                    background-color: #5c5c5c;
+                }
+            """)
+            button.setFixedHeight(30)
+            queue_buttons.addWidget(button)
+        queue_buttons.addStretch()
+        queue_layout.addLayout(queue_buttons)
+        queue_group.setLayout(queue_layout)
+        main_function_layout.addWidget(queue_group)
+
+        # Server status, filled in by background probes
+        status_group = QGroupBox("Server Status")
+        status_layout = QHBoxLayout()
+        self.server_status_label = QLabel("Not probed yet. Load a remote directory or start a transfer.")
+        self.server_status_label.setStyleSheet("color: #d4d4d4; font-family: Consolas; font-size: 12px;")
+        self.server_status_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        self.server_status_label.setWordWrap(True)
+        refresh_status_btn = QPushButton("Refresh")
+        refresh_status_btn.setToolTip("Probe the server again now instead of using the cached status")
+        refresh_status_btn.clicked.connect(lambda: self.refresh_server_status(force=True))
+        refresh_status_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #3c3c3c;
+                color: #d4d4d4;
+                border: 1px solid #5c5c5c;
+                padding: 5px 10px;
+                border-radius: 4px;
+            }
+            QPushButton:hover {
+                background-color: #5c5c5c;
+            }
+        """)
+        refresh_status_btn.setFixedHeight(30)
+        status_layout.addWidget(self.server_status_label, 1)
+        status_layout.addWidget(refresh_status_btn, 0, Qt.AlignmentFlag.AlignTop)
+        status_group.setLayout(status_layout)
+        main_function_layout.addWidget(status_group)
+
         # Log Section
         log_group = QGroupBox("Transfer Log")
         log_layout = QVBoxLayout()
 
-        self.log_text = QTextEdit()
+        log_controls = QHBoxLayout()
+        verbosity_label = QLabel("Verbosity:")
+        self.verbosity_combo = QComboBox()
+        for name, level in (("Errors", ERROR), ("Warnings", WARNING), ("Info", INFO), ("Debug (per file)", DEBUG)):
+            self.verbosity_combo.addItem(name, level)
+        self.verbosity_combo.setCurrentIndex(2)
+        self.verbosity_combo.currentIndexChanged.connect(self.change_verbosity)
+        self.log_file_checkbox = QCheckBox("Save log to file")
+        self.log_file_checkbox.setToolTip("Append every log line, at every verbosity, to a file")
+        self.log_file_checkbox.toggled.connect(self.toggle_log_file)
+        log_controls.addWidget(verbosity_label)
+        log_controls.addWidget(self.verbosity_combo)
+        log_controls.addWidget(self.log_file_checkbox)
+        log_controls.addStretch()
+        log_layout.addLayout(log_controls)
+
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setMaximumBlockCount(MAX_LOG_LINES)
         self.log_text.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: #1e1e1e;
                 color: #d4d4d4;
                 font-family: Consolas;
@@ -837,10 +779,6 @@ class FileTransferApp(QWidget):
         self.developer_tab.setLayout(layout)
 
     def remote_context_menu(self, position):
-        if self.processing:
-            # If processing is ongoing, do not show the context menu
-            return
-
         indexes = self.remote_tree.selectedIndexes()
         if indexes:
             menu = QMenu()
@@ -865,6 +803,14 @@ class FileTransferApp(QWidget):
             move_action.triggered.connect(self.move_remote_file)
             menu.addAction(move_action)
 
+            copy_action = QAction("Copy", self)
+            copy_action.triggered.connect(self.copy_remote_file)
+            menu.addAction(copy_action)
+
+            size_action = QAction("Size", self)
+            size_action.triggered.connect(self.measure_remote_file)
+            menu.addAction(size_action)
+
             menu.exec(self.remote_tree.viewport().mapToGlobal(position))
 
     def load_remote_directory(self):
@@ -887,29 +833,66 @@ class FileTransferApp(QWidget):
                 QMessageBox.warning(self, "Warning", "Please fill in all required fields.")
                 return
 
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(ip, port=int(port), username=username, password=password, timeout=10)
-            sftp = ssh.open_sftp()
+            # An explicit load always goes back to the server
+            self.listing_cache.clear(self.remote_server())
+            with self.connection_pool.sftp(ip, port, username, password) as sftp:
+                self.remote_model.setHorizontalHeaderLabels(['Name', 'Size', 'Type'])
 
-            self.remote_model.setHorizontalHeaderLabels(['Name', 'Size', 'Type'])
-
-            self.populate_remote_tree(sftp, destination, self.remote_model.invisibleRootItem())
-
-            sftp.close()
-            ssh.close()
+                self.populate_remote_tree(sftp, destination, self.remote_model.invisibleRootItem())
 
             # Store the base path
             self.remote_base_path = destination.rstrip('/')
 
             self.log(f"Loaded remote directory: {destination}", "green")
+            self.refresh_server_status()
         except Exception as e:
             self.log(f"Error loading remote directory: {str(e)}", "red")
             QMessageBox.critical(self, "Error", f"Failed to load remote directory: {str(e)}")
 
+    def remote_server(self):
+        return (self.ip_input.text().strip(), self.port_input.text().strip(), self.username_input.text().strip())
+
+    def refresh_server_status(self, force=False):
+        """Show the cached status of the current server, probing it in the background when stale or forced."""
+        ip, port, username = self.remote_server()
+        password = self.password_input.text().strip()
+        if not all([ip, port, username, password]):
+            if force:
+                QMessageBox.warning(self, "Warning", "Please fill in the server address and credentials.")
+            return
+        server = (ip, port, username)
+        info = None if force else self.system_info_cache.get(server)
+        if info is not None:
+            self.show_server_status(SystemInfoCache.make_key(server), info)
+            return
+        self.server_status_label.setText(f"Probing {ip}...")
+
+        def on_done(info, error):
+            # Fresh results arrive through the cache's on_update
+            if error is not None:
+                self.server_signals.system_info_failed.emit(SystemInfoCache.make_key(server), str(error))
+
+        self.system_info_cache.fetch_async(self.connection_pool, ip, port, username, password, on_done, force=force)
+
+    def show_server_status(self, key, info):
+        """Runs in the GUI thread whenever a probe of any server finishes; shows the current server's."""
+        if key != SystemInfoCache.make_key(self.remote_server()):
+            return
+        fetched = time.strftime('%H:%M:%S', time.localtime(info.fetched_at))
+        lines = [f"{key[2]}@{key[0]}:{key[1]}, probed at {fetched} in {info.elapsed:.2f}s"]
+        for label, text in info.fields.items():
+            lines.append(f"{label}: {text}")
+        for label, text in info.errors.items():
+            lines.append(f"{label}: unavailable ({text})")
+        self.server_status_label.setText("\n".join(lines))
+
+    def show_server_status_error(self, key, message):
+        if key == SystemInfoCache.make_key(self.remote_server()):
+            self.server_status_label.setText(f"Could not probe {key[0]}: {message}")
+
     def populate_remote_tree(self, sftp, path, parent_item):
         try:
-            for entry in sftp.listdir_attr(path):
+            for entry in self.listing_cache.listdir_attr(sftp, self.remote_server(), path):
                 item = QStandardItem(entry.filename)
                 size_item = QStandardItem(str(entry.st_size))
                 type_item = QStandardItem("Directory" if stat.S_ISDIR(entry.st_mode) else "File")
@@ -923,10 +906,6 @@ class FileTransferApp(QWidget):
             self.log(f"Error populating remote tree: {str(e)}", "red")
 
     def on_remote_tree_expanded(self, index):
-        if self.processing:
-            # Prevent expanding while processing
-            return
-
         item = self.remote_model.itemFromIndex(index)
         if item.hasChildren() and item.child(0).text() == "Loading...":
             item.removeRows(0, item.rowCount())
@@ -937,23 +916,12 @@ class FileTransferApp(QWidget):
                 username = self.username_input.text().strip()
                 password = self.password_input.text().strip()
 
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(ip, port=int(port), username=username, password=password, timeout=10)
-                sftp = ssh.open_sftp()
-
-                self.populate_remote_tree(sftp, remote_path, item)
-
-                sftp.close()
-                ssh.close()
+                with self.connection_pool.sftp(ip, port, username, password) as sftp:
+                    self.populate_remote_tree(sftp, remote_path, item)
             except Exception as e:
                 self.log(f"Error expanding remote tree: {str(e)}", "red")
 
     def on_remote_tree_clicked(self, index):
-        if self.processing:
-            # Prevent updating destination while processing
-            return
-
         remote_path = self.get_remote_file_path(index)
         self.dest_path.setText(remote_path)
         self.log(f"Destination directory updated to: {remote_path}", "blue")
@@ -975,23 +943,28 @@ class FileTransferApp(QWidget):
         if not local_destination:
             return
 
-        # Set processing state
-        self.set_processing_state(True)
-        self.log("Processing... Downloading selected items.", "magenta")
+        self.log(f"Queued download of {len(selected_files)} item(s).", "magenta")
 
-        # Start download in a separate thread
+        # One queued job per item; the queue decides how many run at once
         for file in selected_files:
             params = {
                 'ip': self.ip_input.text().strip(),
                 'port': self.port_input.text().strip(),
                 'username': self.username_input.text().strip(),
                 'password': self.password_input.text().strip(),
+                'pool': self.connection_pool,
                 'remote_path': file,
-                'local_destination': local_destination
+                'local_destination': local_destination,
+                'segments': self.segments_input.value(),
+                'segment_threshold': self.threshold_input.value(),
+                'transfer_mode': 'tar' if self.tar_mode_radio.isChecked() else 'sftp',
+                'resume': self.resume_checkbox.isChecked(),
+                'verify': self.verify_checkbox.isChecked(),
+                'compression': self.compression_advisor if self.compression_checkbox.isChecked() else None,
+                'limiter': self.bandwidth_limiter,
+                'priority': 'high'  # interactive, ahead of background uploads
             }
-            self.remote_worker = RemoteFileOperationWorker('download', params)
-            self.remote_worker.operation_finished.connect(self.handle_remote_operation_finished)
-            self.remote_worker.start()
+            self.queue_remote_operation('download', params, f"Download {file}")
 
     def delete_remote_files(self):
         selected_indexes = self.remote_tree.selectedIndexes()
@@ -1013,22 +986,18 @@ class FileTransferApp(QWidget):
                 file_path = self.get_remote_file_path(index)
                 selected_files.add(file_path)
 
-        # Set processing state
-        self.set_processing_state(True)
-        self.log("Processing... Deleting selected items.", "magenta")
+        self.log(f"Queued delete of {len(selected_files)} item(s).", "magenta")
 
-        # Start delete in a separate thread
         for file in selected_files:
             params = {
                 'ip': self.ip_input.text().strip(),
                 'port': self.port_input.text().strip(),
                 'username': self.username_input.text().strip(),
                 'password': self.password_input.text().strip(),
+                'pool': self.connection_pool,
                 'remote_path': file
             }
-            self.remote_worker = RemoteFileOperationWorker('delete', params)
-            self.remote_worker.operation_finished.connect(self.handle_remote_operation_finished)
-            self.remote_worker.start()
+            self.queue_remote_operation('delete', params, f"Delete {file}")
 
     def rename_remote_file(self):
         selected_indexes = self.remote_tree.selectedIndexes()
@@ -1040,21 +1009,17 @@ class FileTransferApp(QWidget):
         remote_path = self.get_remote_file_path(index)
         new_name, ok = QInputDialog.getText(self, "Rename", "Enter new name:")
         if ok and new_name:
-            # Set processing state
-            self.set_processing_state(True)
-            self.log("Processing... Renaming item.", "magenta")
 
             params = {
                 'ip': self.ip_input.text().strip(),
                 'port': self.port_input.text().strip(),
                 'username': self.username_input.text().strip(),
                 'password': self.password_input.text().strip(),
+                'pool': self.connection_pool,
                 'remote_path': remote_path,
                 'new_name': new_name
             }
-            self.remote_worker = RemoteFileOperationWorker('rename', params)
-            self.remote_worker.operation_finished.connect(self.handle_remote_operation_finished)
-            self.remote_worker.start()
+            self.queue_remote_operation('rename', params, f"Rename {remote_path} to {new_name}")
 
     def create_remote_directory(self):
         remote_parent = self.dest_path.text().strip()
@@ -1064,9 +1029,6 @@ class FileTransferApp(QWidget):
 
         dir_name, ok = QInputDialog.getText(self, "Create Directory", "Enter directory name:")
         if ok and dir_name:
-            # Set processing state
-            self.set_processing_state(True)
-            self.log("Processing... Creating directory.", "magenta")
 
             remote_path = os.path.join(remote_parent, dir_name).replace('\\', '/')
             params = {
@@ -1074,11 +1036,10 @@ class FileTransferApp(QWidget):
                 'port': self.port_input.text().strip(),
                 'username': self.username_input.text().strip(),
                 'password': self.password_input.text().strip(),
+                'pool': self.connection_pool,
                 'remote_path': remote_path
             }
-            self.remote_worker = RemoteFileOperationWorker('create_dir', params)
-            self.remote_worker.operation_finished.connect(self.handle_remote_operation_finished)
-            self.remote_worker.start()
+            self.queue_remote_operation('create_dir', params, f"Create directory {remote_path}")
 
     def move_remote_file(self):
         selected_indexes = self.remote_tree.selectedIndexes()
@@ -1090,28 +1051,149 @@ class FileTransferApp(QWidget):
         remote_path = self.get_remote_file_path(index)
         move_destination, ok = QInputDialog.getText(self, "Move", "Enter destination path:")
         if ok and move_destination:
-            # Set processing state
-            self.set_processing_state(True)
-            self.log("Processing... Moving item.", "magenta")
 
             params = {
                 'ip': self.ip_input.text().strip(),
                 'port': self.port_input.text().strip(),
                 'username': self.username_input.text().strip(),
                 'password': self.password_input.text().strip(),
+                'pool': self.connection_pool,
                 'remote_path': remote_path,
                 'move_destination': move_destination
             }
-            self.remote_worker = RemoteFileOperationWorker('move', params)
-            self.remote_worker.operation_finished.connect(self.handle_remote_operation_finished)
-            self.remote_worker.start()
+            self.queue_remote_operation('move', params, f"Move {remote_path} to {move_destination}")
+
+    def copy_remote_file(self):
+        selected_indexes = self.remote_tree.selectedIndexes()
+        if not selected_indexes:
+            QMessageBox.warning(self, "Warning", "Please select a file or folder to copy.")
+            return
+
+        index = selected_indexes[0]
+        remote_path = self.get_remote_file_path(index)
+        copy_destination, ok = QInputDialog.getText(self, "Copy", "Enter destination directory:")
+        if ok and copy_destination:
+
+            params = {
+                'ip': self.ip_input.text().strip(),
+                'port': self.port_input.text().strip(),
+                'username': self.username_input.text().strip(),
+                'password': self.password_input.text().strip(),
+                'pool': self.connection_pool,
+                'remote_path': remote_path,
+                'copy_destination': copy_destination
+            }
+            self.queue_remote_operation('copy', params, f"Copy {remote_path} to {copy_destination}")
 
-    def handle_remote_operation_finished(self, message, color):
-        self.append_log(message, color)
-        # Refresh the remote directory view after operation completes
-        self.refresh_remote_directory()
-        # Reset processing state
-        self.set_processing_state(False)
+    def measure_remote_file(self):
+        selected_indexes = self.remote_tree.selectedIndexes()
+        if not selected_indexes:
+            QMessageBox.warning(self, "Warning", "Please select a file or folder to measure.")
+            return
+
+        index = selected_indexes[0]
+        remote_path = self.get_remote_file_path(index)
+        params = {
+            'ip': self.ip_input.text().strip(),
+            'port': self.port_input.text().strip(),
+            'username': self.username_input.text().strip(),
+            'password': self.password_input.text().strip(),
+            'pool': self.connection_pool,
+            'remote_path': remote_path
+        }
+        self.queue_remote_operation('size', params, f"Size of {remote_path}")
+
+    def queue_remote_operation(self, operation, params, description):
+        params.update(self.diagnostic_options())
+        job = RemoteOperation(operation, params, log=self.log_buffer.write)
+        self.job_queue.submit(job, description, kind=operation)
+
+    def find_remote_item(self, remote_path):
+        """Model item showing remote_path, the root item for the base path, or None."""
+        base = posixpath.normpath(self.remote_base_path or '/')
+        remote_path = posixpath.normpath(remote_path)
+        if remote_path == base:
+            return self.remote_model.invisibleRootItem()
+        relative = posixpath.relpath(remote_path, base)
+        if relative.startswith('..'):
+            return None
+        item = self.remote_model.invisibleRootItem()
+        for name in relative.split('/'):
+            match = None
+            for row in range(item.rowCount()):
+                if item.child(row).text() == name:
+                    match = item.child(row)
+                    break
+            if match is None:
+                return None
+            item = match
+        return item
+
+    def expanded_remote_paths(self, parent_item):
+        """Paths of the expanded directories below parent_item, parents first."""
+        expanded = []
+        pending = [parent_item]
+        while pending:
+            item = pending.pop(0)
+            for row in range(item.rowCount()):
+                child = item.child(row)
+                if child is not None and child.hasChildren() and self.remote_tree.isExpanded(child.index()):
+                    expanded.append(self.get_remote_file_path(child.index()))
+                    pending.append(child)
+        return expanded
+
+    def restore_expanded(self, paths):
+        for path in paths:
+            item = self.find_remote_item(path)
+            if item is not None and item.index().isValid():
+                # Expanding fires on_remote_tree_expanded, which reloads the node from the cache
+                self.remote_tree.setExpanded(item.index(), True)
+
+    def reload_remote_item(self, sftp, item, remote_path):
+        """Re-list a single node in place, keeping its expanded descendants open."""
+        expanded = self.expanded_remote_paths(item)
+        item.removeRows(0, item.rowCount())
+        self.populate_remote_tree(sftp, remote_path, item)
+        self.restore_expanded(expanded)
+
+    def refresh_remote_paths(self, paths, removed=()):
+        """
+        Invalidate the listings of the given remote directories (and everything
+        below the removed paths) and reload only the nodes showing them.
+        """
+        if not self.remote_base_path:
+            return
+        server = self.remote_server()
+        paths = sorted({posixpath.normpath(path) for path in paths if path}, key=len)
+        removed = [posixpath.normpath(path) for path in removed if path]
+        for path in paths:
+            self.listing_cache.invalidate(server, path)
+        for path in removed:
+            self.listing_cache.invalidate_tree(server, path)
+        base = posixpath.normpath(self.remote_base_path)
+        try:
+            ip, port, username = server
+            with self.connection_pool.sftp(ip, port, username, self.password_input.text().strip()) as sftp:
+                if any(base == path or base.startswith(path.rstrip('/') + '/') for path in removed):
+                    try:
+                        sftp.stat(base)
+                    except IOError:
+                        # The displayed directory itself is gone; let the full refresh move up
+                        self.refresh_remote_directory()
+                        return
+                for path in paths:
+                    item = self.find_remote_item(path)
+                    if item is None:
+                        continue
+                    if item.index().isValid() and not self.remote_tree.isExpanded(item.index()):
+                        # Collapsed nodes reload lazily on their next expand
+                        if item.hasChildren():
+                            item.removeRows(0, item.rowCount())
+                            item.appendRow(QStandardItem("Loading..."))
+                        continue
+                    self.reload_remote_item(sftp, item, path)
+        except Exception as e:
+            self.log(f"Error refreshing remote directory: {str(e)}", "red")
 
     def get_remote_file_path(self, index):
         path = []
@@ -1122,10 +1204,6 @@ class FileTransferApp(QWidget):
         return f"{self.remote_base_path}/" + "/".join(path)
 
     def start_transfer(self):
-        if self.processing:
-            QMessageBox.warning(self, "Warning", "Another operation is in progress. Please wait.")
-            return
-
         selected_indexes = self.local_tree.selectedIndexes()
         if not selected_indexes:
             self.log("No files selected for transfer.", "red")
@@ -1155,10 +1233,29 @@ class FileTransferApp(QWidget):
             'port': self.port_input.text().strip(),
             'username': self.username_input.text().strip(),
             'password': self.password_input.text().strip(),
+            'pool': self.connection_pool,
             'destination': self.dest_path.text().strip(),
             'selected_files': self.selected_files,
             'selection_mode': "directories" if any(os.path.isdir(f) for f in self.selected_files) else "files",
-            'exclusions': [item.strip() for item in self.exclusions_input.text().split(',') if item.strip()]
+            'exclusions': [item.strip() for item in self.exclusions_input.text().split(',') if item.strip()],
+            'parallel_channels': self.channels_input.value(),
+            'ssh_sessions': self.sessions_input.value(),
+            'segments': self.segments_input.value(),
+            'segment_threshold': self.threshold_input.value(),
+            'transfer_mode': self.upload_mode(),
+            'sync_mode': self.sync_checkbox.isChecked(),
+            'sync_checksum': self.checksum_checkbox.isChecked(),
+            'delta_mode': self.delta_checkbox.isChecked(),
+            'dedup': self.dedup_checkbox.isChecked(),
+            'dedup_reference': self.dedup_reference_input.text().strip() if self.dedup_checkbox.isChecked() else None,
+            'dedup_link': 'hardlink' if self.hardlink_checkbox.isChecked() else 'copy',
+            'resume': self.resume_checkbox.isChecked(),
+            'verify': self.verify_checkbox.isChecked(),
+            'compression': self.compression_advisor if self.compression_checkbox.isChecked() else None,
+            'limiter': self.bandwidth_limiter,
+            'priority': 'low' if self.background_checkbox.isChecked() else 'normal',
+            'async_loop': self.async_loop,
+            'system_info': self.system_info_cache
         }
 
         # Validate inputs
@@ -1167,76 +1264,168 @@ class FileTransferApp(QWidget):
             QMessageBox.critical(self, "Error", "Please fill in all required fields.")
             return
 
-        # Set processing state
-        self.set_processing_state(True)
-        self.log("Processing... Starting file transfer.", "magenta")
+        params.update(self.diagnostic_options())
+        job = UploadJob(params, log=self.log_buffer.write)
+        self.job_queue.submit(job, f"Upload {len(self.selected_files)} item(s) to {params['destination']}", kind='upload')
 
-        # Connect signals
-        self.transfer_worker = FileTransferWorker(params, self.log_emitter)
-        self.transfer_worker.transfer_finished.connect(self.on_transfer_finished)
-        self.transfer_worker.transfer_error.connect(self.on_transfer_error)
-        self.transfer_worker.progress_update.connect(self.update_progress)
-        self.transfer_worker.start()
+    def diagnostic_options(self):
+        return {'trace': self.trace_checkbox.isChecked(), 'profile': self.profile_combo.currentData()}
 
-    def terminate_transfer(self):
-        if self.transfer_worker and self.transfer_worker.isRunning():
-            self.transfer_worker.stop()
-            self.log("Termination signal sent. Attempting to stop the transfer...", "yellow")
-            self.terminate_btn.setEnabled(False)
-
-    def on_transfer_finished(self, status):
-        if status == "success":
-            QMessageBox.information(self, "Success", "Files transferred successfully.")
-        elif status == "terminated":
-            QMessageBox.warning(self, "Terminated", "File transfer was terminated.")
-        # Reset buttons and processing state
-        self.set_processing_state(False)
-        self.progress_bar.setValue(0)
-
-    def on_transfer_error(self, error_message):
-        QMessageBox.critical(self, "Error", error_message)
-        # Reset buttons and processing state
-        self.set_processing_state(False)
-        self.progress_bar.setValue(0)
-
-    def update_progress(self, percentage):
-        self.progress_bar.setValue(percentage)
+    def upload_mode(self):
+        if self.tar_mode_radio.isChecked():
+            return 'tar'
+        if self.async_mode_radio.isChecked():
+            return 'async'
+        return 'sftp'
 
-    def append_log(self, message, color):
-        self.log_text.setTextColor(QColor(color))
-        self.log_text.append(message)
-        self.log_text.moveCursor(QTextCursor.MoveOperation.End)
+    def terminate_transfer(self):
+        if self.job_queue.active():
+            self.job_queue.cancel_all()
+            self.log("Termination signal sent. Attempting to stop all jobs...", "yellow")
+
+    def cancel_selected_jobs(self):
+        for row in sorted({index.row() for index in self.job_table.selectedIndexes()}):
+            job_id = self.job_table.item(row, 0).data(Qt.ItemDataRole.UserRole)
+            if self.job_queue.cancel(job_id):
+                self.log(f"Cancelling job {job_id}...", "yellow")
+
+    def clear_finished_jobs(self):
+        self.job_queue.clear_finished()
+        self.refresh_job_view()
+
+    def on_job_changed(self, entry):
+        """Runs in the GUI thread for every state change of a queued job."""
+        if entry.state == RUNNING:
+            self.log(f"Started: {entry.description}", "magenta")
+        elif entry.finished and entry.started_at is not None:
+            job = entry.job
+            # Anything the job touched may have changed on the server
+            if isinstance(job, UploadJob):
+                self.refresh_remote_paths([job.destination], [job.destination])
+            else:
+                self.refresh_remote_paths(*job.changed_paths())
+            if entry.state == FAILED and entry.error:
+                QMessageBox.critical(self, "Error", f"{entry.description}: {entry.error}")
+        self.refresh_job_view()
+
+    def refresh_job_view(self):
+        """Redraw the queue table and the combined progress of the running jobs."""
+        entries = self.job_queue.jobs()
+        self.job_table.setRowCount(len(entries))
+        running = []
+        for row, entry in enumerate(entries):
+            stats = entry.snapshot() if entry.state == RUNNING else None
+            if stats is not None:
+                running.append(stats)
+            if entry.state == DONE:
+                progress = "100%"
+            elif stats is not None:
+                progress = f"{stats['percent']}%"
+            else:
+                progress = ""
+            cells = [
+                entry.description,
+                entry.state.capitalize(),
+                progress,
+                format_rate(stats['rate']) if stats is not None else "",
+                format_eta(stats['eta']) if stats is not None else "",
+            ]
+            for column, text in enumerate(cells):
+                item = self.job_table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.job_table.setItem(row, column, item)
+                item.setText(text)
+            self.job_table.item(row, 0).setData(Qt.ItemDataRole.UserRole, entry.id)
+            self.job_table.item(row, 1).setForeground(QColor(JOB_STATE_COLORS.get(entry.state, "#d4d4d4")))
+
+        active = self.job_queue.active()
+        self.terminate_btn.setEnabled(active > 0)
+        if not running:
+            self.progress_bar.setValue(0)
+            self.stats_label.setText(f"{active} job(s) queued" if active else "")
+            return
+        total = {
+            'transferred': sum(stats['transferred'] for stats in running),
+            'total': sum(stats['total'] for stats in running),
+            'rate': sum(stats['rate'] for stats in running),
+            'files_per_sec': sum(stats['files_per_sec'] for stats in running),
+        }
+        remaining = max(0, total['total'] - total['transferred'])
+        total['eta'] = remaining / total['rate'] if total['rate'] > 0 else None
+        self.progress_bar.setValue(min(100, int(total['transferred'] * 100 / total['total'])) if total['total'] > 0 else 0)
+        self.stats_label.setText(f"{len(running)} running, {active - len(running)} queued: {format_stats(total)}")
+
+    def log_format(self, color):
+        text_format = self.log_formats.get(color)
+        if text_format is None:
+            text_format = QTextCharFormat()
+            text_format.setForeground(QColor(LOG_COLORS.get(color.lower(), "#FFFFFF")))
+            self.log_formats[color] = text_format
+        return text_format
+
+    def flush_log(self):
+        """Append everything logged since the last tick in a single edit."""
+        lines = self.log_buffer.drain()
+        if not lines:
+            return
+        # Only the newest lines would survive the block limit anyway
+        lines = lines[-MAX_LOG_LINES:]
+        scrollbar = self.log_text.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        cursor = QTextCursor(self.log_text.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        for message, color in lines:
+            if not self.log_text.document().isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(message, self.log_format(color))
+        cursor.endEditBlock()
+        if at_bottom:
+            # Follow new output unless the user has scrolled up to read
+            scrollbar.setValue(scrollbar.maximum())
+
+    def change_bandwidth_limit(self, value):
+        self.bandwidth_limiter.set_rate(value * 1024 * 1024)
+        self.log(f"Bandwidth limit: {f'{value} MB/s' if value else 'unlimited'}", "cyan")
+
+    def change_verbosity(self, index):
+        self.log_buffer.level = self.verbosity_combo.itemData(index)
+
+    def toggle_log_file(self, checked):
+        if not checked:
+            self.log_buffer.close_file()
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Log To", "vps-transfer.log", "Log files (*.log);;All files (*)")
+        if not path:
+            self.log_file_checkbox.setChecked(False)
+            return
+        try:
+            self.log_buffer.open_file(path)
+        except OSError as e:
+            self.log(f"Cannot open log file {path}: {str(e)}", "red")
+            self.log_file_checkbox.setChecked(False)
+            return
+        self.log(f"Writing the full log to {path}", "blue")
 
     def log(self, message, color="white"):
         """
         Logs a message with the specified color.
         Colors: white, green, red, yellow, blue, cyan, magenta, grey
         """
-        self.log_emitter.log_signal.emit(message, color)
+        self.log_buffer.write(message, color)
 
     def open_url(self, url):
         webbrowser.open(url)
 
-    def set_processing_state(self, state):
-        """
-        Sets the processing state of the application.
-        When processing, disable certain UI elements to prevent user actions.
-        """
-        self.processing = state
-        if state:
-            # Disable Remote Explorer interactions
-            self.remote_tree.setEnabled(False)
-            # Optionally, disable other UI elements if necessary
-            self.log_text.setEnabled(False)
-            self.transfer_btn.setEnabled(False)
-            self.remote_tree.setCursor(Qt.CursorShape.WaitCursor)
-        else:
-            # Enable Remote Explorer interactions
-            self.remote_tree.setEnabled(True)
-            # Re-enable other UI elements
-            self.log_text.setEnabled(True)
-            self.transfer_btn.setEnabled(True)
-            self.remote_tree.setCursor(Qt.CursorShape.ArrowCursor)
+    def closeEvent(self, event):
+        # Stop running jobs so their journals are saved for Resume, then drop the pooled SSH connections
+        self.job_queue.cancel_all()
+        self.job_queue.wait(timeout=5)
+        self.async_loop.close()
+        self.connection_pool.close_all()
+        self.log_buffer.close_file()
+        super().closeEvent(event)
 
     def refresh_remote_directory(self):
         """
@@ -1253,33 +1442,24 @@ class FileTransferApp(QWidget):
                 self.log("Error: Missing VPS credentials for refreshing.", "red")
                 return
 
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(ip, port=int(port), username=username, password=password, timeout=10)
-            sftp = ssh.open_sftp()
-
-            # Check if the current base path exists
-            try:
-                sftp.chdir(self.remote_base_path)
-            except IOError:
-                # Current directory doesn't exist, navigate to parent
-                parent_path = os.path.dirname(self.remote_base_path)
-                if parent_path == self.remote_base_path:
-                    # Reached root, cannot go up
-                    self.log("Error: Unable to navigate to parent directory.", "red")
-                    sftp.close()
-                    ssh.close()
-                    return
-                self.remote_base_path = parent_path
-                self.dest_path.setText(self.remote_base_path)
-                self.log(f"Current directory deleted. Navigated to parent directory: {self.remote_base_path}", "yellow")
-
-            # Reload the remote directory
-            self.remote_model.removeRows(0, self.remote_model.rowCount())
-            self.populate_remote_tree(sftp, self.remote_base_path, self.remote_model.invisibleRootItem())
-
-            sftp.close()
-            ssh.close()
+            with self.connection_pool.sftp(ip, port, username, password) as sftp:
+                # Check if the current base path exists
+                try:
+                    sftp.chdir(self.remote_base_path)
+                except IOError:
+                    # Current directory doesn't exist, navigate to parent
+                    parent_path = os.path.dirname(self.remote_base_path)
+                    if parent_path == self.remote_base_path:
+                        # Reached root, cannot go up
+                        self.log("Error: Unable to navigate to parent directory.", "red")
+                        return
+                    self.remote_base_path = parent_path
+                    self.dest_path.setText(self.remote_base_path)
+                    self.log(f"Current directory deleted. Navigated to parent directory: {self.remote_base_path}", "yellow")
+
+                # Reload the remote directory, keeping expanded folders open
+                self.listing_cache.invalidate_tree(self.remote_server(), self.remote_base_path)
+                self.reload_remote_item(sftp, self.remote_model.invisibleRootItem(), self.remote_base_path)
 
             self.log(f"Refreshed remote directory: {self.remote_base_path}", "green")
         except Exception as e:
@@ -0,0 +1,118 @@
+"""
+Upload time of the asyncio core versus the threaded SFTP paths.
+
+Needs an SSH server; the password comes from $VPS_TRANSFER_PASSWORD or a
+prompt. Each workload is generated locally, uploaded once per mode into a
+scratch directory under --remote-dir and removed afterwards:
+
+    python benchmarks/async_benchmark.py --host 203.0.113.5 --user deploy
+"""
+import argparse
+import getpass
+import os
+import posixpath
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vps_transfer.engine import UploadJob  # noqa: E402
+from vps_transfer.pool import ConnectionPool  # noqa: E402
+from vps_transfer.remote import RemoteCommands  # noqa: E402
+
+
+def make_small_files(root, count, size, rng):
+    for index in range(count):
+        directory = os.path.join(root, f"d{index // 100:03d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"f{index:05d}.txt"), "wb") as f:
+            f.write(rng.randbytes(size))
+
+
+def make_large_files(root, count, size_mb, rng):
+    os.makedirs(root, exist_ok=True)
+    for index in range(count):
+        with open(os.path.join(root, f"large{index}.bin"), "wb") as f:
+            for _ in range(size_mb):
+                f.write(rng.randbytes(1024 * 1024))
+
+
+def upload(connection, source, destination, mode, channels):
+    params = dict(connection)
+    params.update({
+        'destination': destination,
+        'selected_files': [source],
+        'selection_mode': "directories",
+        'exclusions': [],
+        'transfer_mode': mode,
+        'parallel_channels': channels,
+    })
+    errors = []
+    job = UploadJob(params, error=errors.append)
+    started = time.perf_counter()
+    status = job.run()
+    elapsed = time.perf_counter() - started
+    stats = job.tracker.snapshot()
+    if status != "success" or errors:
+        raise RuntimeError(f"{mode} upload failed: {errors or status}")
+    return elapsed, stats['files_done'], stats['transferred']
+
+
+def run(args):
+    password = os.environ.get('VPS_TRANSFER_PASSWORD') or getpass.getpass(f"Password for {args.user}@{args.host}: ")
+    pool = ConnectionPool()
+    connection = {'ip': args.host, 'port': str(args.port), 'username': args.user, 'password': password, 'pool': pool}
+    commands = RemoteCommands(pool.connect(args.host, str(args.port), args.user, password))
+    rng = random.Random(args.seed)
+    local = tempfile.mkdtemp(prefix="vps-transfer-bench-")
+    workloads = [
+        (f"{args.small_files} x {args.small_size // 1024} KB", os.path.join(local, "small")),
+        (f"{args.large_files} x {args.large_mb} MB", os.path.join(local, "large")),
+    ]
+    modes = [
+        ("threads, 1 channel", 'sftp', 1),
+        (f"threads, {args.channels} channels", 'sftp', args.channels),
+        (f"async, {args.channels} channels", 'async', args.channels),
+    ]
+    try:
+        make_small_files(workloads[0][1], args.small_files, args.small_size, rng)
+        make_large_files(workloads[1][1], args.large_files, args.large_mb, rng)
+        print(f"{'workload':<18}{'mode':<22}{'time':>8}{'MB/s':>9}{'files/s':>10}")
+        for workload, source in workloads:
+            for name, mode, channels in modes:
+                destination = posixpath.join(args.remote_dir, f"{os.path.basename(source)}-{mode}-{channels}")
+                try:
+                    elapsed, files, transferred = upload(connection, source, destination, mode, channels)
+                finally:
+                    commands.remove_tree(destination)
+                print(
+                    f"{workload:<18}{name:<22}{elapsed:>7.2f}s{transferred / 1048576 / elapsed:>9.2f}"
+                    f"{files / elapsed:>10.1f}"
+                )
+    finally:
+        shutil.rmtree(local, ignore_errors=True)
+        pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", required=True)
+    parser.add_argument("--port", type=int, default=22)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--remote-dir", default="/tmp/vps-transfer-benchmark",
+                        help="scratch directory on the server; emptied after each run")
+    parser.add_argument("--small-files", type=int, default=2000)
+    parser.add_argument("--small-size", type=int, default=4096, help="bytes per small file")
+    parser.add_argument("--large-files", type=int, default=4)
+    parser.add_argument("--large-mb", type=int, default=64)
+    parser.add_argument("--channels", type=int, default=4, help="channels for the parallel and async modes")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Bytes on the wire for a block-delta upload versus a full sftp.put.
+
+The remote side is simulated locally with the same signature format the
+server-side helper produces, so no VPS is needed:
+
+    python benchmarks/delta_benchmark.py --size-mb 256
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vps_transfer.delta import DeltaEncoder, block_signature, choose_block_size, parse_signature  # noqa: E402
+
+
+def mutate_append(data, rng):
+    return data + rng.randbytes(4 * 1024 * 1024)
+
+
+def mutate_inplace(data, rng):
+    data = bytearray(data)
+    for _ in range(32):
+        offset = rng.randrange(len(data) - 65536)
+        data[offset:offset + 65536] = rng.randbytes(65536)
+    return bytes(data)
+
+
+def mutate_insert(data, rng):
+    offset = rng.randrange(len(data))
+    return data[:offset] + rng.randbytes(1024 * 1024) + data[offset:]
+
+
+SCENARIOS = [
+    ("append 4 MB (log file)", mutate_append),
+    ("32 x 64 KB overwritten (database pages)", mutate_inplace),
+    ("1 MB inserted mid-file", mutate_insert),
+]
+
+
+def run(size_mb, seed):
+    rng = random.Random(seed)
+    old = rng.randbytes(size_mb * 1024 * 1024)
+    print(f"{'scenario':<42}{'full put':>12}{'delta':>12}{'ratio':>9}{'time':>8}")
+    for name, mutate in SCENARIOS:
+        new = mutate(old, rng)
+        block_size = choose_block_size(len(old))
+        signature = block_signature(io.BytesIO(old), block_size)
+        sent = []
+        started = time.perf_counter()
+        encoder = DeltaEncoder(parse_signature(signature), block_size, sent.append)
+        encoder.encode(io.BytesIO(new))
+        elapsed = time.perf_counter() - started
+        wire = len(signature) + encoder.sent_bytes
+        print(
+            f"{name:<42}{len(new) / 1048576:>10.1f}MB{wire / 1048576:>10.2f}MB"
+            f"{wire * 100 / len(new):>8.1f}%{elapsed:>7.1f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64, help="size of the simulated remote file")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.size_mb, args.seed)
+
+
+if __name__ == "__main__":
+    main()
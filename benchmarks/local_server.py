@@ -0,0 +1,352 @@
+"""
+In-process SSH/SFTP server stand-in for benchmarks.
+
+LocalSFTPServer runs a paramiko server on loopback that serves the local
+filesystem at the same absolute paths, accepts any password and runs exec
+requests (tar, mkdir -p, find, sha256sum...) through the local shell, so
+every transfer path of the app can be exercised without a VPS. It counts
+SFTP requests and exec commands. With `latency` or `bandwidth` set, clients
+connect through LinkShaper, a relay that delays and paces the traffic to
+look like a real link. Only ever bind it to loopback.
+
+    with LocalSFTPServer(latency=0.02, bandwidth=10 * 1024 * 1024) as server:
+        pool.connect('127.0.0.1', server.port, 'bench', 'bench')
+"""
+import logging
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+
+import paramiko
+from paramiko import (
+    AUTH_SUCCESSFUL, OPEN_SUCCEEDED, SFTP_OK, SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface
+)
+
+RELAY_CHUNK = 65536
+LOG_CHANNEL = 'benchmarks.local_server'
+
+# Clients hanging up at the end of a job is normal here, not worth a traceback
+logging.getLogger(LOG_CHANNEL).setLevel(logging.CRITICAL)
+
+
+class ServerStats:
+    """Counters shared by every connection to one LocalSFTPServer."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.sftp_requests = 0
+        self.exec_commands = 0
+
+    def add(self, name, count=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'sftp_requests': self.sftp_requests,
+                'exec_commands': self.exec_commands,
+            }
+
+
+def _errno(e):
+    return SFTPServer.convert_errno(e.errno)
+
+
+class LocalHandle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return _errno(e)
+
+    def chattr(self, attr):
+        try:
+            SFTPServer.set_file_attr(self.filename, attr)
+            return SFTP_OK
+        except OSError as e:
+            return _errno(e)
+
+
+class LocalSFTP(SFTPServerInterface):
+    """SFTP requests answered straight from the local filesystem."""
+
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.stats = server.stats
+
+    def _realpath(self, path):
+        return path
+
+    def list_folder(self, path):
+        try:
+            entries = []
+            for name in os.listdir(path):
+                attributes = SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+                attributes.filename = name
+                entries.append(attributes)
+            return entries
+        except OSError as e:
+            return _errno(e)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return _errno(e)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return _errno(e)
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0), getattr(attr, 'st_mode', None) or 0o666)
+        except OSError as e:
+            return _errno(e)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = LocalHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def _call(self, function, *args):
+        try:
+            function(*args)
+        except OSError as e:
+            return _errno(e)
+        return SFTP_OK
+
+    def remove(self, path):
+        return self._call(os.remove, path)
+
+    def rename(self, oldpath, newpath):
+        return self._call(os.rename, oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._call(os.replace, oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, path)
+
+    def chattr(self, path, attr):
+        return self._call(SFTPServer.set_file_attr, path, attr)
+
+
+class CountingSFTPServer(SFTPServer):
+    def _process(self, t, request_number, msg):
+        self.server.stats.add('sftp_requests')
+        super()._process(t, request_number, msg)
+
+
+class LocalServerInterface(paramiko.ServerInterface):
+    def __init__(self, stats, allow_exec=True):
+        self.stats = stats
+        self.allow_exec = allow_exec
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        if not self.allow_exec:
+            return False
+        self.stats.add('exec_commands')
+        threading.Thread(target=self._execute, args=(channel, command), daemon=True).start()
+        return True
+
+    @staticmethod
+    def _execute(channel, command):
+        process = subprocess.Popen(
+            command.decode() if isinstance(command, bytes) else command, shell=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+        def feed():
+            try:
+                for data in iter(lambda: channel.recv(RELAY_CHUNK), b''):
+                    process.stdin.write(data)
+            except (OSError, EOFError):
+                pass
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+        def errors():
+            try:
+                for data in iter(lambda: process.stderr.read1(RELAY_CHUNK), b''):
+                    channel.sendall_stderr(data)
+            except (OSError, EOFError):
+                pass
+
+        threads = [threading.Thread(target=feed, daemon=True), threading.Thread(target=errors, daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            for data in iter(lambda: process.stdout.read1(RELAY_CHUNK), b''):
+                channel.sendall(data)
+        except (OSError, EOFError):
+            process.kill()
+        process.wait()
+        threads[1].join()
+        # A command killed by a signal reports -signal; the wire wants 128 + signal like a shell
+        code = process.returncode
+        if code < 0:
+            code = 128 - code
+        try:
+            channel.send_exit_status(code)
+            channel.close()
+        except (OSError, EOFError):
+            # The client already hung up
+            pass
+
+
+class LinkShaper:
+    """
+    Loopback TCP relay in front of `target_port`: every chunk is held for
+    `latency` seconds in each direction, and each direction is paced to
+    `bandwidth` bytes per second (0 for no cap).
+    """
+
+    def __init__(self, target_port, latency=0.0, bandwidth=0):
+        self.target_port = target_port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.port = None
+        self._listener = None
+
+    def start(self):
+        self._listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _address = self._listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for source, destination in ((client, upstream), (upstream, client)):
+                threading.Thread(target=self._relay, args=(source, destination), daemon=True).start()
+
+    def _relay(self, source, destination):
+        chunks = queue.Queue()
+
+        def read():
+            while True:
+                try:
+                    data = source.recv(RELAY_CHUNK)
+                except OSError:
+                    data = b''
+                chunks.put((time.monotonic() + self.latency, data))
+                if not data:
+                    return
+
+        threading.Thread(target=read, daemon=True).start()
+        idle_at = time.monotonic()  # when the paced link has sent everything so far
+        try:
+            while True:
+                due, data = chunks.get()
+                if not data:
+                    break
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if self.bandwidth:
+                    idle_at = max(idle_at, time.monotonic()) + len(data) / self.bandwidth
+                    delay = idle_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                destination.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+
+class LocalSFTPServer:
+    """
+    Loopback SSH server; `port` is what clients connect to (the shaper's
+    when latency or bandwidth is set). With `allow_exec` off the server
+    refuses exec requests, like an SFTP-only account.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, allow_exec=True):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.allow_exec = allow_exec
+        self.stats = ServerStats()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.port = None
+        self._listener = None
+        self._shaper = None
+        self._transports = []
+
+    def start(self):
+        self._listener = socket.create_server(('127.0.0.1', 0))
+        self._listener.listen(64)
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+        if self.latency or self.bandwidth:
+            self._shaper = LinkShaper(self.port, self.latency, self.bandwidth).start()
+            self.port = self._shaper.port
+        return self
+
+    def stop(self):
+        if self._shaper is not None:
+            self._shaper.stop()
+        if self._listener is not None:
+            self._listener.close()
+        for transport in self._transports:
+            transport.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _address = self._listener.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.stats.add('connections')
+            transport = paramiko.Transport(client)
+            transport.set_log_channel(LOG_CHANNEL)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', CountingSFTPServer, LocalSFTP)
+            transport.start_server(server=LocalServerInterface(self.stats, self.allow_exec))
+            self._transports.append(transport)
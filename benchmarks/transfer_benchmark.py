@@ -0,0 +1,307 @@
+"""
+Transfer benchmarks against an in-process SFTP server on loopback.
+
+Runs the engine's upload and remote-operation paths (UploadJob and
+RemoteOperation, which back both the GUI and the CLI) headlessly against
+benchmarks/local_server.py, optionally through an emulated link, on standard
+workloads:
+
+    tiny     100,000 files of 64 bytes, uploaded and downloaded
+    medium   1,000 files of 1 MB, uploaded and downloaded
+    large    one 5 GB file, uploaded and downloaded
+    listing  a deep tree, sized by SFTP walk and by the server-side find
+
+MB/s, files/s, round trips (SFTP requests plus exec commands) and CPU time
+go to a JSON file so that runs can be compared over time:
+
+    python benchmarks/transfer_benchmark.py --quick
+    python benchmarks/transfer_benchmark.py --workloads tiny,medium --latency-ms 20 --bandwidth 50M
+    python benchmarks/transfer_benchmark.py --quick --baseline transfer-benchmark-20260101-120000.json
+
+CPU time is the whole process's, the stand-in server's included.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paramiko  # noqa: E402
+
+from local_server import LocalSFTPServer  # noqa: E402
+from vps_transfer.bandwidth import parse_rate  # noqa: E402
+from vps_transfer.engine import RemoteOperation, UploadJob  # noqa: E402
+from vps_transfer.pool import ConnectionPool  # noqa: E402
+
+WORKLOADS = ('tiny', 'medium', 'large', 'listing')
+
+UPLOAD_MODES = {
+    'sftp': {'transfer_mode': 'sftp'},
+    'parallel': {'transfer_mode': 'sftp', 'parallel_channels': 4, 'segments': 4},
+    'async': {'transfer_mode': 'async'},
+    'tar': {'transfer_mode': 'tar'},
+}
+DOWNLOAD_MODES = {
+    'sftp': {'transfer_mode': 'sftp'},
+    'tar': {'transfer_mode': 'tar'},
+}
+
+# (tiny files, tiny bytes, medium files, medium KB, large MB, tree depth, tree fanout, files per directory)
+FULL_SIZES = (100000, 64, 1000, 1024, 5120, 6, 4, 4)
+QUICK_SIZES = (2000, 64, 50, 1024, 128, 4, 3, 4)
+
+
+def make_files(root, count, size, rng):
+    block = rng.randbytes(size)
+    for index in range(count):
+        directory = os.path.join(root, f"d{index // 1000:03d}")
+        if index % 1000 == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"f{index:06d}.bin"), "wb") as f:
+            # Unique head so no file is a copy of another
+            f.write(index.to_bytes(8, 'big') + block[8:])
+    return count
+
+
+def make_large_file(root, size_mb, rng):
+    os.makedirs(root, exist_ok=True)
+    block = rng.randbytes(1024 * 1024)
+    with open(os.path.join(root, "large.bin"), "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    return 1
+
+
+def make_tree(root, depth, fanout, files, rng):
+    count = 0
+    pending = [(root, 0)]
+    while pending:
+        directory, level = pending.pop()
+        os.makedirs(directory, exist_ok=True)
+        for index in range(files):
+            with open(os.path.join(directory, f"file{index}.txt"), "wb") as f:
+                f.write(rng.randbytes(128))
+            count += 1
+        if level < depth:
+            pending.extend((os.path.join(directory, f"dir{index}"), level + 1) for index in range(fanout))
+    return count
+
+
+class Bench:
+    def __init__(self, args, work_dir):
+        self.args = args
+        self.local = os.path.join(work_dir, "local")
+        self.remote = os.path.join(work_dir, "remote")
+        os.makedirs(self.local)
+        os.makedirs(self.remote)
+        self.results = []
+
+    def connection(self, server):
+        return {
+            'ip': '127.0.0.1', 'port': str(server.port), 'username': 'bench', 'password': 'bench',
+            'pool': ConnectionPool(),
+        }
+
+    def measure(self, server, workload, operation, mode, job, files=None, size=None):
+        before = server.stats.snapshot()
+        cpu = time.process_time()
+        started = time.perf_counter()
+        try:
+            status = job.run()
+        finally:
+            elapsed = time.perf_counter() - started
+            job.params['pool'].close_all()
+        cpu = time.process_time() - cpu
+        after = server.stats.snapshot()
+        progress = job.tracker.snapshot()
+        transferred = progress['transferred'] if size is None else size
+        files = progress['files_done'] if files is None else files
+        requests = after['sftp_requests'] - before['sftp_requests']
+        commands = after['exec_commands'] - before['exec_commands']
+        result = {
+            'workload': workload,
+            'operation': operation,
+            'mode': mode,
+            'status': status,
+            'seconds': round(elapsed, 3),
+            'bytes': transferred,
+            'files': files,
+            'mb_per_s': round(transferred / 1048576 / elapsed, 2),
+            'files_per_s': round(files / elapsed, 1),
+            'sftp_requests': requests,
+            'exec_commands': commands,
+            'round_trips': requests + commands,
+            'cpu_seconds': round(cpu, 3),
+        }
+        self.results.append(result)
+        print(
+            f"{workload:<9}{operation:<10}{mode:<10}{status:<9}{elapsed:>8.2f}s{result['mb_per_s']:>9.2f}"
+            f"{result['files_per_s']:>10.1f}{result['round_trips']:>10}{cpu:>8.2f}",
+            flush=True
+        )
+        return result
+
+    def transfers(self, server, workload, source):
+        """Upload `source` in every upload mode, then download one copy in every download mode."""
+        kept = None
+        for mode in self.args.upload_modes:
+            destination = os.path.join(self.remote, f"{workload}-{mode}")
+            params = self.connection(server)
+            params.update(UPLOAD_MODES[mode])
+            params.update({
+                'destination': destination,
+                'selected_files': [source],
+                'selection_mode': "directories",
+                'exclusions': [],
+            })
+            self.measure(server, workload, "upload", mode, UploadJob(params))
+            if kept is None:
+                kept = destination
+            else:
+                shutil.rmtree(destination, ignore_errors=True)
+        if kept is None:
+            return
+        for mode in self.args.download_modes:
+            target = os.path.join(self.local, f"{workload}-download-{mode}")
+            os.makedirs(target)
+            params = self.connection(server)
+            params.update(DOWNLOAD_MODES[mode])
+            params.update({'remote_path': kept, 'local_destination': target})
+            self.measure(server, workload, "download", mode, RemoteOperation('download', params))
+            shutil.rmtree(target, ignore_errors=True)
+        shutil.rmtree(kept, ignore_errors=True)
+
+    def listing(self, server, sftp_only_server, tree, files):
+        for mode, target in (("walk", sftp_only_server), ("find", server)):
+            params = self.connection(target)
+            params.update({'remote_path': tree})
+            operation = RemoteOperation('size', params)
+            self.measure(target, "listing", "size", mode, operation, files=files, size=0)
+            if operation.size is None:
+                print(f"  size failed: {operation.failed}")
+
+
+def summarize(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {
+            (row['workload'], row['operation'], row['mode']): row for row in json.load(f)['results']
+        }
+    print(f"\nCompared with {baseline_path} (time, + is slower):")
+    for row in results:
+        old = baseline.get((row['workload'], row['operation'], row['mode']))
+        if old is None or not old['seconds']:
+            continue
+        change = (row['seconds'] - old['seconds']) / old['seconds'] * 100
+        print(f"  {row['workload']:<9}{row['operation']:<10}{row['mode']:<10}{change:>+7.1f}%  "
+              f"round trips {old['round_trips']} -> {row['round_trips']}")
+
+
+def run(args):
+    sizes = QUICK_SIZES if args.quick else FULL_SIZES
+    tiny_files, tiny_size, medium_files, medium_kb, large_mb, depth, fanout, per_dir = sizes
+    tiny_files = args.tiny_files or tiny_files
+    medium_files = args.medium_files or medium_files
+    large_mb = args.large_mb or large_mb
+    depth = args.tree_depth or depth
+    rng = random.Random(args.seed)
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="vps-transfer-bench-", dir=args.work_dir)
+    server = LocalSFTPServer(latency=args.latency_ms / 1000, bandwidth=args.bandwidth).start()
+    sftp_only_server = LocalSFTPServer(latency=args.latency_ms / 1000, bandwidth=args.bandwidth, allow_exec=False)
+    bench = Bench(args, work_dir)
+    started = datetime.datetime.now()
+    try:
+        print(f"{'workload':<9}{'op':<10}{'mode':<10}{'status':<9}{'time':>9}{'MB/s':>9}{'files/s':>10}"
+              f"{'trips':>10}{'cpu':>8}")
+        for workload in args.workloads:
+            source = os.path.join(bench.local, workload)
+            if workload == 'tiny':
+                make_files(source, tiny_files, tiny_size, rng)
+                bench.transfers(server, workload, source)
+            elif workload == 'medium':
+                make_files(source, medium_files, medium_kb * 1024, rng)
+                bench.transfers(server, workload, source)
+            elif workload == 'large':
+                make_large_file(source, large_mb, rng)
+                bench.transfers(server, workload, source)
+            elif workload == 'listing':
+                # Created in place on the "server" side; only the listing is measured
+                tree = os.path.join(bench.remote, "tree")
+                files = make_tree(tree, depth, fanout, per_dir, rng)
+                sftp_only_server.start()
+                bench.listing(server, sftp_only_server, tree, files)
+            shutil.rmtree(source, ignore_errors=True)
+    finally:
+        server.stop()
+        sftp_only_server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'started': started.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'paramiko': paramiko.__version__,
+        'platform': platform.platform(),
+        'latency_ms': args.latency_ms,
+        'bandwidth': args.bandwidth,
+        'sizes': {
+            'tiny_files': tiny_files, 'tiny_bytes': tiny_size, 'medium_files': medium_files,
+            'medium_kb': medium_kb, 'large_mb': large_mb, 'tree_depth': depth, 'tree_fanout': fanout,
+            'tree_files_per_dir': per_dir,
+        },
+        'results': bench.results,
+    }
+    output = args.output or f"transfer-benchmark-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.baseline:
+        summarize(bench.results, args.baseline)
+
+
+def choices(allowed):
+    def parse(text):
+        values = [value.strip() for value in text.split(',') if value.strip()]
+        unknown = [value for value in values if value not in allowed]
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown: {', '.join(unknown)} (choose from {', '.join(allowed)})")
+        return values
+    return parse
+
+
+def rate(text):
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workloads", type=choices(WORKLOADS), default=list(WORKLOADS),
+                        help=f"comma-separated subset of {','.join(WORKLOADS)}")
+    parser.add_argument("--upload-modes", type=choices(tuple(UPLOAD_MODES)), default=list(UPLOAD_MODES))
+    parser.add_argument("--download-modes", type=choices(tuple(DOWNLOAD_MODES)), default=list(DOWNLOAD_MODES))
+    parser.add_argument("--quick", action="store_true", help="small workloads for a run of a minute or two")
+    parser.add_argument("--tiny-files", type=int)
+    parser.add_argument("--medium-files", type=int)
+    parser.add_argument("--large-mb", type=int)
+    parser.add_argument("--tree-depth", type=int)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="one-way delay added by the emulated link")
+    parser.add_argument("--bandwidth", type=rate, default=0, help="emulated link speed per direction, e.g. 50M")
+    parser.add_argument("--work-dir", help="where workloads are generated (default: the system temp directory)")
+    parser.add_argument("--output", help="JSON results file (default: transfer-benchmark-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""
+Transfer internals for the VPS File Transfer Tool.
+
+Nothing in this package imports PyQt6, so the pieces here can be shared by
+the GUI in app.py and by scripts that only need the SSH/SFTP plumbing.
+"""
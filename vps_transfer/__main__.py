@@ -0,0 +1,5 @@
+import sys
+
+from vps_transfer.cli import main
+
+sys.exit(main())
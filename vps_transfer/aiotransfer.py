@@ -0,0 +1,490 @@
+"""
+Asyncio transfer core.
+
+paramiko's SFTPClient waits for the reply to every open, close and stat before
+sending the next request, so each channel of the threaded uploaders moves one
+small file per few round trips and thousands of small files are bounded by
+latency, not bandwidth. AsyncSFTPChannel speaks the SFTP protocol itself over
+a paramiko channel: requests are tagged with ids, replies are matched to
+futures by a reader thread, and any number of requests can be in flight at
+once. AsyncUploader keeps up to MAX_IN_FLIGHT_FILES uploads going over a
+couple of such channels, each with a window of pipelined writes.
+
+Blocking pieces (opening channels, local reads, the upload plan with its
+batched `mkdir -p` commands, bandwidth pacing and the existing segmented,
+delta, compressed and resumed paths) run in a bounded executor. AsyncLoop
+keeps one event loop and executor in a background thread shared by every job,
+so neither the GUI's job queue threads nor the Qt event loop run asyncio
+themselves; results come back to Qt through the queue's signal. Nothing here
+imports PyQt6.
+"""
+import asyncio
+import errno
+import itertools
+import os
+import posixpath
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from paramiko.message import Message
+from paramiko.sftp import (
+    CMD_ATTRS, CMD_CLOSE, CMD_FSTAT, CMD_HANDLE, CMD_MKDIR, CMD_OPEN, CMD_SETSTAT, CMD_STAT, CMD_STATUS,
+    CMD_WRITE, SFTP_FLAG_CREATE, SFTP_FLAG_TRUNC, SFTP_FLAG_WRITE, SFTP_NO_SUCH_FILE, SFTP_OK,
+    SFTP_PERMISSION_DENIED, BaseSFTP
+)
+
+from vps_transfer.parallel import TransferCancelled
+from vps_transfer.remotedirs import parents
+from vps_transfer.tracing import Tracer, channel_id
+
+ASYNC_CHANNELS = 2
+MAX_IN_FLIGHT_FILES = 64
+EXECUTOR_THREADS = 8
+WRITE_SIZE = 32 * 1024  # largest write every server accepts, as in paramiko
+WRITE_WINDOW = 64  # pipelined writes outstanding per file (2 MB)
+READ_BLOCK = 1024 * 1024  # local bytes read per executor call
+PLAN_BATCH = 256  # tasks pulled from the blocking plan per executor call
+
+ATTR_SIZE = 0x1
+ATTR_UIDGID = 0x2
+ATTR_PERMISSIONS = 0x4
+ATTR_ACMODTIME = 0x8
+
+
+def _status_error(code, msg, path):
+    text = msg.get_text()
+    if code == SFTP_NO_SUCH_FILE:
+        return IOError(errno.ENOENT, text, path)
+    if code == SFTP_PERMISSION_DENIED:
+        return IOError(errno.EACCES, text, path)
+    return IOError(text)
+
+
+def _parse_attributes(msg):
+    """(size, mode) from an ATTRS reply; either may be None."""
+    flags = msg.get_int()
+    size = mode = None
+    if flags & ATTR_SIZE:
+        size = msg.get_int64()
+    if flags & ATTR_UIDGID:
+        msg.get_int()
+        msg.get_int()
+    if flags & ATTR_PERMISSIONS:
+        mode = msg.get_int()
+    return size, mode
+
+
+class AsyncSFTPChannel(BaseSFTP):
+    """
+    One SFTP session whose requests are awaitable and may overlap freely.
+    Packets are sent from a single sender thread (a full SSH window must not
+    stall the event loop) and read by a reader thread.
+    """
+
+    def __init__(self, channel, loop):
+        super().__init__()
+        self.sock = channel
+        self.loop = loop
+        self.closed = False
+        self._closing = False
+        self._ids = itertools.count(1)
+        self._requests = {}  # request id -> (future, path)
+        self._sender = ThreadPoolExecutor(max_workers=1)
+
+    @classmethod
+    async def open(cls, conn, loop):
+        def start():
+            channel = conn.transport.open_session()
+            channel.invoke_subsystem('sftp')
+            sftp = cls(channel, loop)
+            sftp._send_version()
+            return sftp
+        sftp = await loop.run_in_executor(None, start)
+        threading.Thread(target=sftp._read_replies, daemon=True).start()
+        return sftp
+
+    def close(self):
+        """Close the channel; call from the event loop. Outstanding requests are cancelled."""
+        self._closing = True
+        self.closed = True
+        pending, self._requests = self._requests, {}
+        for future, _path in pending.values():
+            future.cancel()
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+        self._sender.shutdown(wait=False)
+
+    def _read_replies(self):
+        try:
+            while True:
+                t, data = self._read_packet()
+                msg = Message(data)
+                entry = self._requests.pop(msg.get_int(), None)
+                if entry is not None:
+                    self._call(self._resolve, entry[0], (t, msg))
+        except Exception as e:
+            self.closed = True
+            if self._closing:
+                return
+            error = e if isinstance(e, IOError) else IOError(f"SFTP channel closed: {e!r}")
+            pending, self._requests = self._requests, {}
+            for future, _path in pending.values():
+                self._call(self._reject, future, error)
+
+    def _call(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop has already shut down; nobody is waiting any more
+            pass
+
+    @staticmethod
+    def _resolve(future, reply):
+        if not future.done():
+            future.set_result(reply)
+
+    @staticmethod
+    def _reject(future, error):
+        if not future.done():
+            future.set_exception(error)
+
+    async def request(self, t, body, path=None):
+        """Send a request whose fields `body(msg)` adds; returns the (type, Message) reply."""
+        if self.closed:
+            raise IOError("SFTP channel closed")
+        num = next(self._ids) & 0xFFFFFFFF
+        msg = Message()
+        msg.add_int(num)
+        body(msg)
+        future = self.loop.create_future()
+        self._requests[num] = (future, path)
+        try:
+            await self.loop.run_in_executor(self._sender, self._send_packet, t, msg)
+            return await future
+        finally:
+            # Cancelled before the reply came; a late reply is then dropped
+            if not future.done():
+                self._requests.pop(num, None)
+                future.cancel()
+
+    async def _status(self, t, body, path):
+        reply, msg = await self.request(t, body, path)
+        if reply != CMD_STATUS:
+            raise IOError(f"Unexpected SFTP reply {reply} for {path}")
+        code = msg.get_int()
+        if code != SFTP_OK:
+            raise _status_error(code, msg, path)
+
+    async def open_write(self, path):
+        def body(msg):
+            msg.add_string(path)
+            msg.add_int(SFTP_FLAG_WRITE | SFTP_FLAG_CREATE | SFTP_FLAG_TRUNC)
+            msg.add_int(0)  # no attributes
+        reply, msg = await self.request(CMD_OPEN, body, path)
+        if reply == CMD_STATUS:
+            raise _status_error(msg.get_int(), msg, path)
+        if reply != CMD_HANDLE:
+            raise IOError(f"Unexpected SFTP reply {reply} for {path}")
+        return msg.get_binary()
+
+    def write(self, handle, offset, data, path=None):
+        """Starts a write and returns the awaitable for its status."""
+        def body(msg):
+            msg.add_string(handle)
+            msg.add_int64(offset)
+            msg.add_string(data)
+        return self.loop.create_task(self._status(CMD_WRITE, body, path))
+
+    async def fstat(self, handle, path=None):
+        reply, msg = await self.request(CMD_FSTAT, lambda m: m.add_string(handle), path)
+        if reply == CMD_STATUS:
+            raise _status_error(msg.get_int(), msg, path)
+        if reply != CMD_ATTRS:
+            raise IOError(f"Unexpected SFTP reply {reply} for {path}")
+        return _parse_attributes(msg)
+
+    async def stat(self, path):
+        reply, msg = await self.request(CMD_STAT, lambda m: m.add_string(path), path)
+        if reply == CMD_STATUS:
+            raise _status_error(msg.get_int(), msg, path)
+        if reply != CMD_ATTRS:
+            raise IOError(f"Unexpected SFTP reply {reply} for {path}")
+        return _parse_attributes(msg)
+
+    async def close_handle(self, handle, path=None):
+        await self._status(CMD_CLOSE, lambda m: m.add_string(handle), path)
+
+    async def mkdir(self, path):
+        def body(msg):
+            msg.add_string(path)
+            msg.add_int(0)
+        await self._status(CMD_MKDIR, body, path)
+
+    async def utime(self, path, atime, mtime):
+        def body(msg):
+            msg.add_string(path)
+            msg.add_int(ATTR_ACMODTIME)
+            msg.add_int(int(atime))
+            msg.add_int(int(mtime))
+        await self._status(CMD_SETSTAT, body, path)
+
+
+class AsyncLoop:
+    """
+    An event loop running in a daemon thread, with a bounded default executor.
+    run(coroutine) may be called from any other thread and blocks it until the
+    coroutine finishes; several jobs can run on the loop at once.
+    """
+
+    def __init__(self, executor_threads=EXECUTOR_THREADS):
+        self.executor_threads = executor_threads
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(ThreadPoolExecutor(max_workers=self.executor_threads))
+            self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self._thread.start()
+
+    def run(self, coroutine):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._thread = None
+
+
+def run_async(coroutine, loop=None):
+    """Run `coroutine` on a shared AsyncLoop, or on a private loop in this thread."""
+    if loop is not None:
+        return loop.run(coroutine)
+    private = asyncio.new_event_loop()
+    private.set_default_executor(ThreadPoolExecutor(max_workers=EXECUTOR_THREADS))
+    try:
+        return private.run_until_complete(coroutine)
+    finally:
+        private.run_until_complete(private.shutdown_asyncgens())
+        private.close()
+
+
+class AsyncUploader:
+    """
+    Uploads UploadTasks with up to `max_in_flight` files in progress over
+    `channels` AsyncSFTPChannels. `tasks` may be any (blocking) iterable; it is
+    read from the executor. Files that `special(task)` claims (segmented,
+    delta, compressed or resumed uploads) are handed to `upload_special(task)`
+    in the executor instead.
+    """
+
+    def __init__(self, pool, ip, port, username, password, channels=ASYNC_CHANNELS,
+                 max_in_flight=MAX_IN_FLIGHT_FILES, stop_event=None, log=None, tracker=None,
+                 directories=None, journal=None, preserve_mtime=False, special=None, upload_special=None,
+                 verifier=None, tracer=None):
+        self.pool = pool
+        self.credentials = (ip, port, username, password)
+        self.channels = max(1, int(channels))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.tracker = tracker
+        self.directories = directories
+        self.journal = journal
+        self.preserve_mtime = preserve_mtime
+        self.special = special or (lambda task: False)
+        self.upload_special = upload_special
+        # Optional Verifier; blocks are hashed in the executor right after they are read
+        self.verifier = verifier
+        # Optional Tracer; file spans overlap on the loop thread, so they are traced as concurrent
+        self.tracer = tracer or Tracer(enabled=False)
+        self.failures = []
+        self.files_done = 0
+        self._channels = []
+        self._next_channel = itertools.cycle(range(self.channels))
+
+    async def run(self, tasks):
+        """Upload every task; returns False if stopped early."""
+        loop = asyncio.get_running_loop()
+        ip, port, username, password = self.credentials
+        conn = await loop.run_in_executor(None, self.pool.connect, ip, port, username, password)
+        # The async channels are opened on the transport directly, outside the pool's SFTP leases
+        conn.acquire()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        running = set()
+        iterator = iter(tasks)
+        try:
+            self._channels = [await AsyncSFTPChannel.open(conn, loop) for _ in range(self.channels)]
+            while not self.stop_event.is_set():
+                batch = await loop.run_in_executor(None, self._next_batch, iterator)
+                if not batch:
+                    break
+                for task in batch:
+                    await slots.acquire()
+                    if self.stop_event.is_set():
+                        slots.release()
+                        break
+                    upload = loop.create_task(self._upload(task))
+                    running.add(upload)
+                    upload.add_done_callback(running.discard)
+                    upload.add_done_callback(lambda _upload: slots.release())
+            if running:
+                await asyncio.gather(*running)
+        finally:
+            for channel in self._channels:
+                channel.close()
+            conn.release()
+        return not self.stop_event.is_set()
+
+    @staticmethod
+    def _next_batch(iterator):
+        return list(itertools.islice(iterator, PLAN_BATCH))
+
+    def _channel(self):
+        channel = self._channels[next(self._next_channel)]
+        if channel.closed:
+            # Use any channel still open; fail the task if none is
+            channel = next((c for c in self._channels if not c.closed), channel)
+        return channel
+
+    async def _upload(self, task):
+        loop = asyncio.get_running_loop()
+        try:
+            if task.local_path is None:
+                await self._ensure(task.remote_path)
+                return
+            await self._ensure(posixpath.dirname(task.remote_path))
+            if self.special(task):
+                digest = await loop.run_in_executor(None, self.upload_special, task)
+            else:
+                digest = await self._upload_file(task)
+            local = await loop.run_in_executor(None, os.stat, task.local_path)
+            if self.journal is not None:
+                self.journal.mark_complete(task.remote_path, local.st_size, local.st_mtime)
+            if self.preserve_mtime:
+                await self._channel().utime(task.remote_path, local.st_atime, local.st_mtime)
+            if self.verifier is not None:
+                self.verifier.add(task.remote_path, task.local_path, digest, task)
+            self.files_done += 1
+            if self.tracker is not None:
+                self.tracker.file_done(task.remote_path)
+            self.log(f"Uploaded {os.path.basename(task.local_path)}", "grey")
+        except TransferCancelled:
+            pass
+        except Exception as e:
+            self.failures.append((task, e))
+            self.log(f"Failed to upload {os.path.basename(task.local_path or task.remote_path)}: {str(e)}", "red")
+
+    async def _ensure(self, remote_dir):
+        remote_dir = posixpath.normpath(remote_dir)
+        if self.directories is None or remote_dir == '/' or self.directories.known(remote_dir):
+            return
+        missing = []
+        for directory in parents(remote_dir):
+            if self.directories.known(directory):
+                break
+            missing.append(directory)
+        channel = self._channel()
+        for path in reversed(missing):
+            try:
+                with self.tracer.span(
+                        'mkdir', category='directory', concurrent=True, path=path, channel=channel_id(channel)):
+                    await channel.mkdir(path)
+            except IOError:
+                # Either it already exists or another upload just created it
+                _size, mode = await channel.stat(path)
+                if mode is None or not stat.S_ISDIR(mode):
+                    raise
+            self.directories.mark(path)
+
+    def _check_stopped(self):
+        if self.stop_event.is_set():
+            raise TransferCancelled()
+
+    def _progress(self, task):
+        if self.tracker is None:
+            callback = lambda transferred, total: self._check_stopped()  # noqa: E731
+        else:
+            callback = self.tracker.file_callback(task.remote_path, task.size, self._check_stopped)
+        if self.journal is not None:
+            self.journal.mark_started(task.remote_path)
+            callback = self.journal.progress_callback(task.remote_path, callback, 0)
+        return callback
+
+    @staticmethod
+    def _read(local, hasher):
+        block = local.read(READ_BLOCK)
+        if hasher is not None:
+            hasher.update(block)
+        return block
+
+    async def _upload_file(self, task):
+        """Send one file; returns its hex digest when verifying, else None."""
+        channel = self._channel()
+        with self.tracer.span(
+                'upload_file', category='file', concurrent=True, path=task.remote_path, bytes=task.size,
+                channel=channel_id(channel), method='async'):
+            return await self._write_file(channel, task)
+
+    async def _write_file(self, channel, task):
+        loop = asyncio.get_running_loop()
+        callback = self._progress(task)
+        hasher = self.verifier.hasher() if self.verifier is not None else None
+        limiter = self.tracker.limiter if self.tracker is not None else None
+        self.log(f"Uploading {task.local_path} to {task.remote_path}", "grey")
+        local = await loop.run_in_executor(None, open, task.local_path, 'rb')
+        handle = None
+        writes = []
+        completed = False
+        try:
+            handle = await channel.open_write(task.remote_path)
+            offset = 0
+            while True:
+                block = await loop.run_in_executor(None, self._read, local, hasher)
+                if not block:
+                    break
+                for start in range(0, len(block), WRITE_SIZE):
+                    chunk = block[start:start + WRITE_SIZE]
+                    if len(writes) >= WRITE_WINDOW:
+                        await writes.pop(0)
+                    writes.append(channel.write(handle, offset, chunk, task.remote_path))
+                    offset += len(chunk)
+                    if limiter is not None and limiter.rate:
+                        # Pacing sleeps; keep it off the event loop
+                        await loop.run_in_executor(None, callback, offset, task.size)
+                    else:
+                        callback(offset, task.size)
+            if writes:
+                await asyncio.gather(*writes)
+                writes = []
+            size, _mode = await channel.fstat(handle, task.remote_path)
+            if size is not None and size != offset:
+                raise IOError(f"size mismatch in upload: {size} != {offset}")
+            completed = True
+        finally:
+            for write in writes:
+                if write.done() and not write.cancelled():
+                    write.exception()  # already failed; the first failure is the one reported
+                else:
+                    write.cancel()
+            await loop.run_in_executor(None, local.close)
+            if handle is not None and not channel.closed:
+                try:
+                    await channel.close_handle(handle, task.remote_path)
+                except Exception:
+                    # Don't let a failed close hide the error that ended the upload
+                    if completed:
+                        raise
+        return hasher.hexdigest() if hasher is not None else None
@@ -0,0 +1,139 @@
+"""
+Global bandwidth limiting and transfer priorities.
+
+One BandwidthLimiter is shared by every job, channel and worker of the GUI (or
+of one CLI run), and every byte a transfer reports to its ProgressTracker is
+paid for from the same token bucket, so the total stays under the limit however
+many channels are open. The limit can be changed, or lifted, while transfers
+are running.
+
+Priority classes work at two levels. While a more urgent job is moving data, a
+less urgent one gets only LOW_SHARE of the limit (an interactive download
+before a background upload). Within an upload, `prioritize` sends small and
+configuration files ahead of bulk media.
+
+With no limit set, consume() is one attribute check, so gigabit transfers pay
+nothing; with a limit it is one lock and a little arithmetic per 32 KB chunk.
+"""
+import heapq
+import os
+import threading
+import time
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+PRIORITIES = {"high": HIGH, "normal": NORMAL, "low": LOW}
+
+LOW_SHARE = 0.1  # share of the limit left to a class while a more urgent one is active
+ACTIVE_WINDOW = 0.5  # seconds a class counts as active after its last chunk
+BURST_SECONDS = 0.25
+MIN_BURST = 64 * 1024
+MAX_SLEEP = 0.1  # sleep in slices so limit changes take effect promptly
+
+SMALL_FILE = 64 * 1024
+BULK_FILE = 64 * 1024 * 1024
+CONFIG_EXTENSIONS = {
+    '.conf', '.cfg', '.ini', '.env', '.json', '.yaml', '.yml', '.toml', '.xml',
+    '.properties', '.htaccess', '.service', '.txt', '.md',
+}
+BULK_EXTENSIONS = {
+    '.mp4', '.mkv', '.mov', '.avi', '.webm', '.mp3', '.flac', '.wav', '.ogg', '.m4a',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.tif', '.tiff', '.psd',
+    '.iso', '.img', '.zip', '.gz', '.tgz', '.xz', '.bz2', '.7z', '.rar', '.zst',
+}
+PRIORITY_WINDOW = 4096
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """Bytes per second from "500K", "10M", "1.5G" or a plain number; 0 means unlimited."""
+    text = str(text).strip().upper()
+    for suffix in ("/S", "IB", "B"):
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+    unit = text[-1:] if text[-1:] in UNITS else ''
+    try:
+        value = float(text[:len(text) - len(unit)])
+    except ValueError:
+        raise ValueError(f"Invalid rate: {text!r} (use e.g. 500K, 10M or 0 for unlimited)")
+    if value < 0:
+        raise ValueError(f"Invalid rate: {text!r}")
+    return int(value * UNITS[unit])
+
+
+class BandwidthLimiter:
+    """Token bucket in bytes per second; rate 0 means unlimited."""
+
+    def __init__(self, rate=0, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._active = {}  # priority -> time of its last chunk
+        self._next = {}  # priority -> earliest time its share allows more
+        self._generation = 0
+        self.rate = 0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = max(0, int(rate or 0))
+            self.capacity = max(MIN_BURST, self.rate * BURST_SECONDS)
+            self.tokens = self.capacity
+            self.updated = self.clock()
+            self._next.clear()
+            # Sleepers waiting out the old rate's debt wake up and carry on
+            self._generation += 1
+
+    def consume(self, amount, priority=NORMAL):
+        """Block until `amount` bytes fit under the limit."""
+        if not self.rate or amount <= 0:
+            return
+        with self._lock:
+            rate = self.rate
+            if not rate:
+                return
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / rate if self.tokens < 0 else 0.0
+            self._active[priority] = now
+            if any(now - seen < ACTIVE_WINDOW for other, seen in self._active.items() if other < priority):
+                # A more urgent class is moving data; keep to a small share
+                ready = max(now, self._next.get(priority, now)) + amount / (rate * LOW_SHARE)
+                self._next[priority] = ready
+                wait = max(wait, ready - now)
+            generation = self._generation
+        deadline = now + wait
+        while wait > 0 and self._generation == generation:
+            self.sleep(min(wait, MAX_SLEEP))
+            wait = deadline - self.clock()
+
+
+def file_priority(path, size):
+    """HIGH for small and configuration files, LOW for bulk media and archives, else NORMAL."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in BULK_EXTENSIONS or size >= BULK_FILE:
+        return LOW
+    if extension in CONFIG_EXTENSIONS or size < SMALL_FILE:
+        return HIGH
+    return NORMAL
+
+
+def prioritize(tasks, window=PRIORITY_WINDOW):
+    """
+    Reorder a stream of UploadTasks so that, within each `window` tasks read
+    ahead, more urgent files go first (directory tasks are most urgent of all).
+    Ties keep their original order; memory stays bounded by the window.
+    """
+    heap = []
+    for sequence, task in enumerate(tasks):
+        priority = -1 if task.local_path is None else file_priority(task.local_path, task.size)
+        heapq.heappush(heap, (priority, sequence, task))
+        if len(heap) >= window:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
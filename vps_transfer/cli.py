@@ -0,0 +1,350 @@
+"""
+Headless command line for the transfer engine.
+
+    vps-transfer upload  --host H --user U SOURCE... DESTINATION
+    vps-transfer sync    --host H --user U SOURCE... DESTINATION
+    vps-transfer download --host H --user U REMOTE_PATH LOCAL_DIRECTORY
+    vps-transfer ls      --host H --user U REMOTE_PATH
+    vps-transfer rm      --host H --user U REMOTE_PATH...
+    vps-transfer mv      --host H --user U REMOTE_PATH DIRECTORY
+    vps-transfer cp      --host H --user U REMOTE_PATH DIRECTORY
+    vps-transfer du      --host H --user U REMOTE_PATH
+    vps-transfer info    --host H --user U
+
+Every report is printed to stdout as one JSON object per line. The password is
+taken from --password, the VPS_TRANSFER_PASSWORD environment variable, or a
+prompt. PyQt6 is never imported, and the engine (and paramiko) only once a
+command actually runs.
+"""
+import argparse
+import getpass
+import json
+import os
+import stat
+import sys
+import threading
+
+
+def emit(event):
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def connection_params(args):
+    password = args.password or os.environ.get('VPS_TRANSFER_PASSWORD')
+    if password is None:
+        password = getpass.getpass(f"Password for {args.user}@{args.host}: ")
+    from vps_transfer.pool import ConnectionPool
+    return {
+        'ip': args.host,
+        'port': str(args.port),
+        'username': args.user,
+        'password': password,
+        'pool': ConnectionPool(),
+        'trace': getattr(args, 'trace', False),
+        'profile': getattr(args, 'profile', None),
+    }
+
+
+def transfer_options(args):
+    from vps_transfer.bandwidth import BandwidthLimiter
+    compression = None
+    if args.compress:
+        from vps_transfer.compression import CompressionAdvisor
+        compression = CompressionAdvisor()
+    limiter = BandwidthLimiter(args.limit)
+    watch_limit_commands(limiter)
+    return {
+        'segments': args.segments,
+        'segment_threshold': args.segment_threshold,
+        'transfer_mode': 'tar' if args.tar else 'sftp',
+        'resume': args.resume,
+        'verify': args.verify,
+        'compression': compression,
+        'limiter': limiter,
+    }
+
+
+def watch_limit_commands(limiter, stream=None):
+    """
+    Change the bandwidth limit while a transfer runs: each line like
+    "limit 5M" (or just "5M"; "0" lifts the limit) read from stdin takes effect
+    at once and is acknowledged with a {'event': 'limit', 'rate'} line.
+    """
+    from vps_transfer.bandwidth import parse_rate
+    stream = stream or sys.stdin
+
+    def watch():
+        for line in stream:
+            words = line.split()
+            if not words:
+                continue
+            if words[0].lower() == "limit":
+                words = words[1:]
+            try:
+                limiter.set_rate(parse_rate(words[0] if words else ""))
+            except ValueError as e:
+                emit({'event': 'log', 'message': str(e), 'color': 'yellow', 'level': 'warning'})
+                continue
+            emit({'event': 'limit', 'rate': limiter.rate})
+
+    if not stream.closed:
+        threading.Thread(target=watch, daemon=True).start()
+
+
+def run_job(job, args):
+    """Print the job's events as JSON lines; returns the process exit status."""
+    from vps_transfer.logbuffer import DEBUG, LEVELS, LogFile
+    level = DEBUG if args.verbose else LEVELS[args.log_level]
+    log_file = LogFile(args.log_file) if args.log_file else None
+    failed = False
+    try:
+        for event in job.events():
+            if event['event'] == 'error':
+                # Errors reported while the job carries on still mean a failed run
+                failed = True
+            elif event['event'] == 'log':
+                if log_file is not None:
+                    log_file.write(event['message'], event['color'])
+                if LEVELS[event['level']] < level:
+                    continue
+            emit(event)
+            if event['event'] == 'done':
+                return 0 if event['status'] == 'success' and not failed else 1
+    except KeyboardInterrupt:
+        emit({'event': 'done', 'status': 'terminated'})
+        return 130
+    finally:
+        if log_file is not None:
+            log_file.close()
+    return 1
+
+
+def command_upload(args, sync=False):
+    from vps_transfer.engine import UploadJob
+    params = connection_params(args)
+    params.update(transfer_options(args))
+    sources = [os.path.abspath(source) for source in args.sources]
+    params.update({
+        'destination': args.destination,
+        'selected_files': sources,
+        'selection_mode': "directories" if any(os.path.isdir(source) for source in sources) else "files",
+        'exclusions': args.exclude,
+        'parallel_channels': args.channels,
+        'ssh_sessions': args.sessions,
+        'sync_mode': sync or args.sync,
+        'sync_checksum': args.checksum,
+        'delta_mode': args.delta,
+        'dedup': args.dedup or bool(args.dedup_from),
+        'dedup_reference': args.dedup_from,
+        'dedup_link': 'hardlink' if args.hardlink else 'copy',
+    })
+    if args.use_async:
+        params['transfer_mode'] = 'async'
+    status = run_job(UploadJob(params), args)
+    params['pool'].close_all()
+    return status
+
+
+def command_sync(args):
+    return command_upload(args, sync=True)
+
+
+def command_download(args):
+    from vps_transfer.engine import RemoteOperation
+    params = connection_params(args)
+    params.update(transfer_options(args))
+    params.update({
+        'remote_path': args.remote_path,
+        'local_destination': args.local_directory,
+        'parallel_channels': args.channels,
+    })
+    status = run_job(RemoteOperation('download', params), args)
+    params['pool'].close_all()
+    return status
+
+
+def command_rm(args):
+    from vps_transfer.engine import RemoteOperation
+    params = connection_params(args)
+    params['parallel_channels'] = args.channels
+    status = 0
+    for remote_path in args.remote_paths:
+        params['remote_path'] = remote_path
+        status = run_job(RemoteOperation('delete', dict(params)), args) or status
+    params['pool'].close_all()
+    return status
+
+
+def command_mv(args, operation='move'):
+    from vps_transfer.engine import RemoteOperation
+    params = connection_params(args)
+    params.update({'remote_path': args.remote_path, f'{operation}_destination': args.directory})
+    status = run_job(RemoteOperation(operation, params), args)
+    params['pool'].close_all()
+    return status
+
+
+def command_cp(args):
+    return command_mv(args, operation='copy')
+
+
+def command_du(args):
+    from vps_transfer.engine import RemoteOperation
+    params = connection_params(args)
+    params.update({'remote_path': args.remote_path, 'parallel_channels': args.channels})
+    job = RemoteOperation('size', params)
+    status = run_job(job, args)
+    if job.size is not None:
+        emit({'path': args.remote_path, 'size': job.size})
+    params['pool'].close_all()
+    return status
+
+
+def command_ls(args):
+    params = connection_params(args)
+    pool = params['pool']
+    try:
+        with pool.sftp(params['ip'], params['port'], params['username'], params['password']) as sftp:
+            for entry in sorted(sftp.listdir_attr(args.remote_path), key=lambda entry: entry.filename):
+                emit({
+                    'name': entry.filename,
+                    'type': 'directory' if stat.S_ISDIR(entry.st_mode) else 'file',
+                    'size': entry.st_size,
+                    'mtime': entry.st_mtime,
+                })
+    except Exception as e:
+        emit({'event': 'error', 'message': str(e)})
+        return 1
+    finally:
+        pool.close_all()
+    return 0
+
+
+def command_info(args):
+    from vps_transfer.sysinfo import SystemInfoCache
+    params = connection_params(args)
+    pool = params['pool']
+    try:
+        conn = pool.connect(params['ip'], params['port'], params['username'], params['password'])
+        info = SystemInfoCache().fetch(conn, (params['ip'], params['port'], params['username']))
+    except Exception as e:
+        emit({'event': 'error', 'message': str(e)})
+        return 1
+    finally:
+        pool.close_all()
+    emit({
+        'fields': info.fields,
+        'errors': info.errors,
+        'filesystems': [{'mount': mount, 'available': available} for mount, available in info.filesystems],
+        'seconds': round(info.elapsed, 3),
+    })
+    return 0
+
+
+def rate_argument(text):
+    from vps_transfer.bandwidth import parse_rate
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="vps-transfer", description="Transfer files to and from a VPS over SSH.")
+    connection = argparse.ArgumentParser(add_help=False)
+    connection.add_argument("--host", required=True, help="server address")
+    connection.add_argument("--port", type=int, default=22)
+    connection.add_argument("--user", required=True)
+    connection.add_argument("--password", help="defaults to $VPS_TRANSFER_PASSWORD, then a prompt")
+    connection.add_argument("--log-level", choices=["debug", "info", "warning", "error"], default="info",
+                            help="least severe log lines to print (default: info)")
+    connection.add_argument("-v", "--verbose", action="store_true", help="print per-file detail too (--log-level debug)")
+    connection.add_argument("--log-file", metavar="PATH", help="append the full log, at every level, to this file")
+
+    transfer = argparse.ArgumentParser(add_help=False)
+    transfer.add_argument("--segments", type=int, default=1, help="concurrent segments for large files")
+    transfer.add_argument("--segment-threshold", type=int, default=256, metavar="MB",
+                          help="files at least this large are transferred in segments")
+    transfer.add_argument("--tar", action="store_true", help="stream directories as one tar archive")
+    transfer.add_argument("--resume", action="store_true", help="continue an interrupted run of the same job")
+    transfer.add_argument("--verify", action="store_true",
+                          help="compare every file's hash with one taken on the server and resend mismatches")
+    transfer.add_argument("--compress", action="store_true", help="gzip files on the fly when it pays off")
+    transfer.add_argument("--limit", type=rate_argument, default=0, metavar="RATE",
+                          help="bandwidth limit such as 500K or 10M (default: unlimited); "
+                               "change it while running by typing e.g. 'limit 2M' on stdin")
+
+    diagnostics = argparse.ArgumentParser(add_help=False)
+    diagnostics.add_argument("--trace", action="store_true",
+                             help="record per-phase spans; writes a Chrome trace and a summary to ~/.vps_transfer/traces")
+    diagnostics.add_argument("--profile", choices=["cpu", "memory"],
+                             help="profile the job's threads with cProfile (cpu) or tracemalloc (memory)")
+
+    walk = argparse.ArgumentParser(add_help=False)
+    walk.add_argument("--channels", type=int, default=None,
+                      help="SFTP channels for listing and per-file work when walking a tree (default: 4)")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    upload = argparse.ArgumentParser(add_help=False, parents=[connection, transfer, diagnostics])
+    upload.add_argument("sources", nargs="+")
+    upload.add_argument("destination")
+    upload.add_argument("--exclude", action="append", default=[], metavar="NAME",
+                        help="file or directory name to skip (repeatable)")
+    upload.add_argument("--channels", type=int, default=1, help="parallel SFTP channels")
+    upload.add_argument("--sessions", type=int, default=1, help="SSH sessions to spread channels over")
+    upload.add_argument("--checksum", action="store_true", help="in sync mode, compare SHA-256 when only mtimes differ")
+    upload.add_argument("--delta", action="store_true", help="send only changed blocks of large existing files")
+    upload.add_argument("--dedup", action="store_true",
+                        help="upload identical files once and copy them on the server")
+    upload.add_argument("--dedup-from", metavar="REMOTE_DIR",
+                        help="also reuse files already in REMOTE_DIR, e.g. the previous release (implies --dedup)")
+    upload.add_argument("--hardlink", action="store_true",
+                        help="make deduplicated files hard links instead of (reflinked) copies")
+    upload.add_argument("--async", dest="use_async", action="store_true",
+                        help="keep many file requests in flight at once (best for many small files; overrides --tar)")
+
+    command = commands.add_parser("upload", parents=[upload], help="upload files and directories")
+    command.add_argument("--sync", action="store_true", help="skip files that are unchanged on the server")
+    command.set_defaults(handler=command_upload)
+    command = commands.add_parser("sync", parents=[upload], help="upload only new and changed files")
+    command.set_defaults(handler=command_sync, sync=True)
+
+    command = commands.add_parser("download", parents=[connection, transfer, walk, diagnostics], help="download a file or directory")
+    command.add_argument("remote_path")
+    command.add_argument("local_directory")
+    command.set_defaults(handler=command_download)
+
+    command = commands.add_parser("ls", parents=[connection], help="list a remote directory")
+    command.add_argument("remote_path")
+    command.set_defaults(handler=command_ls)
+
+    command = commands.add_parser("rm", parents=[connection, walk, diagnostics], help="delete remote files or directories")
+    command.add_argument("remote_paths", nargs="+", metavar="remote_path")
+    command.set_defaults(handler=command_rm)
+
+    command = commands.add_parser("mv", parents=[connection, diagnostics], help="move a remote file or directory into DIRECTORY")
+    command.add_argument("remote_path")
+    command.add_argument("directory")
+    command.set_defaults(handler=command_mv)
+    command = commands.add_parser("cp", parents=[connection, diagnostics], help="copy a remote file or directory into DIRECTORY")
+    command.add_argument("remote_path")
+    command.add_argument("directory")
+    command.set_defaults(handler=command_cp)
+    command = commands.add_parser("du", parents=[connection, walk, diagnostics], help="print the size of a remote file or directory")
+    command.add_argument("remote_path")
+    command.set_defaults(handler=command_du)
+
+    command = commands.add_parser("info", parents=[connection], help="print the server's uptime, disk, memory and system")
+    command.set_defaults(handler=command_info)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Adaptive on-the-fly compression.
+
+Text-heavy payloads (logs, SQL dumps, JSON) shrink several times under even the
+fastest zlib level, but compressing JPEGs or archives, or compressing at all on
+a link faster than the CPU, only costs time. The advisor decides per file from
+its extension, a compression sample taken from the file, and the measured link
+throughput versus the measured compression speed. Compressed files travel as a
+gzip stream through an exec channel and are unpacked by `gzip -dc` on the
+server (or by zlib locally for downloads).
+"""
+import os
+import posixpath
+import threading
+import time
+import uuid
+import zlib
+
+from vps_transfer.parallel import TransferCancelled
+from vps_transfer.remote import quote, run_command
+
+COMPRESSION_LEVEL = 1
+MIN_COMPRESS_SIZE = 256 * 1024
+SAMPLE_SIZE = 64 * 1024
+BLOCK_SIZE = 256 * 1024
+# Without a throughput measurement yet, only obviously compressible data is worth it
+UNMEASURED_MAX_RATIO = 0.5
+# Compression has to win by at least this margin to be used
+REQUIRED_GAIN = 0.85
+
+INCOMPRESSIBLE_EXTENSIONS = {
+    '.7z', '.aac', '.avi', '.br', '.bz2', '.cab', '.deb', '.docx', '.flac', '.gif',
+    '.gz', '.heic', '.jar', '.jpeg', '.jpg', '.lz', '.lz4', '.lzma', '.m4a', '.m4v',
+    '.mkv', '.mov', '.mp3', '.mp4', '.ogg', '.opus', '.png', '.pptx', '.rar', '.rpm',
+    '.tbz2', '.tgz', '.txz', '.webm', '.webp', '.whl', '.xlsx', '.xz', '.zip', '.zst',
+}
+
+
+def sample_blocks(fileobj, size):
+    """Read up to three SAMPLE_SIZE blocks from the start, middle and end of a file."""
+    offsets = [0]
+    if size > SAMPLE_SIZE * 3:
+        offsets += [size // 2, size - SAMPLE_SIZE]
+    blocks = []
+    for offset in offsets:
+        fileobj.seek(offset)
+        blocks.append(fileobj.read(SAMPLE_SIZE))
+    return blocks
+
+
+class CompressionAdvisor:
+    """
+    Keeps running estimates of link throughput and compression speed and
+    decides, per file, whether compressing the stream makes it arrive sooner.
+    """
+
+    def __init__(self, level=COMPRESSION_LEVEL, min_size=MIN_COMPRESS_SIZE):
+        self.level = level
+        self.min_size = min_size
+        self.link_rate = None      # bytes/s on the wire
+        self.compress_rate = None  # raw bytes/s through zlib
+        self._lock = threading.Lock()
+        self._remote_gzip = {}
+
+    def _update(self, name, rate):
+        with self._lock:
+            current = getattr(self, name)
+            # Exponentially weighted, so the estimate follows changing conditions
+            setattr(self, name, rate if current is None else current * 0.7 + rate * 0.3)
+
+    def record_link(self, nbytes, seconds):
+        if nbytes >= SAMPLE_SIZE and seconds > 0:
+            self._update('link_rate', nbytes / seconds)
+
+    def sample_ratio(self, blocks):
+        raw = sum(len(block) for block in blocks)
+        if not raw:
+            return 1.0
+        started = time.perf_counter()
+        packed = sum(len(zlib.compress(block, self.level)) for block in blocks)
+        elapsed = time.perf_counter() - started
+        if elapsed > 0:
+            self._update('compress_rate', raw / elapsed)
+        return packed / raw
+
+    def worthwhile(self, ratio):
+        """Would a stream with this compression ratio arrive sooner compressed?"""
+        if ratio >= REQUIRED_GAIN:
+            return False
+        if self.link_rate is None or self.compress_rate is None:
+            return ratio <= UNMEASURED_MAX_RATIO
+        # Compression and sending overlap, so the slower of the two dominates
+        plain = 1.0 / self.link_rate
+        compressed = max(1.0 / self.compress_rate, ratio / self.link_rate)
+        return compressed < plain * REQUIRED_GAIN
+
+    def should_compress(self, path, size, fileobj=None):
+        if size < self.min_size:
+            return False
+        if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return False
+        if fileobj is None:
+            with open(path, 'rb') as f:
+                ratio = self.sample_ratio(sample_blocks(f, size))
+        else:
+            ratio = self.sample_ratio(sample_blocks(fileobj, size))
+        return self.worthwhile(ratio)
+
+    def should_compress_tasks(self, tasks, count=16):
+        """
+        Decide for a whole tar stream by sampling its first `count` files.
+        Returns (decision, iterator over all tasks including the sampled ones).
+        """
+        tasks = iter(tasks)
+        head = []
+        blocks = []
+        for task in tasks:
+            head.append(task)
+            if task.local_path is not None and \
+                    os.path.splitext(task.local_path)[1].lower() not in INCOMPRESSIBLE_EXTENSIONS:
+                with open(task.local_path, 'rb') as f:
+                    blocks.append(f.read(SAMPLE_SIZE))
+            if len(blocks) >= count:
+                break
+        decision = bool(blocks) and self.worthwhile(self.sample_ratio(blocks))
+
+        def chained():
+            for task in head:
+                yield task
+            for task in tasks:
+                yield task
+        return decision, chained()
+
+    def remote_has_gzip(self, conn):
+        """Whether the server runs commands and has gzip, cached per server; False for an SFTP-only account."""
+        if conn.key not in self._remote_gzip:
+            try:
+                status, output, _error = run_command(conn, "command -v gzip")
+            except Exception:
+                status, output = 1, ''
+            self._remote_gzip[conn.key] = status == 0 and bool(output.strip())
+        return self._remote_gzip[conn.key]
+
+
+class GzipWriter:
+    """File-like wrapper that gzip-compresses everything written through it into `send`."""
+
+    def __init__(self, send, level=COMPRESSION_LEVEL):
+        self.send = send
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.written = 0
+
+    def write(self, data):
+        packed = self.compressor.compress(data)
+        if packed:
+            self.send(packed)
+            self.written += len(packed)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        packed = self.compressor.flush()
+        if packed:
+            self.send(packed)
+            self.written += len(packed)
+
+
+class CompressedTransfer:
+    """
+    Moves single files as gzip streams over exec channels. `progress` receives
+    raw (uncompressed) byte counts.
+    """
+
+    def __init__(self, pool, ip, port, username, password, advisor=None,
+                 stop_event=None, log=None, progress=None):
+        self.pool = pool
+        self.credentials = (ip, port, username, password)
+        self.advisor = advisor or CompressionAdvisor()
+        self.stop_event = stop_event
+        self.log = log or (lambda message, color="white": None)
+        self.progress = progress or (lambda delta: None)
+
+    def connect(self):
+        ip, port, username, password = self.credentials
+        return self.pool.connect(ip, port, username, password)
+
+    def _advance(self, amount):
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise TransferCancelled()
+        self.progress(amount)
+
+    def should_upload_compressed(self, local_path, size):
+        return self.advisor.should_compress(local_path, size) and self.advisor.remote_has_gzip(self.connect())
+
+    def should_download_compressed(self, sftp, remote_path, size):
+        if size < self.advisor.min_size or \
+                posixpath.splitext(remote_path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return False
+        if not self.advisor.remote_has_gzip(self.connect()):
+            return False
+        with sftp.open(remote_path, 'rb') as f:
+            return self.advisor.should_compress(remote_path, size, fileobj=f)
+
+    def upload(self, local_path, remote_path):
+        conn = self.connect()
+        # Decompress into a temporary sibling so an aborted upload never leaves a
+        # truncated file under the real name
+        temp_path = f"{remote_path}.part-{uuid.uuid4().hex[:8]}"
+        with conn.lease():
+            channel = conn.transport.open_session()
+            channel.exec_command(
+                f"gzip -dc > {quote(temp_path)} && mv -f {quote(temp_path)} {quote(remote_path)}"
+            )
+            started = time.perf_counter()
+            writer = GzipWriter(channel.sendall, self.advisor.level)
+            size = 0
+            try:
+                with open(local_path, 'rb') as f:
+                    for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                        writer.write(block)
+                        size += len(block)
+                        self._advance(len(block))
+                writer.close()
+                channel.shutdown_write()
+                status = channel.recv_exit_status()
+                error = channel.makefile_stderr('rb').read().decode(errors='replace').strip()
+            except Exception:
+                channel.close()
+                run_command(conn, f"rm -f {quote(temp_path)}")
+                raise
+            channel.close()
+        if status != 0:
+            run_command(conn, f"rm -f {quote(temp_path)}")
+            raise IOError(f"Remote gzip failed for {remote_path}: {error}")
+        self._report(local_path, size, writer.written, time.perf_counter() - started)
+
+    def download(self, remote_path, local_path):
+        conn = self.connect()
+        with conn.lease():
+            channel = conn.transport.open_session()
+            channel.exec_command(f"gzip -c -{self.advisor.level} -- {quote(remote_path)}")
+            started = time.perf_counter()
+            decompressor = zlib.decompressobj(31)
+            received = 0
+            size = 0
+            try:
+                with open(local_path, 'wb') as f:
+                    for packed in iter(lambda: channel.recv(BLOCK_SIZE), b''):
+                        received += len(packed)
+                        data = decompressor.decompress(packed)
+                        f.write(data)
+                        size += len(data)
+                        self._advance(len(data))
+                    data = decompressor.flush()
+                    f.write(data)
+                    size += len(data)
+                status = channel.recv_exit_status()
+                error = channel.makefile_stderr('rb').read().decode(errors='replace').strip()
+            finally:
+                channel.close()
+        if status != 0:
+            raise IOError(f"Remote gzip failed for {remote_path}: {error}")
+        self._report(remote_path, size, received, time.perf_counter() - started)
+
+    def _report(self, path, raw, wire, seconds):
+        self.advisor.record_link(wire, seconds)
+        self.log(
+            f"Compressed transfer of {os.path.basename(path)}: "
+            f"{raw / (1024 * 1024):.2f} MB as {wire / (1024 * 1024):.2f} MB on the wire",
+            "green"
+        )
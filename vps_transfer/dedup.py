@@ -0,0 +1,232 @@
+"""
+Content-addressed deduplication for uploads.
+
+Release trees carry many byte-identical files (vendored libraries, copied
+assets), and every copy used to be sent. Deduplicator groups an upload's files
+by size, hashes only the sizes that occur more than once (or in a reference
+directory on the server, such as the previous release), and uploads each
+distinct content once. The other copies are made on the server after the
+upload with batched `cp --reflink=auto` (or `ln`) commands, and content the
+reference directory already holds is copied from there without being sent.
+
+A hard-linked duplicate shares its data with its source, so a later SFTP put
+would write through the link into the other path (the previous release, say).
+remote_hardlinks() finds such files under a destination so uploads can unlink
+them before writing.
+"""
+import hashlib
+import posixpath
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from vps_transfer.remote import quote, run_command
+from vps_transfer.remotedirs import MAX_COMMAND_LENGTH
+from vps_transfer.sync import RemoteIndex
+from vps_transfer.verify import hash_batches, hash_file, remote_hashes
+
+DEDUP_MIN_SIZE = 1  # empty files cost nothing to send
+HASH_WORKERS = 4    # local files hashed at once
+LINK_MODES = ('copy', 'hardlink')
+
+# `task` is made on the server from `source`, a remote path with the same content (SHA-256 `digest`)
+Duplicate = namedtuple('Duplicate', ['source', 'task', 'digest'])
+
+
+def remote_hardlinks(conn, root):
+    """Paths of the regular files below `root` that have other hard links; empty when unknown."""
+    try:
+        _status, output, _error = run_command(conn, f"find {quote(root)} -type f -links +1 -print0")
+    except Exception:
+        return set()
+    # find reports unreadable directories in its status but still lists the rest
+    return {posixpath.normpath(path) for path in output.split('\0') if path}
+
+
+class Deduplicator:
+    """
+    plan() splits UploadTasks into the ones to upload and Duplicates; once
+    the uploads are done, apply() makes the duplicates on the server. With
+    `link` set to 'hardlink' duplicates share the source's inode; 'copy'
+    gives independent files (reflinked where the filesystem allows it).
+    """
+
+    def __init__(self, conn, sftp, reference=None, link='copy', stop_event=None, log=None):
+        if link not in LINK_MODES:
+            raise ValueError(f"Unknown dedup link mode: {link}")
+        self.conn = conn
+        self.sftp = sftp
+        self.reference = reference.rstrip('/') if reference else None
+        self.link = link
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.command = None
+        self.duplicates = 0
+        self.from_reference = 0
+        self.saved_bytes = 0
+
+    def plan(self, tasks):
+        """Return (tasks to upload, Duplicates), keeping the order of `tasks`."""
+        tasks = list(tasks)
+        try:
+            self.command = self._command()
+        except Exception as e:
+            # Duplicates are made by server-side commands; an SFTP-only account refuses them
+            self.log(f"Dedup: no shell access on the server ({str(e)}); uploading every file.", "yellow")
+            return tasks, []
+        by_size = {}
+        for task in tasks:
+            if task.local_path is not None and task.size >= DEDUP_MIN_SIZE:
+                by_size.setdefault(task.size, []).append(task)
+        targets = {task.remote_path for task in tasks}
+        reference = self._reference_sizes(targets) if self.reference else {}
+        candidates = [
+            task for size, group in by_size.items() if len(group) > 1 or size in reference for task in group
+        ]
+        digests = self._hash_local(candidates)
+        known = self._hash_reference(reference, {task.size for task in candidates})
+
+        upload = []
+        duplicates = []
+        for task in tasks:
+            digest = digests.get(task.remote_path)
+            if digest is None:
+                upload.append(task)
+                continue
+            source = known.get(digest)
+            if source is None:
+                # First copy of this content: upload it, and copy it for the rest
+                known[digest] = task.remote_path
+                upload.append(task)
+                continue
+            duplicates.append(Duplicate(source, task, digest))
+        self._count(duplicates)
+        message = f"Dedup: {len(candidates)} file(s) hashed, {self.duplicates} duplicate(s) to make on the server"
+        if self.reference:
+            message += f", {self.from_reference} of them from {self.reference}"
+        self.log(message + ".", "blue")
+        return upload, duplicates
+
+    def _count(self, duplicates):
+        self.duplicates = len(duplicates)
+        self.saved_bytes = sum(item.task.size for item in duplicates)
+        self.from_reference = sum(
+            1 for item in duplicates if self.reference and item.source.startswith(self.reference + '/')
+        )
+
+    def _reference_sizes(self, targets):
+        # Files this upload is about to overwrite can't serve as sources
+        index = RemoteIndex.fetch(self.conn, self.sftp, self.reference)
+        self.log(f"Dedup: {len(index.files)} file(s) in {self.reference} (via {index.source}).", "grey")
+        sizes = {}
+        for relative, (size, _mtime) in index.files.items():
+            path = posixpath.join(index.root, relative)
+            if size >= DEDUP_MIN_SIZE and path not in targets:
+                sizes.setdefault(size, []).append(path)
+        return sizes
+
+    def _hash_local(self, tasks):
+        def digest(task):
+            if self.stop_event.is_set():
+                return task, None
+            try:
+                return task, hash_file(task.local_path, hashlib.sha256())
+            except OSError:
+                # Left to the upload, which reports the error
+                return task, None
+
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+            return {
+                task.remote_path: value for task, value in executor.map(digest, tasks) if value is not None
+            }
+
+    def _hash_reference(self, reference, sizes):
+        """{digest: remote path} for the reference files whose size some local candidate shares."""
+        directories = {}
+        for size in sizes & set(reference):
+            for path in reference[size]:
+                directories.setdefault(posixpath.dirname(path), []).append(posixpath.basename(path))
+        known = {}
+        for directory, names in directories.items():
+            for batch in hash_batches(directory, names):
+                if self.stop_event.is_set():
+                    return known
+                try:
+                    hashes = remote_hashes(self.conn, directory, batch)
+                except Exception as e:
+                    self.log(f"Dedup: could not hash files in {directory}: {str(e)}", "yellow")
+                    continue
+                for name, digest in hashes.items():
+                    known.setdefault(digest, posixpath.join(directory, name))
+        return known
+
+    def _command(self):
+        # Run in hardlink mode too: it raises when the server refuses exec.
+        # --reflink is GNU cp; elsewhere a plain copy
+        status, _output, _error = run_command(self.conn, "cp --reflink=auto --version")
+        if self.link == 'hardlink':
+            return "ln -f --"
+        return "cp --reflink=auto --" if status == 0 else "cp --"
+
+    def apply(self, duplicates):
+        """
+        Make each duplicate on the server from its source. Returns the
+        Duplicates that were made and those that failed, so the caller can
+        upload the failed ones instead.
+        """
+        try:
+            command = self.command or self._command()
+        except Exception as e:
+            self.log(f"Dedup: server-side copies failed: {str(e)}; uploading the duplicates.", "yellow")
+            self._count([])
+            return [], list(duplicates)
+        made = []
+        failed = []
+        for batch in self._batches(duplicates, command):
+            if self.stop_event.is_set():
+                failed.extend(batch)
+                continue
+            # An existing target is removed first, so a hard-linked old file is never written through
+            script = '; '.join(
+                f"{{ rm -f -- {quote(item.task.remote_path)} && "
+                f"{command} {quote(item.source)} {quote(item.task.remote_path)}; }} "
+                f"|| printf '%s\\0' {quote(item.task.remote_path)}"
+                for item in batch
+            )
+            try:
+                _status, output, _error = run_command(self.conn, script)
+            except Exception as e:
+                self.log(f"Dedup: server-side copies failed: {str(e)}", "yellow")
+                failed.extend(batch)
+                continue
+            missing = set(output.split('\0'))
+            for item in batch:
+                (failed if item.task.remote_path in missing else made).append(item)
+        self._count(made)
+        if failed:
+            self.log(f"Dedup: {len(failed)} duplicate(s) could not be made on the server; uploading them.", "yellow")
+        return made, failed
+
+    @staticmethod
+    def _batches(duplicates, command):
+        batch = []
+        length = 0
+        for item in duplicates:
+            size = 2 * len(quote(item.task.remote_path)) + len(quote(item.source)) + len(command) + 40
+            if batch and length + size > MAX_COMMAND_LENGTH:
+                yield batch
+                batch = []
+                length = 0
+            batch.append(item)
+            length += size
+        if batch:
+            yield batch
+
+    def summary(self):
+        summary = (
+            f"Dedup saved {self.saved_bytes / (1024 * 1024):.2f} MB: "
+            f"{self.duplicates} duplicate file(s) made on the server"
+        )
+        if self.reference:
+            summary += f", {self.from_reference} of them from {self.reference}"
+        return summary
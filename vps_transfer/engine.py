@@ -0,0 +1,1205 @@
+"""
+Qt-free transfer engine.
+
+UploadJob and RemoteOperation hold all of the transfer and remote-file logic.
+They report through plain callbacks (log(message, color), progress(percent),
+error(message)), so the same code drives the GUI job queue in app.py and the
+headless `vps-transfer` command line. Nothing here imports PyQt6.
+
+    job = UploadJob(params)
+    for event in job.events():
+        print(event)
+"""
+import os
+import posixpath
+import queue
+import stat
+import threading
+import time
+from collections import namedtuple
+
+from vps_transfer.aiotransfer import ASYNC_CHANNELS, MAX_IN_FLIGHT_FILES, AsyncUploader, run_async
+from vps_transfer.bandwidth import PRIORITIES, prioritize
+from vps_transfer.compression import CompressedTransfer
+from vps_transfer.dedup import Deduplicator, remote_hardlinks
+from vps_transfer.delta import DeltaTransfer
+from vps_transfer.journal import TransferJournal, get_file
+from vps_transfer.logbuffer import LEVEL_NAMES, level_for
+from vps_transfer.parallel import FileSender, ParallelUploader, TransferCancelled, UploadTask
+from vps_transfer.progress import ProgressTracker, format_rate
+from vps_transfer.remote import RemoteCommands, validate_remote_path
+from vps_transfer.remotedirs import RemoteDirectoryCache
+from vps_transfer.scanner import LocalScanner
+from vps_transfer.segmented import SegmentedTransfer
+from vps_transfer.sync import RemoteIndex, SyncPlanner, preserve_mtime
+from vps_transfer.sysinfo import SystemInfoCache, path_free_space
+from vps_transfer.tarstream import TarDownloader, TarUploader, remote_has_tar
+from vps_transfer.tracing import Tracer, channel_id
+from vps_transfer.verify import VERIFY_RETRIES, Verifier
+from vps_transfer.walker import WALK_CHANNELS, ChannelWorkers, RemoteWalker
+
+MIN_READ_WINDOW = 512 * 1024  # smallest download window under a bandwidth limit
+
+# One file of a recursive download, as handed to the channel workers
+RemoteFile = namedtuple('RemoteFile', ['remote_path', 'local_path', 'attributes'])
+
+
+class Job:
+    """
+    Base class for engine jobs. Callbacks are optional and may be called from
+    worker threads; events() offers the same reports as an iterator instead.
+    progress(percent) and stats(snapshot) are rate-limited by the job's
+    ProgressTracker; see vps_transfer.progress for the snapshot fields.
+    Subclasses implement execute(); run() wraps it in the job's trace span
+    and profiler (see vps_transfer.tracing) when those are switched on.
+    """
+
+    kind = "job"  # names the job's root span and its trace files
+
+    def __init__(self, log=None, progress=None, error=None, stats=None):
+        self.on_log = log
+        self.on_progress = progress
+        self.on_error = error
+        self.on_stats = stats
+        self.stop_event = threading.Event()
+        self.tracker = ProgressTracker(on_update=self.report)
+        self.tracer = Tracer(enabled=False)
+
+    def log(self, message, color="white"):
+        if self.on_log is not None:
+            self.on_log(message, color)
+
+    def progress(self, percentage):
+        if self.on_progress is not None:
+            self.on_progress(percentage)
+
+    def error(self, message):
+        if self.on_error is not None:
+            self.on_error(message)
+
+    def report(self, snapshot):
+        self.progress(snapshot['percent'])
+        if self.on_stats is not None:
+            self.on_stats(snapshot)
+
+    def use_limiter(self, params):
+        """Pace this job with the shared BandwidthLimiter in params, at the job's priority."""
+        self.tracker.limiter = params.get('limiter')
+        self.tracker.priority = PRIORITIES[params.get('priority', 'normal')]
+
+    def use_tracing(self, params):
+        """Trace this job's phases if params['trace'] is set and profile it per params['profile']."""
+        self.tracer = Tracer.from_params(params)
+
+    def finish_tracing(self):
+        """Write the trace and profile of a finished job and log where they went."""
+        try:
+            if self.tracer.enabled:
+                trace, summary = self.tracer.write(self.kind)
+                for line in self.tracer.summary().splitlines():
+                    self.log(line, "grey")
+                self.log(f"Trace: {trace} (summary in {summary})", "cyan")
+            if self.tracer.profiler is not None:
+                paths = self.tracer.profiler.write(self.kind)
+                label = "CPU" if self.tracer.profiler.mode == 'cpu' else "Memory"
+                self.log(f"{label} profile: {', '.join(paths)}", "cyan")
+        except Exception as e:
+            self.log(f"Could not write the trace or profile: {str(e)}", "yellow")
+
+    def read_window(self):
+        # Under a limit, request a quarter second's worth at a time so the callback's pacing reaches the wire
+        limiter = self.tracker.limiter
+        if limiter is None or not limiter.rate:
+            return None
+        return max(MIN_READ_WINDOW, int(limiter.rate * 0.25))
+
+    def check_stopped(self):
+        if self.stop_event.is_set():
+            raise TransferCancelled()
+
+    def create_verifier(self, conn, kind):
+        # Reports are named after the job's journal, so reruns of one job sort together
+        name = os.path.splitext(os.path.basename(self.journal.path))[0]
+        verifier = Verifier.for_connection(conn, kind, name=name, stop_event=self.stop_event, log=self.log)
+        self.log(f"Verify mode: checking every file with {verifier.algorithm} as it completes.", "cyan")
+        return verifier
+
+    def report_verification(self, description, on_failure):
+        """Log the verifier's summary and write its report; False after on_failure() if files still differ."""
+        report = self.verifier.write_report(description)
+        color = "green" if self.verifier.ok else "red" if self.verifier.mismatched else "yellow"
+        self.log(self.verifier.summary(), color)
+        self.log(f"Verification report: {report}", "grey")
+        if self.verifier.mismatched:
+            on_failure(f"{len(self.verifier.mismatched)} file(s) failed verification; see {report}")
+            return False
+        return True
+
+    def log_summary(self):
+        stats = self.tracker.snapshot()
+        self.log(
+            f"Transferred {stats['transferred'] / (1024 * 1024):.2f} MB and {stats['files_done']} files "
+            f"in {stats['elapsed']:.1f}s ({format_rate(stats['average_rate'])} average)",
+            "blue"
+        )
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        """Run the job in the calling thread and return its status."""
+        if not self.tracer.active:
+            return self.execute()
+        status = "error"
+        profiler = self.tracer.profiler
+        if profiler is not None:
+            profiler.start()
+        try:
+            with self.tracer.span(self.kind, category='job') as span:
+                status = self.tracer.wrap(self.execute)()
+                span.set(status=status)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            self.finish_tracing()
+        return status
+
+    def execute(self):
+        raise NotImplementedError
+
+    def events(self):
+        """
+        Run the job in a background thread and yield its reports as dicts:
+        {'event': 'log', 'message', 'color', 'level'}, {'event': 'progress', 'percent',
+        'transferred', 'total', 'rate', 'eta', 'files_done', 'files_per_sec'},
+        {'event': 'error', 'message'} and finally {'event': 'done', 'status'}.
+        Closing the iterator early stops the job.
+        """
+        events = queue.Queue()
+        self.on_log = lambda message, color="white": events.put(
+            {'event': 'log', 'message': message, 'color': color, 'level': LEVEL_NAMES[level_for(color)]}
+        )
+        self.on_progress = None
+        self.on_stats = lambda stats: events.put(dict(
+            {'event': 'progress'},
+            **{key: value for key, value in stats.items() if key not in ('active', 'average_rate', 'elapsed')}
+        ))
+        self.on_error = lambda message: events.put({'event': 'error', 'message': message})
+
+        def target():
+            status = "error"
+            try:
+                status = self.run()
+            except Exception as e:
+                events.put({'event': 'error', 'message': str(e)})
+            finally:
+                events.put({'event': 'done', 'status': status})
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        try:
+            while True:
+                event = events.get()
+                yield event
+                if event['event'] == 'done':
+                    return
+        finally:
+            self.stop()
+            thread.join()
+
+
+class UploadJob(Job):
+    """
+    Uploads the local files and directories in params['selected_files'] to
+    params['destination']. run() returns "success", "terminated", "failed"
+    when some files could not be uploaded, or "error" after reporting a fatal
+    error.
+    """
+
+    kind = "upload"
+
+    def __init__(self, params, log=None, progress=None, error=None, stats=None):
+        super().__init__(log, progress, error, stats)
+        self.use_limiter(params)
+        self.use_tracing(params)
+        self.params = params
+        self.ip = params['ip']
+        self.port = params['port']
+        self.username = params['username']
+        self.password = params['password']
+        self.destination = params['destination']
+        self.selected_files = params['selected_files']
+        self.selection_mode = params['selection_mode']
+        self.exclusions = params['exclusions']
+        self.parallel_channels = params.get('parallel_channels', 1)
+        self.ssh_sessions = params.get('ssh_sessions', 1)
+        self.transfer_mode = params.get('transfer_mode', 'sftp')  # 'sftp', 'tar' or 'async'
+        self.sync_mode = params.get('sync_mode', False)
+        self.sync_checksum = params.get('sync_checksum', False)
+        self.delta_mode = params.get('delta_mode', False)
+        self.resume = params.get('resume', False)
+        self.verify = params.get('verify', False)
+        self.verifier = None
+        # Content dedup: copies made on the server, optionally from a previous release directory
+        self.dedup_mode = params.get('dedup', False)
+        self.dedup_reference = params.get('dedup_reference') or None
+        self.dedup_link = params.get('dedup_link', 'copy')
+        self.deduplicator = None
+        self.sync_planner = None
+        self.duplicates = []
+        self.hardlinked = set()  # remote files sharing data with other paths, unlinked before being written
+        # CompressionAdvisor shared by all jobs, or None when compression is off
+        self.compression = params.get('compression')
+        # Shared SystemInfoCache, and the free space df reports for the destination
+        self.system_info = params.get('system_info') or SystemInfoCache()
+        self.free_space = None
+        self.space_checked = False
+        self._space_lock = threading.Lock()
+        self.journal = None
+        self.failures = 0  # files that failed to upload; their journal entries are kept for a resume
+        self.pool = params['pool']
+        self.segmenter = self.create_segmenter(params, self.tracker.advance)
+        self.delta = self.create_delta(self.tracker.advance)
+        self.compressor = self.create_compressor(self.tracker.advance)
+        self.sender = None
+        # Remote directories known to exist, so uploads skip per-file directory checks
+        self.directories = RemoteDirectoryCache(log=self.log, tracer=self.tracer)
+        self.common_path = ""  # Initialize as instance variable
+
+    def execute(self):
+        self.log("Starting file transfer...", "blue")
+        conn = None
+        try:
+            # Establish SSH connection (reused from the pool when already open)
+            self.log("Establishing SSH connection...", "cyan")
+            with self.tracer.span('connect', host=self.ip):
+                conn = self.pool.connect(self.ip, self.port, self.username, self.password)
+            # Leased for the whole job, so the pool never reaps or replaces it mid-transfer
+            conn.acquire()
+            self.log("SSH connection established.", "green")
+
+            # Server status and the destination's free space are probed in the background
+            self.start_system_probe(conn)
+
+            # Checkpoint journal, kept until the job finishes cleanly
+            self.journal = TransferJournal.for_job(
+                'upload', self.ip, self.port, self.username, self.selected_files, self.destination
+            )
+            if self.verify:
+                self.verifier = self.create_verifier(conn, 'upload')
+
+            with conn.sftp() as sftp:
+                # Check if destination directory exists, if not, create it
+                with self.tracer.span('destination', path=self.destination):
+                    try:
+                        sftp.chdir(self.destination)
+                        self.directories.mark(self.destination)
+                        self.log(f"Destination directory exists: {self.destination}", "green")
+                        self.find_hardlinks(conn)
+                    except IOError:
+                        self.log(
+                            f"Destination directory '{self.destination}' does not exist. Creating it...", "yellow"
+                        )
+                        self.directories.ensure(sftp, self.destination)
+                        self.log(f"Created directory: {self.destination}", "green")
+
+                # The progress total grows while the scanner walks the sources
+                # Start uploading
+                self.common_path = os.path.commonpath(self.selected_files)  # Define as instance variable
+                if os.path.isfile(self.common_path):
+                    # If the common path is a file, set the common directory
+                    self.common_path = os.path.dirname(self.common_path)
+
+                # In sync mode only new and changed files are handed to the uploaders
+                tasks = None
+                if self.sync_mode:
+                    with self.tracer.span('plan_sync'):
+                        tasks = self.plan_sync(conn, sftp)
+                if self.resume:
+                    with self.tracer.span('plan_resume'):
+                        tasks = self.plan_resume(tasks)
+                if self.dedup_mode:
+                    with self.tracer.span('plan_dedup'):
+                        tasks = self.plan_dedup(conn, sftp, tasks)
+                # A planned total is known in full; a streamed one is checked as the scan adds to it
+                self.check_free_space()
+
+                with self.tracer.span('transfer', mode=self.transfer_mode) as span:
+                    if self.transfer_mode == 'tar':
+                        completed = self.upload_tar(conn, sftp, tasks)
+                    elif self.transfer_mode == 'async':
+                        completed = self.upload_async(conn, sftp, tasks)
+                    elif self.parallel_channels > 1:
+                        completed = self.upload_parallel(conn, sftp, tasks)
+                    else:
+                        completed = self.upload_sequential(conn, sftp, tasks)
+                    span.set(bytes=self.tracker.transferred, files=self.tracker.files_done)
+                if completed and self.duplicates:
+                    with self.tracer.span('dedup_apply', files=len(self.duplicates)):
+                        completed = self.make_duplicates(conn, sftp)
+                if not completed:
+                    self.log("Transfer terminated by the user. Progress was saved; enable Resume to continue.", "yellow")
+                    return "terminated"
+                if self.verifier is not None and not self.verify_upload(conn, sftp):
+                    return "error"
+
+            self.tracker.update(force=True)
+            self.log_summary()
+            if self.sync_planner is not None:
+                self.log(self.sync_planner.summary(), "green")
+            if self.deduplicator is not None:
+                self.log(self.deduplicator.summary(), "blue")
+            self.log_pool_stats()
+            # A stop during the last file still reaches here, since cancelled uploads don't raise
+            if self.stop_event.is_set():
+                self.log("Transfer terminated by the user. Progress was saved; enable Resume to continue.", "yellow")
+                return "terminated"
+            if self.failures:
+                self.log(f"{self.failures} file(s) failed. Progress was saved; enable Resume to retry them.", "red")
+                self.error(f"{self.failures} file(s) failed to upload.")
+                return "failed"
+            self.journal.discard()
+            self.log("File transfer completed successfully.", "green")
+            return "success"
+        except Exception as e:
+            self.log(f"Error: {str(e)}", "red")
+            self.error(f"An error occurred: {str(e)}")
+            return "error"
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+            if self.verifier is not None:
+                self.verifier.close()
+            if conn is not None:
+                conn.release()
+
+    def verify_upload(self, conn, sftp):
+        """Send files whose remote hash differs again, up to VERIFY_RETRIES times; False if any still differ."""
+        for attempt in range(VERIFY_RETRIES + 1):
+            with self.tracer.span('verify_wait', attempt=attempt):
+                mismatched = self.verifier.finish()
+            if not mismatched or attempt == VERIFY_RETRIES or self.stop_event.is_set():
+                break
+            self.log(f"Verification: sending {len(mismatched)} mismatched file(s) again...", "yellow")
+            self.verifier.resending(mismatched)
+            tasks = [record.item for record in mismatched]
+            self.tracker.add_total(sum(task.size for task in tasks))
+            self.upload_tasks(conn, sftp, tasks)
+        return self.report_verification(
+            f"upload of {', '.join(self.selected_files)} to {self.destination}", self.error
+        )
+
+    def upload_tasks(self, conn, sftp, tasks):
+        """Upload a follow-up list of tasks; tar jobs send these over SFTP."""
+        if self.transfer_mode == 'async':
+            return self.upload_async(conn, sftp, tasks)
+        if self.parallel_channels > 1:
+            return self.upload_parallel(conn, sftp, tasks)
+        return self.upload_sequential(conn, sftp, tasks)
+
+    def plan_dedup(self, conn, sftp, tasks=None):
+        self.log("Dedup: looking for files with identical content...", "cyan")
+        self.deduplicator = Deduplicator(
+            conn, sftp, reference=self.dedup_reference, link=self.dedup_link,
+            stop_event=self.stop_event, log=self.log
+        )
+        tasks, self.duplicates = self.deduplicator.plan(self.iter_upload_tasks() if tasks is None else tasks)
+        self.tracker.set_total(sum(task.size for task in tasks))
+        return tasks
+
+    def make_duplicates(self, conn, sftp):
+        """Create the planned duplicates on the server; any that can't be made are uploaded instead."""
+        # A directory may hold nothing but duplicates
+        self.directories.create(conn, sftp, [posixpath.dirname(item.task.remote_path) for item in self.duplicates])
+        made, failed = self.deduplicator.apply(self.duplicates)
+        for item in made:
+            task = item.task
+            self.journal.mark_complete(task.remote_path, task.size, task.mtime or os.path.getmtime(task.local_path))
+            if self.sync_mode:
+                preserve_mtime(sftp, task.local_path, task.remote_path)
+            self.tracker.file_done(task.remote_path)
+            if self.verifier is not None:
+                # The dedup hash is SHA-256, so it stands in for the verifier's own when they agree
+                digest = item.digest if self.verifier.algorithm == 'sha256' else None
+                self.verifier.add(task.remote_path, task.local_path, digest, task)
+        self.log(f"Dedup: made {len(made)} duplicate(s) on the server.", "green")
+        if not failed:
+            return True
+        tasks = [item.task for item in failed]
+        self.tracker.add_total(sum(task.size for task in tasks))
+        return self.upload_tasks(conn, sftp, tasks)
+
+    def plan_sync(self, conn, sftp):
+        """The scan, filtered as it streams; the summary is logged once the transfer has consumed it."""
+        self.log("Sync mode: fetching remote file list...", "cyan")
+        index = RemoteIndex.fetch(conn, sftp, self.destination)
+        self.log(f"Remote index: {len(index.files)} files (via {index.source}).", "blue")
+        # Skipped files come back off the total the scanner added them to
+        self.sync_planner = SyncPlanner(
+            index, conn=conn, sftp=sftp, checksum=self.sync_checksum, log=self.log,
+            on_skip=lambda size: self.tracker.add_total(-size)
+        )
+        return self.sync_planner.filter(self.iter_upload_tasks())
+
+    def plan_resume(self, tasks=None):
+        if not self.journal.completed and not self.journal.partial:
+            self.log("Resume: no saved progress for this job, starting from scratch.", "yellow")
+            return tasks
+        remaining = []
+        skipped = 0
+        for task in self.iter_upload_tasks() if tasks is None else tasks:
+            if task.local_path is not None:
+                if self.journal.is_complete(task.remote_path, task.size, task.mtime):
+                    skipped += 1
+                    continue
+            remaining.append(task)
+        self.log(
+            f"Resume: skipping {skipped} completed files, "
+            f"{len(self.journal.partial)} partial file(s) will continue where they stopped.",
+            "green"
+        )
+        self.tracker.set_total(sum(task.size for task in remaining))
+        return remaining
+
+    def with_skeleton(self, conn, sftp, tasks=None):
+        """
+        The upload tasks, with the remote directories they need created in
+        batches ahead of them, and small and configuration files moved ahead
+        of bulk media.
+        """
+        if tasks is None:
+            tasks = prioritize(self.directories.prepare(conn, sftp, self.iter_upload_tasks()))
+        elif isinstance(tasks, list):
+            # A planned list is known in full, so its whole skeleton is built before the first file
+            tasks = prioritize(self.directories.prepare(conn, sftp, tasks, batch=max(1, len(tasks))))
+        else:
+            # A filtered stream (sync) is prepared in batches like the scan itself
+            tasks = prioritize(self.directories.prepare(conn, sftp, tasks))
+        if self.hardlinked:
+            return self.unlink_hardlinked(sftp, tasks)
+        return tasks
+
+    def find_hardlinks(self, conn):
+        if self.transfer_mode == 'tar':
+            # tar -x replaces existing files instead of writing into them
+            return
+        with self.tracer.span('hardlinks', path=self.destination):
+            self.hardlinked = remote_hardlinks(conn, self.destination)
+        if self.hardlinked:
+            self.log(
+                f"{len(self.hardlinked)} file(s) in {self.destination} are hard links; "
+                f"they are unlinked before being written, so the paths they share data with stay intact.",
+                "grey"
+            )
+
+    def unlink_hardlinked(self, sftp, tasks):
+        """Pass tasks through, removing a hard-linked target first so the upload can't write through the link."""
+        for task in tasks:
+            path = posixpath.normpath(task.remote_path)
+            if task.local_path is not None and path in self.hardlinked:
+                self.hardlinked.discard(path)
+                try:
+                    sftp.remove(path)
+                except IOError as e:
+                    self.log(f"Could not unlink hard link {path}: {str(e)}", "yellow")
+            yield task
+
+    def upload_sequential(self, conn, sftp, tasks=None):
+        for task in self.with_skeleton(conn, sftp, tasks):
+            if self.stop_event.is_set():
+                return False
+            if task.local_path is None:
+                self.directories.ensure(sftp, task.remote_path)
+            else:
+                self.upload_file(sftp, task.local_path, task.remote_path)
+        return True
+
+    def upload_parallel(self, conn, sftp, tasks=None):
+        self.log(
+            f"Uploading over {self.parallel_channels} parallel channels "
+            f"({self.ssh_sessions} SSH session(s))...",
+            "cyan"
+        )
+        uploader = ParallelUploader(
+            self.pool, self.ip, self.port, self.username, self.password,
+            channels=self.parallel_channels,
+            sessions=self.ssh_sessions,
+            stop_event=self.stop_event,
+            log=self.log,
+            tracker=self.tracker,
+            directories=self.directories,
+            preserve_mtime=self.sync_mode,
+            journal=self.journal,
+            resume=self.resume,
+            verifier=self.verifier,
+            tracer=self.tracer
+        )
+        uploader.segmenter = self.create_segmenter(self.params, self.tracker.advance)
+        uploader.delta = self.create_delta(self.tracker.advance)
+        uploader.compressor = self.create_compressor(self.tracker.advance)
+        completed = uploader.run(self.with_skeleton(conn, sftp, tasks))
+        self.log(f"Parallel upload finished: {uploader.files_done} files, {len(uploader.failures)} failed.", "blue")
+        self.failures += len(uploader.failures)
+        return completed
+
+    def upload_async(self, conn, sftp, tasks=None):
+        channels = self.parallel_channels if self.parallel_channels > 1 else ASYNC_CHANNELS
+        self.log(
+            f"Uploading with up to {MAX_IN_FLIGHT_FILES} files in flight over {channels} SFTP channel(s)...",
+            "cyan"
+        )
+        uploader = AsyncUploader(
+            self.pool, self.ip, self.port, self.username, self.password,
+            channels=channels,
+            stop_event=self.stop_event,
+            log=self.log,
+            tracker=self.tracker,
+            directories=self.directories,
+            journal=self.journal,
+            preserve_mtime=self.sync_mode,
+            special=self.file_sender().is_special,
+            upload_special=self.send_file_blocking,
+            verifier=self.verifier,
+            tracer=self.tracer
+        )
+        # The plan (scan, skeleton mkdirs, ordering) is iterated from the async core's executor
+        completed = run_async(uploader.run(self.with_skeleton(conn, sftp, tasks)), self.params.get('async_loop'))
+        self.log(f"Async upload finished: {uploader.files_done} files, {len(uploader.failures)} failed.", "blue")
+        self.failures += len(uploader.failures)
+        return completed
+
+    def upload_tar(self, conn, sftp, tasks=None):
+        if not remote_has_tar(conn):
+            self.log("tar is not available on the server. Falling back to SFTP.", "yellow")
+            if self.parallel_channels > 1:
+                return self.upload_parallel(conn, sftp, tasks)
+            return self.upload_sequential(conn, sftp, tasks)
+
+        tasks = self.iter_upload_tasks() if tasks is None else tasks
+        compress = False
+        if self.compression is not None and self.compression.remote_has_gzip(conn):
+            # One decision for the whole stream, from a sample of its first files
+            compress, tasks = self.compression.should_compress_tasks(tasks)
+            self.log(f"Tar stream compression: {'on' if compress else 'off'}", "cyan")
+        self.log(f"Streaming tar archive into {self.destination}...", "cyan")
+        uploader = TarUploader(
+            conn, stop_event=self.stop_event, log=self.log, progress=self.tracker.advance,
+            file_done=self.tracker.file_done, compress=compress, verifier=self.verifier
+        )
+        try:
+            with self.tracer.span('tar_stream', compress=compress):
+                uploader.upload(tasks, self.destination)
+        except TransferCancelled:
+            return False
+        return True
+
+    def iter_upload_tasks(self):
+        """
+        Streams an UploadTask for every directory and file below the selected
+        sources, applying the exclusions, from a single scanning pass.
+        """
+        return LocalScanner(
+            self.selected_files, self.common_path, self.destination, self.exclusions,
+            stop_event=self.stop_event,
+            log=self.log,
+            on_file=self.add_planned,
+            tracer=self.tracer
+        )
+
+    def create_segmenter(self, params, progress):
+        return SegmentedTransfer(
+            self.pool, self.ip, self.port, self.username, self.password,
+            segments=params.get('segments', 1),
+            sessions=self.ssh_sessions,
+            threshold=params.get('segment_threshold', 256) * 1024 * 1024,
+            stop_event=self.stop_event,
+            log=self.log,
+            progress=progress
+        )
+
+    def create_delta(self, progress):
+        if not self.delta_mode:
+            return None
+        return DeltaTransfer(
+            self.pool, self.ip, self.port, self.username, self.password,
+            stop_event=self.stop_event,
+            log=self.log,
+            progress=progress
+        )
+
+    def create_compressor(self, progress):
+        if self.compression is None:
+            return None
+        return CompressedTransfer(
+            self.pool, self.ip, self.port, self.username, self.password,
+            advisor=self.compression,
+            stop_event=self.stop_event,
+            log=self.log,
+            progress=progress
+        )
+
+    def upload_file(self, sftp, local_path, remote_path):
+        base_name = os.path.basename(local_path)
+        if base_name in self.exclusions:
+            self.log(f"Excluded file: {base_name}", "yellow")
+            return
+
+        try:
+            # Normally already created with the skeleton, so no round trip
+            self.directories.ensure(sftp, posixpath.dirname(remote_path))
+            local = os.stat(local_path)
+            task = UploadTask(local_path, remote_path, local.st_size, local.st_mtime)
+            digest = self.file_sender().send(sftp, task)
+            self.journal.mark_complete(remote_path, local.st_size, local.st_mtime)
+            self.tracker.file_done(remote_path)
+            if self.sync_mode:
+                preserve_mtime(sftp, local_path, remote_path)
+            if self.verifier is not None:
+                self.verifier.add(remote_path, local_path, digest, task)
+            self.log(f"Uploaded {base_name}", "green")
+        except TransferCancelled:
+            self.log("Transfer terminated during file upload.", "yellow")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"Failed to upload {base_name}: {str(e)}", "red")
+            self.error(f"Failed to upload {base_name}: {str(e)}")
+
+    def file_sender(self):
+        """The FileSender for this job's own channel: sequential uploads and the async core's special files."""
+        if self.sender is None:
+            # Built on first use, once the journal and verifier exist
+            self.sender = FileSender(
+                delta=self.delta, compressor=self.compressor, segmenter=self.segmenter, journal=self.journal,
+                resume=self.resume, verifier=self.verifier, tracker=self.tracker, stop_event=self.stop_event,
+                log=self.log, tracer=self.tracer
+            )
+        return self.sender
+
+    def send_file_blocking(self, task):
+        with self.pool.sftp(self.ip, self.port, self.username, self.password) as sftp:
+            return self.file_sender().send(sftp, task)
+
+    def log_pool_stats(self):
+        stats = self.pool.stats.snapshot()
+        self.log(
+            f"Connection pool: {stats['hits']} hits, {stats['misses']} misses, "
+            f"avg handshake {stats['avg_handshake_time']:.2f}s",
+            "grey"
+        )
+
+    def start_system_probe(self, conn):
+        """
+        Show the server's status from the cache, or probe it, and read the
+        destination's free space, all in the background without holding up
+        the transfer.
+        """
+        server = (self.ip, self.port, self.username)
+        info = self.system_info.get(server)
+        if info is not None:
+            self.show_system_info(info, cached=True)
+        else:
+            self.log("Fetching VPS system information in the background...", "cyan")
+
+        def probe():
+            if info is None:
+                try:
+                    with self.tracer.span('system_info'):
+                        fetched = self.system_info.fetch(conn, server)
+                except Exception as e:
+                    self.log(f"System information unavailable: {str(e)}", "yellow")
+                    return
+                self.show_system_info(fetched)
+            with self.tracer.span('free_space', path=self.destination):
+                self.free_space = path_free_space(conn, self.destination)
+            self.check_free_space()
+
+        threading.Thread(target=probe, daemon=True).start()
+
+    def show_system_info(self, info, cached=False):
+        for label, text in info.fields.items():
+            self.log(f"{label}: {text}", "blue")
+        for label, text in info.errors.items():
+            self.log(f"{label}: Error - {text}", "yellow")
+        source = f"cached {info.age():.0f}s ago" if cached else f"fetched in {info.elapsed:.2f}s"
+        self.log(f"System information {source}.", "green")
+
+    def add_planned(self, size):
+        self.tracker.add_total(size)
+        self.check_free_space()
+
+    def check_free_space(self):
+        """
+        Warn once the bytes to send exceed the space df reported for the
+        destination. Only a warning: files the upload overwrites give their
+        space back, and nothing here knows how many there are.
+        """
+        free = self.free_space
+        if free is None or self.tracker.total <= free:
+            return
+        with self._space_lock:
+            if self.space_checked:
+                return
+            self.space_checked = True
+        message = (
+            f"at least {self.tracker.total / (1024 * 1024):.2f} MB to upload to {self.destination}, "
+            f"but only {free / (1024 * 1024):.2f} MB is free there"
+        )
+        self.log(f"Free space may run out: {message}.", "yellow")
+
+
+class RemoteOperation(Job):
+    """
+    A download, delete, rename, create_dir, move, copy or size on the server.
+    Recursive work runs as one server-side command where the server allows it
+    (see RemoteCommands) and as an SFTP walk otherwise; the log says which ran
+    and for how long. run() returns "success", "terminated" after stop(), or
+    "failed" when any part of the operation went wrong.
+    """
+
+    def __init__(self, operation, params, log=None, progress=None, error=None, stats=None):
+        super().__init__(log, progress, error, stats)
+        self.use_limiter(params)
+        self.use_tracing(params)
+        self.operation = operation  # 'download', 'delete', 'rename', 'create_dir', 'move', 'copy', 'size'
+        self.kind = operation
+        self.params = params  # Dictionary containing necessary parameters
+        self.journal = None
+        self.verifier = None
+        self.failed = False
+        self.size = None  # result of a 'size' operation
+        self._commands = None
+
+    def execute(self):
+        try:
+            ip = self.params['ip']
+            port = self.params['port']
+            username = self.params['username']
+            password = self.params['password']
+            remote_path = self.params['remote_path']
+            local_destination = self.params.get('local_destination', '')
+            new_name = self.params.get('new_name', '')
+            move_destination = self.params.get('move_destination', '')
+            copy_destination = self.params.get('copy_destination', '')
+
+            pool = self.params['pool']
+            if self.operation == 'download':
+                self.journal = TransferJournal.for_job(
+                    'download', ip, port, username, [remote_path], local_destination
+                )
+
+            with self.tracer.span('connect', host=ip):
+                pool.connect(ip, port, username, password)
+            with pool.sftp(ip, port, username, password) as sftp, \
+                    self.tracer.span(self.operation, path=remote_path):
+                if self.operation == 'download':
+                    self.download(sftp, remote_path, local_destination)
+                elif self.operation == 'delete':
+                    self.delete(sftp, remote_path)
+                elif self.operation == 'rename':
+                    self.rename(sftp, remote_path, new_name)
+                elif self.operation == 'create_dir':
+                    self.create_directory(sftp, remote_path)
+                elif self.operation == 'move':
+                    self.move(sftp, remote_path, move_destination)
+                elif self.operation == 'copy':
+                    self.copy(sftp, remote_path, copy_destination)
+                elif self.operation == 'size':
+                    self.measure(sftp, remote_path)
+
+            if self.journal is not None:
+                # Keep the journal after a failed or stopped download so it can be resumed
+                if self.failed or self.stop_event.is_set():
+                    self.journal.close()
+                else:
+                    self.journal.discard()
+            if self.stop_event.is_set():
+                self.log(f"{self.operation.capitalize()} operation terminated by the user.", "yellow")
+                return "terminated"
+            if not self.failed:
+                self.log(f"{self.operation.capitalize()} operation completed successfully.", "green")
+        except Exception as e:
+            if self.journal is not None:
+                self.journal.close()
+            self.fail(f"Error during {self.operation}: {str(e)}")
+        return "failed" if self.failed else "success"
+
+    def fail(self, message):
+        self.failed = True
+        self.log(message, "red")
+
+    def changed_paths(self):
+        """Remote directories whose listing changed, and paths that went away."""
+        remote_path = self.params['remote_path']
+        parent = posixpath.dirname(remote_path)
+        if self.operation in ('delete', 'rename'):
+            return [parent], [remote_path]
+        if self.operation == 'create_dir':
+            return [parent], []
+        if self.operation == 'move':
+            return [parent, self.params.get('move_destination', '')], [remote_path]
+        if self.operation == 'copy':
+            return [self.params.get('copy_destination', '')], []
+        return [], []
+
+    def download(self, sftp, remote_path, local_destination):
+        try:
+            if self.params.get('verify'):
+                self.verifier = self.create_verifier(self.connect(), 'download')
+            if self.is_dir(sftp, remote_path):
+                # find gives the progress bar its total up front; without it the walk adds it up as it goes
+                with self.tracer.span('total_size', method='find'):
+                    total = self.commands().size(remote_path)
+                self.tracker.set_total(total or 0)
+                on_file = self.tracker.add_total if total is None else None
+                if self.params.get('transfer_mode') == 'tar':
+                    self.tar_download(sftp, remote_path, local_destination, on_file=on_file)
+                else:
+                    self.recursive_download(sftp, remote_path, local_destination, on_file=on_file)
+            else:
+                filename = os.path.basename(remote_path)
+                local_path = os.path.join(local_destination, filename)
+                attributes = sftp.stat(remote_path)
+                self.tracker.set_total(attributes.st_size)
+                self.download_file(sftp, remote_path, local_path, attributes)
+                self.log(f"Downloaded: {remote_path}", "green")
+            if self.verifier is not None and not self.stop_event.is_set():
+                self.verify_download(remote_path, local_destination)
+            self.tracker.update(force=True)
+            self.log_summary()
+        except TransferCancelled:
+            # Stopped from the job queue; run() reports it
+            pass
+        except Exception as e:
+            self.fail(f"Failed to download {remote_path}: {str(e)}")
+        finally:
+            if self.verifier is not None:
+                self.verifier.close()
+
+    def verify_download(self, remote_path, local_destination):
+        """Download files whose local hash differs again, up to VERIFY_RETRIES times."""
+        def download(channel, item):
+            attributes = item.attributes or channel.stat(item.remote_path)
+            self.download_file(channel, item.remote_path, item.local_path, attributes, again=True)
+            self.log(f"Downloaded again: {item.remote_path}", "grey")
+
+        for attempt in range(VERIFY_RETRIES + 1):
+            with self.tracer.span('verify_wait', attempt=attempt):
+                mismatched = self.verifier.finish()
+            if not mismatched or attempt == VERIFY_RETRIES or self.stop_event.is_set():
+                break
+            self.log(f"Verification: downloading {len(mismatched)} mismatched file(s) again...", "yellow")
+            self.verifier.resending(mismatched)
+            self.channel_workers("download").run([record.item for record in mismatched], download)
+        self.report_verification(f"download of {remote_path} to {local_destination}", self.fail)
+
+    def connect(self):
+        return self.params['pool'].connect(
+            self.params['ip'], self.params['port'], self.params['username'], self.params['password']
+        )
+
+    def commands(self):
+        if self._commands is None:
+            self._commands = RemoteCommands(self.connect(), log=self.log)
+        return self._commands
+
+    def walker(self, root, on_file=None):
+        return RemoteWalker(
+            self.params['pool'], self.params['ip'], self.params['port'],
+            self.params['username'], self.params['password'], root,
+            channels=self.params.get('parallel_channels') or WALK_CHANNELS,
+            stop_event=self.stop_event,
+            log=self.log,
+            on_file=on_file,
+            tracer=self.tracer
+        )
+
+    def channel_workers(self, action):
+        def on_error(item, error):
+            if not isinstance(error, TransferCancelled):
+                self.fail(f"Failed to {action} {getattr(item, 'remote_path', item)}: {str(error)}")
+        return ChannelWorkers(
+            self.params['pool'], self.params['ip'], self.params['port'],
+            self.params['username'], self.params['password'],
+            channels=self.params.get('parallel_channels') or WALK_CHANNELS,
+            stop_event=self.stop_event,
+            log=self.log,
+            on_error=on_error,
+            tracer=self.tracer
+        )
+
+    def log_done(self, message, method, started):
+        self.log(f"{message} (via {method} in {time.perf_counter() - started:.2f}s)", "green")
+
+    def download_file(self, sftp, remote_path, local_path, attributes, again=False):
+        # A file downloaded `again` after failing verification never resumes
+        resume = self.params.get('resume', False) and not again
+        if resume and self.journal.is_complete(local_path, attributes.st_size, attributes.st_mtime) \
+                and os.path.exists(local_path):
+            self.log(f"Already downloaded: {remote_path}", "grey")
+            self.tracker.skip(attributes.st_size)
+            return
+        segmenter = self.create_segmenter()
+        compressor = self.create_compressor()
+        digest = None
+        with self.tracer.span(
+                'download_file', category='file', path=remote_path, bytes=attributes.st_size,
+                channel=channel_id(sftp)) as span:
+            if compressor is not None and \
+                    compressor.should_download_compressed(sftp, remote_path, attributes.st_size):
+                span.set(method='compressed')
+                self.journal.mark_started(local_path)
+                compressor.download(remote_path, local_path)
+            elif segmenter.applies_to(attributes.st_size):
+                span.set(method='segmented')
+                self.journal.mark_started(local_path)
+                segmenter.download(remote_path, local_path)
+            else:
+                callback = self.tracker.file_callback(local_path, attributes.st_size, self.check_stopped)
+                hasher = self.verifier.hasher() if self.verifier is not None else None
+                offset = get_file(
+                    sftp, remote_path, local_path, callback=callback, journal=self.journal, resume=resume,
+                    window=self.read_window(), hasher=hasher
+                )
+                span.set(method='get', bytes=attributes.st_size - offset)
+                if offset:
+                    self.log(f"Resumed {remote_path} from {offset / (1024 * 1024):.2f} MB", "cyan")
+                    self.tracker.skip(offset)
+                if hasher is not None:
+                    digest = hasher.hexdigest()
+        self.journal.mark_complete(local_path, attributes.st_size, attributes.st_mtime)
+        self.tracker.file_done(local_path)
+        if self.verifier is not None:
+            self.verifier.add(remote_path, local_path, digest, RemoteFile(remote_path, local_path, attributes))
+
+    def create_segmenter(self):
+        return SegmentedTransfer(
+            self.params['pool'], self.params['ip'], self.params['port'],
+            self.params['username'], self.params['password'],
+            segments=self.params.get('segments', 1),
+            threshold=self.params.get('segment_threshold', 256) * 1024 * 1024,
+            stop_event=self.stop_event,
+            log=self.log,
+            progress=self.tracker.advance
+        )
+
+    def create_compressor(self):
+        if self.params.get('compression') is None:
+            return None
+        return CompressedTransfer(
+            self.params['pool'], self.params['ip'], self.params['port'],
+            self.params['username'], self.params['password'],
+            advisor=self.params['compression'],
+            stop_event=self.stop_event,
+            log=self.log,
+            progress=self.tracker.advance
+        )
+
+    def tar_download(self, sftp, remote_dir, local_dir, on_file=None):
+        conn = self.connect()
+        if not remote_has_tar(conn):
+            self.log("tar is not available on the server. Falling back to SFTP.", "yellow")
+            self.recursive_download(sftp, remote_dir, local_dir, on_file=on_file)
+            return
+
+        def file_done(name):
+            self.tracker.file_done(name)
+            if self.verifier is not None:
+                # Extracted by tarfile, so the local copy is hashed by the verifier
+                relative = posixpath.normpath(name)
+                remote_path = posixpath.join(remote_dir, relative)
+                local_path = os.path.join(local_dir, *relative.split('/'))
+                self.verifier.add(remote_path, local_path, None, RemoteFile(remote_path, local_path, None))
+
+        downloader = TarDownloader(
+            conn, stop_event=self.stop_event, log=self.log, progress=self.tracker.advance,
+            file_done=file_done
+        )
+        with self.tracer.span('tar_stream', path=remote_dir) as span:
+            downloader.download(remote_dir, local_dir)
+            span.set(bytes=self.tracker.transferred, files=self.tracker.files_done)
+        self.log(f"Downloaded: {remote_dir} ({self.tracker.transferred / (1024 * 1024):.2f} MB)", "green")
+
+    def recursive_download(self, sftp, remote_dir, local_dir, on_file=None):
+        """Download a tree, listing it and fetching its files over several channels at once."""
+        try:
+            os.makedirs(local_dir, exist_ok=True)
+            walker = self.walker(remote_dir, on_file=on_file)
+
+            def files():
+                for entry in walker:
+                    local_path = os.path.join(local_dir, *entry.relative.split('/'))
+                    if entry.is_dir:
+                        # Directories arrive before their contents
+                        os.makedirs(local_path, exist_ok=True)
+                    else:
+                        yield RemoteFile(entry.path, local_path, entry.attributes)
+
+            def download(channel, item):
+                self.download_file(channel, item.remote_path, item.local_path, item.attributes)
+                self.log(f"Downloaded: {item.remote_path}", "grey")
+
+            self.channel_workers("download").run(files(), download)
+            if walker.errors:
+                self.fail(f"{len(walker.errors)} director(ies) below {remote_dir} could not be listed")
+        except Exception as e:
+            self.fail(f"Failed to download directory {remote_dir}: {str(e)}")
+
+    def delete(self, sftp, remote_path):
+        try:
+            validate_remote_path(remote_path, destructive=True)
+            started = time.perf_counter()
+            if not self.is_dir(sftp, remote_path):
+                sftp.remove(remote_path)
+                self.log_done(f"Deleted: {remote_path}", "SFTP", started)
+            elif self.commands().remove_tree(remote_path):
+                self.log_done(f"Deleted directory: {remote_path}", "rm -rf", started)
+            else:
+                self.recursive_delete(sftp, remote_path)
+                if not self.failed:
+                    self.log_done(f"Deleted directory: {remote_path}", "SFTP walk", started)
+        except Exception as e:
+            self.fail(f"Failed to delete {remote_path}: {str(e)}")
+
+    def rename(self, sftp, remote_path, new_name):
+        try:
+            base_dir = os.path.dirname(remote_path)
+            new_remote_path = os.path.join(base_dir, new_name).replace('\\', '/')
+            sftp.rename(remote_path, new_remote_path)
+            self.log(f"Renamed to: {new_remote_path}", "green")
+        except Exception as e:
+            self.fail(f"Failed to rename {remote_path}: {str(e)}")
+
+    def create_directory(self, sftp, remote_path):
+        try:
+            sftp.mkdir(remote_path)
+            self.log(f"Created directory: {remote_path}", "green")
+        except Exception as e:
+            self.fail(f"Failed to create directory {remote_path}: {str(e)}")
+
+    def move(self, sftp, remote_path, move_destination):
+        try:
+            item_name = os.path.basename(remote_path)
+            new_remote_path = os.path.join(move_destination, item_name).replace('\\', '/')
+            validate_remote_path(new_remote_path)
+            started = time.perf_counter()
+            try:
+                # An SFTP rename is already a single server-side call
+                sftp.rename(remote_path, new_remote_path)
+                method = "SFTP rename"
+            except IOError:
+                # It can't cross filesystems; mv copies and removes on the server
+                if not self.commands().move(remote_path, new_remote_path):
+                    raise
+                method = "mv"
+            self.log_done(f"Moved to: {new_remote_path}", method, started)
+        except Exception as e:
+            self.fail(f"Failed to move {remote_path}: {str(e)}")
+
+    def copy(self, sftp, remote_path, copy_destination):
+        try:
+            item_name = posixpath.basename(remote_path.rstrip('/'))
+            new_remote_path = posixpath.join(copy_destination, item_name)
+            validate_remote_path(new_remote_path)
+            if self.exists(sftp, new_remote_path):
+                raise IOError(f"{new_remote_path} already exists")
+            started = time.perf_counter()
+            if self.commands().copy(remote_path, new_remote_path):
+                method = "cp -a"
+            else:
+                self.sftp_copy(sftp, remote_path, new_remote_path)
+                method = "SFTP"
+            self.log_done(f"Copied to: {new_remote_path}", method, started)
+        except Exception as e:
+            self.fail(f"Failed to copy {remote_path}: {str(e)}")
+
+    def measure(self, sftp, remote_path):
+        try:
+            started = time.perf_counter()
+            with self.tracer.span('total_size', method='find'):
+                self.size = self.commands().size(remote_path)
+            method = "find -type f"
+            if self.size is None:
+                with self.tracer.span('total_size', method='walk'):
+                    self.size = self.sftp_size(sftp, remote_path)
+                method = "SFTP walk"
+            self.log_done(f"Size of {remote_path}: {self.size / (1024 * 1024):.2f} MB", method, started)
+        except Exception as e:
+            self.fail(f"Failed to measure {remote_path}: {str(e)}")
+
+    def exists(self, sftp, path):
+        try:
+            sftp.stat(path)
+            return True
+        except IOError:
+            return False
+
+    def sftp_copy(self, sftp, source, target):
+        """Copy a file or tree through this client, keeping modes and times (SFTP has no copy request)."""
+        attributes = sftp.stat(source)
+        if stat.S_ISDIR(attributes.st_mode):
+            sftp.mkdir(target)
+            for item in sftp.listdir_attr(source):
+                self.check_stopped()
+                self.sftp_copy(sftp, posixpath.join(source, item.filename), posixpath.join(target, item.filename))
+        else:
+            with sftp.open(source, 'rb') as reader, sftp.open(target, 'wb') as writer:
+                reader.prefetch(attributes.st_size)
+                while True:
+                    chunk = reader.read(32768)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+            self.log(f"Copied: {source}", "grey")
+        sftp.chmod(target, stat.S_IMODE(attributes.st_mode))
+        sftp.utime(target, (attributes.st_atime, attributes.st_mtime))
+
+    def sftp_size(self, sftp, remote_path):
+        attributes = sftp.stat(remote_path)
+        if not stat.S_ISDIR(attributes.st_mode):
+            return attributes.st_size
+        walker = self.walker(remote_path)
+        for _entry in walker:
+            pass
+        self.check_stopped()
+        return walker.total_size
+
+    def is_dir(self, sftp, path):
+        try:
+            return stat.S_ISDIR(sftp.stat(path).st_mode)
+        except IOError:
+            return False
+
+    def recursive_delete(self, sftp, remote_dir):
+        """Remove a tree over several channels: every file first, then directories deepest first."""
+        try:
+            directories = [remote_dir]
+            walker = self.walker(remote_dir)
+
+            def files():
+                for entry in walker:
+                    if entry.is_dir:
+                        directories.append(entry.path)
+                    else:
+                        yield entry.path
+
+            def remove(channel, path):
+                channel.remove(path)
+                self.log(f"Deleted: {path}", "grey")
+
+            def remove_directory(channel, path):
+                channel.rmdir(path)
+                self.log(f"Deleted directory: {path}", "grey")
+
+            workers = self.channel_workers("delete")
+            if not workers.run(files(), remove):
+                return
+            # Directories at the same depth never contain each other
+            levels = {}
+            for directory in directories:
+                levels.setdefault(directory.count('/'), []).append(directory)
+            for depth in sorted(levels, reverse=True):
+                if not workers.run(levels[depth], remove_directory):
+                    return
+        except Exception as e:
+            self.fail(f"Failed to delete directory {remote_dir}: {str(e)}")
+
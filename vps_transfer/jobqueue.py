@@ -0,0 +1,188 @@
+"""
+Concurrent job queue.
+
+The GUI used to hold one global "processing" flag: any upload or remote
+operation locked the whole window, and a multi-item download or delete started
+one unbounded thread per item, the first of which to finish unlocked the
+window while the rest were still running. JobQueue runs engine jobs (UploadJob,
+RemoteOperation, anything with run() and stop()) on at most `max_workers`
+threads and queues the rest, so uploads and downloads can be queued side by
+side while the window stays usable. Each entry keeps its own state, progress
+and cancel; nothing here imports PyQt6.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+MAX_WORKERS = 2
+
+
+class QueuedJob:
+    """
+    One entry of a JobQueue. `job` is the engine job; `status` is what its
+    run() returned and `error` the last error it reported, if any.
+    """
+
+    def __init__(self, job_id, job, description, kind=""):
+        self.id = job_id
+        self.job = job
+        self.description = description
+        self.kind = kind
+        self.state = QUEUED
+        self.status = None
+        self.error = None
+        self.cancel_requested = False
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.state in FINISHED
+
+    def snapshot(self):
+        """The job's progress counters, or None for jobs without a tracker."""
+        tracker = getattr(self.job, 'tracker', None)
+        return tracker.snapshot() if tracker is not None else None
+
+
+class JobQueue:
+    """
+    Runs submitted jobs in order, `max_workers` at a time. `on_change(entry)`
+    is called from whichever thread changed an entry's state (the caller's for
+    submit and cancel, a worker's for start and finish).
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, on_change=None):
+        self.max_workers = max(1, int(max_workers))
+        self.on_change = on_change or (lambda entry: None)
+        self._entries = []
+        self._pending = deque()
+        self._running = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, job, description, kind=""):
+        entry = QueuedJob(next(self._ids), job, description, kind)
+        if hasattr(job, 'on_error'):
+            # Keep the job's own error callback and remember the message for the queue view
+            report = job.on_error
+
+            def on_error(message):
+                entry.error = message
+                if report is not None:
+                    report(message)
+            job.on_error = on_error
+        with self._lock:
+            self._entries.append(entry)
+            self._pending.append(entry)
+        self.on_change(entry)
+        self._dispatch()
+        return entry
+
+    def set_max_workers(self, count):
+        """Takes effect at once for queued jobs; running ones are never interrupted."""
+        with self._lock:
+            self.max_workers = max(1, int(count))
+        self._dispatch()
+
+    def cancel(self, job_id):
+        """Drop a queued job, or stop a running one. Returns False if it already finished."""
+        with self._lock:
+            entry = self._find(job_id)
+            if entry is None or entry.finished:
+                return False
+            entry.cancel_requested = True
+            if entry.state == QUEUED:
+                self._pending.remove(entry)
+                self._finish(entry, CANCELLED)
+                self._idle.notify_all()
+            else:
+                entry.job.stop()
+                entry = None
+        if entry is not None:
+            self.on_change(entry)
+        return True
+
+    def cancel_all(self):
+        for entry in self.jobs():
+            if not entry.finished:
+                self.cancel(entry.id)
+
+    def clear_finished(self):
+        with self._lock:
+            self._entries = [entry for entry in self._entries if not entry.finished]
+
+    def jobs(self):
+        """Every entry not yet cleared, oldest first."""
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._find(job_id)
+
+    def active(self):
+        """Number of jobs queued or running."""
+        with self._lock:
+            return len(self._pending) + self._running
+
+    def wait(self, timeout=None):
+        """Block until nothing is queued or running; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def _find(self, job_id):
+        for entry in self._entries:
+            if entry.id == job_id:
+                return entry
+        return None
+
+    @staticmethod
+    def _finish(entry, state):
+        entry.state = state
+        entry.finished_at = time.time()
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            while self._pending and self._running < self.max_workers:
+                entry = self._pending.popleft()
+                entry.state = RUNNING
+                entry.started_at = time.time()
+                self._running += 1
+                started.append(entry)
+        for entry in started:
+            self.on_change(entry)
+            threading.Thread(target=self._run, args=(entry,), daemon=True).start()
+
+    def _run(self, entry):
+        status = "error"
+        try:
+            status = entry.job.run()
+        except Exception as e:
+            entry.error = str(e)
+        finally:
+            with self._lock:
+                entry.status = status
+                if status == "success":
+                    state = DONE
+                elif entry.cancel_requested or status == "terminated":
+                    state = CANCELLED
+                else:
+                    state = FAILED
+                self._finish(entry, state)
+                self._running -= 1
+                self._idle.notify_all()
+            self.on_change(entry)
+            self._dispatch()
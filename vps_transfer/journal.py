@@ -0,0 +1,286 @@
+"""
+Checkpoint journal for resumable transfers.
+
+Every job appends to a small JSON-lines journal (one record per started,
+progressed or completed file) kept under ~/.vps_transfer/journals, named after
+a hash of the job's endpoints. A job that finishes cleanly deletes its
+journal; one that is terminated or loses its link leaves it behind, and the
+next run in resume mode skips the files recorded as complete and continues
+partial ones from where the destination file currently ends.
+"""
+import hashlib
+import json
+import os
+import threading
+
+PROGRESS_EVERY = 16 * 1024 * 1024
+TAIL_CHECK_SIZE = 64 * 1024
+COPY_BLOCK = 1024 * 1024
+
+
+def journal_dir():
+    base = os.environ.get('VPS_TRANSFER_HOME') or os.path.join(os.path.expanduser('~'), '.vps_transfer')
+    return os.path.join(base, 'journals')
+
+
+def job_id(kind, host, port, username, sources, destination):
+    """Stable identifier for a job, so a rerun of the same job finds its journal."""
+    key = json.dumps([kind, host, str(port), username, sorted(sources), destination])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:20]
+
+
+class TransferJournal:
+    """Append-only record of per-file progress for one job."""
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}  # path -> (size, mtime)
+        self.partial = {}    # path -> last recorded offset
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    @classmethod
+    def for_job(cls, kind, host, port, username, sources, destination):
+        directory = journal_dir()
+        os.makedirs(directory, exist_ok=True)
+        name = f"{kind}-{job_id(kind, host, port, username, sources, destination)}.jsonl"
+        return cls(os.path.join(directory, name))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash; everything before it is valid
+                    continue
+                path = record.get('path')
+                if record.get('event') == 'complete':
+                    self.completed[path] = (record['size'], record['mtime'])
+                    self.partial.pop(path, None)
+                elif record.get('event') in ('start', 'progress'):
+                    self.completed.pop(path, None)
+                    self.partial[path] = record.get('offset', 0)
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def is_complete(self, path, size, mtime):
+        return self.completed.get(path) == (size, int(mtime))
+
+    def is_partial(self, path):
+        return path in self.partial
+
+    def mark_started(self, path):
+        self.partial.setdefault(path, 0)
+        self._append({'event': 'start', 'path': path})
+
+    def mark_progress(self, path, offset):
+        self.partial[path] = offset
+        self._append({'event': 'progress', 'path': path, 'offset': offset})
+
+    def mark_complete(self, path, size, mtime):
+        self.partial.pop(path, None)
+        self.completed[path] = (size, int(mtime))
+        self._append({'event': 'complete', 'path': path, 'size': size, 'mtime': int(mtime)})
+
+    def progress_callback(self, path, callback=None, base=0):
+        """Wrap a paramiko-style callback so partial offsets get checkpointed."""
+        last = [base]
+
+        def wrapped(transferred, total):
+            offset = base + transferred
+            if offset - last[0] >= PROGRESS_EVERY:
+                last[0] = offset
+                self.mark_progress(path, offset)
+            if callback is not None:
+                callback(transferred, total)
+        return wrapped
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """Remove the journal once its job has finished cleanly."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _read_tail(fileobj, offset, length):
+    start = max(0, offset - length)
+    fileobj.seek(start)
+    return fileobj.read(offset - start)
+
+
+def tails_match(sftp, local_path, remote_path, offset, length=TAIL_CHECK_SIZE):
+    """Compare the bytes just before `offset` in the local and remote copies."""
+    with open(local_path, 'rb') as local, sftp.open(remote_path, 'rb') as remote:
+        local_tail = _read_tail(local, offset, length)
+        remote_tail = _read_tail(remote, offset, length)
+    return hashlib.sha256(local_tail).digest() == hashlib.sha256(remote_tail).digest()
+
+
+def upload_resume_offset(sftp, local_path, remote_path, verify_tail=True):
+    """
+    Offset an interrupted upload can continue from: the remote file's current
+    size, provided it is no larger than the local file and (optionally) its
+    tail matches. Returns 0 when the file has to start over.
+    """
+    try:
+        remote_size = sftp.stat(remote_path).st_size
+    except IOError:
+        return 0
+    local_size = os.path.getsize(local_path)
+    if remote_size <= 0 or remote_size > local_size:
+        return 0
+    if verify_tail and not tails_match(sftp, local_path, remote_path, remote_size):
+        return 0
+    return remote_size
+
+
+def download_resume_offset(sftp, remote_path, local_path, verify_tail=True):
+    """Download counterpart of upload_resume_offset, based on the local file's size."""
+    if not os.path.exists(local_path):
+        return 0
+    local_size = os.path.getsize(local_path)
+    remote_size = sftp.stat(remote_path).st_size
+    if local_size <= 0 or local_size > remote_size:
+        return 0
+    if verify_tail and not tails_match(sftp, local_path, remote_path, local_size):
+        return 0
+    return local_size
+
+
+def put_from(sftp, local_path, remote_path, offset, callback=None, hasher=None):
+    """
+    Upload the part of local_path after `offset`, appending to the remote file.
+    A `hasher` (hashlib-style) is fed the whole local file, prefix included.
+    """
+    size = os.path.getsize(local_path)
+    with open(local_path, 'rb') as source, sftp.open(remote_path, 'r+b' if offset else 'wb') as target:
+        target.set_pipelined(True)
+        if hasher is not None and offset:
+            _hash_prefix(source, offset, hasher)
+        source.seek(offset)
+        target.seek(offset)
+        transferred = 0
+        for block in iter(lambda: source.read(COPY_BLOCK), b''):
+            if hasher is not None:
+                hasher.update(block)
+            target.write(block)
+            transferred += len(block)
+            if callback is not None:
+                callback(transferred, size - offset)
+    return size
+
+
+def get_from(sftp, remote_path, local_path, offset, callback=None, window=None, hasher=None):
+    """
+    Download the part of remote_path after `offset`, appending to the local
+    file. With a `window` (bytes) at most that much is requested at a time
+    instead of prefetching the whole file, so that pacing in the callback
+    also paces the network. A `hasher` is fed the whole local file.
+    """
+    with sftp.open(remote_path, 'rb') as source, open(local_path, 'r+b' if offset else 'wb') as target:
+        size = source.stat().st_size
+        if hasher is not None and offset:
+            _hash_prefix(target, offset, hasher)
+        target.seek(offset)
+        target.truncate()
+        if window is None:
+            source.seek(offset)
+            source.prefetch(size)
+            blocks = iter(lambda: source.read(COPY_BLOCK), b'')
+        else:
+            blocks = _read_windows(source, offset, size, window)
+        transferred = 0
+        for block in blocks:
+            if hasher is not None:
+                hasher.update(block)
+            target.write(block)
+            transferred += len(block)
+            if callback is not None:
+                callback(transferred, size - offset)
+    return size
+
+
+def _hash_prefix(fileobj, length, hasher):
+    # The part a resumed transfer skips still belongs in the file's hash
+    fileobj.seek(0)
+    while length > 0:
+        block = fileobj.read(min(COPY_BLOCK, length))
+        if not block:
+            break
+        hasher.update(block)
+        length -= len(block)
+
+
+def _read_windows(source, offset, size, window):
+    for start in range(offset, size, window):
+        end = min(size, start + window)
+        # readv pipelines the reads of one window
+        for block in source.readv([(position, min(COPY_BLOCK, end - position))
+                                   for position in range(start, end, COPY_BLOCK)]):
+            yield block
+
+
+def put_file(sftp, local_path, remote_path, callback=None, journal=None, resume=False, hasher=None):
+    """
+    sftp.put with checkpointing. In resume mode a file the journal recorded as
+    started continues from the remote file's current size. With a `hasher`
+    the local file is hashed as it is read. Returns the offset the upload
+    started from.
+    """
+    if journal is None:
+        if hasher is not None:
+            put_from(sftp, local_path, remote_path, 0, callback, hasher)
+        else:
+            sftp.put(local_path, remote_path, callback=callback)
+        return 0
+    offset = 0
+    if resume and journal.is_partial(remote_path):
+        offset = upload_resume_offset(sftp, local_path, remote_path)
+    journal.mark_started(remote_path)
+    callback = journal.progress_callback(remote_path, callback, offset)
+    if offset or hasher is not None:
+        put_from(sftp, local_path, remote_path, offset, callback, hasher)
+    else:
+        sftp.put(local_path, remote_path, callback=callback)
+    return offset
+
+
+def get_file(sftp, remote_path, local_path, callback=None, journal=None, resume=False, window=None, hasher=None):
+    """
+    Download counterpart of put_file; journal entries are keyed by local path.
+    A `window` bounds the bytes requested ahead (see get_from): paramiko's get
+    requests the whole file at once, which no bandwidth limit could slow down.
+    """
+    if journal is None:
+        if window is not None or hasher is not None:
+            get_from(sftp, remote_path, local_path, 0, callback, window, hasher)
+        else:
+            sftp.get(remote_path, local_path, callback=callback)
+        return 0
+    offset = 0
+    if resume and journal.is_partial(local_path):
+        offset = download_resume_offset(sftp, remote_path, local_path)
+    journal.mark_started(local_path)
+    callback = journal.progress_callback(local_path, callback, offset)
+    if offset or window is not None or hasher is not None:
+        get_from(sftp, remote_path, local_path, offset, callback, window, hasher)
+    else:
+        sftp.get(remote_path, local_path, callback=callback)
+    return offset
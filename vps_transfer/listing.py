@@ -0,0 +1,87 @@
+"""
+Remote directory listing cache.
+
+The Remote Explorer lists a directory every time a node is expanded and used to
+re-list the whole tree after every remote operation. Listings are now kept in
+memory per server and path for a short TTL, evicted least-recently-used, and
+invalidated for exactly the paths an operation touched.
+"""
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+
+LISTING_TTL = 30
+MAX_LISTINGS = 512
+
+
+def normalize(path):
+    return posixpath.normpath(path) if path else '/'
+
+
+class ListingCache:
+    """listdir_attr results keyed by (host, port, username, path)."""
+
+    def __init__(self, ttl=LISTING_TTL, max_entries=MAX_LISTINGS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (fetched_at, entries)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(server, path):
+        host, port, username = server
+        return (host, str(port), username, normalize(path))
+
+    def get(self, server, path):
+        key = self.make_key(server, path)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or time.monotonic() - cached[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, server, path, entries):
+        key = self.make_key(server, path)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(entries))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def listdir_attr(self, sftp, server, path):
+        """Cached sftp.listdir_attr(path)."""
+        entries = self.get(server, path)
+        if entries is None:
+            entries = sftp.listdir_attr(path)
+            self.put(server, path, entries)
+        return entries
+
+    def invalidate(self, server, path):
+        with self._lock:
+            self._entries.pop(self.make_key(server, path), None)
+
+    def invalidate_tree(self, server, path):
+        """Drop the listing of `path` and of everything below it."""
+        root = self.make_key(server, path)
+        prefix = root[3].rstrip('/') + '/'
+        with self._lock:
+            stale = [key for key in self._entries
+                     if key[:3] == root[:3] and (key[3] == root[3] or key[3].startswith(prefix))]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self, server=None):
+        with self._lock:
+            if server is None:
+                self._entries.clear()
+                return
+            prefix = self.make_key(server, '/')[:3]
+            for key in [key for key in self._entries if key[:3] == prefix]:
+                del self._entries[key]
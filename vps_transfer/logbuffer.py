@@ -0,0 +1,107 @@
+"""
+Batched, bounded log pipeline.
+
+Engine code logs with log(message, color) from any thread, one line per file
+on large jobs. Sending each line to the GUI as its own cross-thread signal and
+appending it to a rich-text widget froze the window and grew memory without
+limit on 100k-file uploads. LogBuffer collects lines instead; the GUI drains it
+on a timer and appends a whole batch at once to a view with a maximum line
+count, and the CLI filters on the same levels.
+
+Levels follow the colors the code already uses: red is an error, yellow a
+warning, grey per-file detail (debug), everything else information.
+"""
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+COLOR_LEVELS = {"red": ERROR, "yellow": WARNING, "grey": DEBUG}
+
+MAX_PENDING = 20000
+
+
+def level_for(color):
+    return COLOR_LEVELS.get(color.lower(), INFO)
+
+
+class LogFile:
+    """Appends every line, whatever its level, to a text file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, message, color="white"):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {LEVEL_NAMES[level_for(color)].upper():<7} {message}\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LogBuffer:
+    """
+    Thread-safe queue of (message, color) lines at or above `level`. write()
+    never blocks on the reader; when more than `max_pending` lines are waiting
+    the oldest are dropped and drain() reports how many.
+    """
+
+    def __init__(self, level=INFO, max_pending=MAX_PENDING):
+        self.level = level
+        self.max_pending = max_pending
+        self.log_file = None
+        self._pending = deque()
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def write(self, message, color="white"):
+        log_file = self.log_file
+        if log_file is not None:
+            log_file.write(message, color)
+        if level_for(color) < self.level:
+            return
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+            self._pending.append((message, color))
+
+    def drain(self):
+        """Everything written since the last call, oldest first."""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            lines.insert(0, (f"... {dropped} log lines dropped ...", "yellow"))
+        if self.log_file is not None:
+            self.log_file.flush()
+        return lines
+
+    def open_file(self, path):
+        self.close_file()
+        self.log_file = LogFile(path)
+
+    def close_file(self):
+        log_file, self.log_file = self.log_file, None
+        if log_file is not None:
+            log_file.close()
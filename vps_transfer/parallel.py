@@ -0,0 +1,264 @@
+"""
+Multi-channel parallel upload engine.
+
+Files are pushed through several SFTP channels at once (optionally spread over
+more than one SSH session) so that trees of many files are bounded by bandwidth
+instead of by one round trip per file. A producer fills a bounded work queue
+from the local walk while the channel workers drain it.
+"""
+import os
+import posixpath
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from vps_transfer.journal import put_file
+from vps_transfer.remotedirs import RemoteDirectoryCache
+from vps_transfer.tracing import Tracer, channel_id
+
+
+# local_path is None for a directory that has to exist on the server; mtime and
+# mode come from the local scan when it has them
+UploadTask = namedtuple('UploadTask', ['local_path', 'remote_path', 'size', 'mtime', 'mode'],
+                        defaults=(None, None))
+
+
+class TransferCancelled(Exception):
+    """Raised from a progress callback to abort the file being transferred."""
+
+
+class FileSender:
+    """
+    Moves one file's data by delta, compression, segments or a plain
+    (resumable) put. The sequential, parallel and async upload paths all send
+    files through one of these, so they pick the same method for the same file.
+    Every collaborator is optional; bytes go to the ProgressTracker, if any.
+    """
+
+    def __init__(self, delta=None, compressor=None, segmenter=None, journal=None, resume=False, verifier=None,
+                 tracker=None, stop_event=None, log=None, tracer=None):
+        self.delta = delta
+        self.compressor = compressor
+        self.segmenter = segmenter
+        self.journal = journal
+        self.resume = resume
+        self.verifier = verifier
+        self.tracker = tracker
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.tracer = tracer or Tracer(enabled=False)
+
+    def is_special(self, task):
+        """
+        Whether send() may take something other than a fresh plain put for
+        `task`. Cheap checks only (the compression advisor's sampling is left to
+        send()), for the async core, which does plain puts itself.
+        """
+        return (
+            (self.resume and self.journal is not None and self.journal.is_partial(task.remote_path))
+            or (self.delta is not None and self.delta.applies_to(task.size))
+            or (self.compressor is not None and task.size >= self.compressor.advisor.min_size)
+            or (self.segmenter is not None and self.segmenter.applies_to(task.size))
+        )
+
+    def send(self, sftp, task):
+        """Send `task`'s file; returns its digest when a plain put hashed it for the verifier, else None."""
+        with self.tracer.span(
+                'upload_file', category='file', path=task.remote_path, bytes=task.size,
+                channel=channel_id(sftp)) as span:
+            if self.delta is not None and self.delta.applies_to(task.size) and \
+                    self.delta.upload(task.local_path, task.remote_path):
+                span.set(method='delta')
+                return None
+            if self.compressor is not None and \
+                    self.compressor.should_upload_compressed(task.local_path, task.size):
+                span.set(method='compressed')
+                self._mark_started(task)
+                self.compressor.upload(task.local_path, task.remote_path)
+                return None
+            if self.segmenter is not None and self.segmenter.applies_to(task.size):
+                span.set(method='segmented')
+                self._mark_started(task)
+                self.segmenter.upload(task.local_path, task.remote_path)
+                return None
+            self.log(f"Uploading {task.local_path} to {task.remote_path}", "grey")
+            started = time.perf_counter()
+            hasher = self.verifier.hasher() if self.verifier is not None else None
+            offset = put_file(
+                sftp, task.local_path, task.remote_path, callback=self._callback(task),
+                journal=self.journal, resume=self.resume, hasher=hasher
+            )
+            span.set(method='put', bytes=task.size - offset)
+            if self.compressor is not None:
+                self.compressor.advisor.record_link(task.size - offset, time.perf_counter() - started)
+            if offset:
+                self.log(f"Resumed {os.path.basename(task.local_path)} from {offset / (1024 * 1024):.2f} MB", "cyan")
+                if self.tracker is not None:
+                    self.tracker.skip(offset)
+            return hasher.hexdigest() if hasher is not None else None
+
+    def _mark_started(self, task):
+        if self.journal is not None:
+            self.journal.mark_started(task.remote_path)
+
+    def _check_stopped(self):
+        if self.stop_event.is_set():
+            raise TransferCancelled()
+
+    def _callback(self, task):
+        if self.tracker is None:
+            return lambda transferred, total: self._check_stopped()
+        return self.tracker.file_callback(task.remote_path, task.size, self._check_stopped)
+
+
+class ParallelUploader:
+    """
+    Uploads UploadTasks over `channels` concurrent SFTP channels taken from the
+    connection pool. Channel workers are spread round-robin over `sessions`
+    independent SSH connections. Bytes and finished files from all channels are
+    counted on the shared ProgressTracker, when one is given.
+    """
+
+    def __init__(self, pool, ip, port, username, password, channels=4, sessions=1,
+                 stop_event=None, log=None, tracker=None, directories=None, segmenter=None,
+                 delta=None, preserve_mtime=False, journal=None, resume=False, compressor=None, verifier=None,
+                 tracer=None):
+        self.pool = pool
+        self.credentials = (ip, port, username, password)
+        self.channels = max(1, int(channels))
+        self.sessions = max(1, min(int(sessions), self.channels))
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.tracker = tracker
+        # Shared RemoteDirectoryCache; with a prepared skeleton no task needs a mkdir
+        self.directories = directories or RemoteDirectoryCache(log=self.log)
+        # Optional SegmentedTransfer used for files above its size threshold
+        self.segmenter = segmenter
+        # Optional DeltaTransfer tried first for large files that exist remotely
+        self.delta = delta
+        # Optional CompressedTransfer for files its advisor expects to compress well
+        self.compressor = compressor
+        self.preserve_mtime = preserve_mtime
+        # Optional TransferJournal; in resume mode partial files continue where they stopped
+        self.journal = journal
+        self.resume = resume
+        # Optional Verifier; plain uploads are hashed as they are read
+        self.verifier = verifier
+        # Optional Tracer: a span per file, and the profiler around each channel worker
+        self.tracer = tracer or Tracer(enabled=False)
+        self.sender = None
+        self.queue = queue.Queue(maxsize=self.channels * 64)
+        self.failures = []
+        self.files_done = 0
+        self._alive = 0
+        self._lock = threading.Lock()
+
+    def run(self, tasks):
+        """Upload every task yielded by `tasks`; returns False if stopped early."""
+        # Built here, as the segmenter, delta and compressor may be set after construction
+        self.sender = FileSender(
+            delta=self.delta, compressor=self.compressor, segmenter=self.segmenter, journal=self.journal,
+            resume=self.resume, verifier=self.verifier, tracker=self.tracker, stop_event=self.stop_event,
+            log=self.log, tracer=self.tracer
+        )
+        workers = [
+            threading.Thread(target=self.tracer.wrap(self._worker), args=(index,), daemon=True)
+            for index in range(self.channels)
+        ]
+        self._alive = len(workers)
+        for worker in workers:
+            worker.start()
+        try:
+            for task in tasks:
+                if not self._put(task):
+                    break
+        finally:
+            for _ in workers:
+                self._put(None, force=True)
+            for worker in workers:
+                worker.join()
+        if self._alive == 0 and not self.stop_event.is_set():
+            raise IOError("All upload channels failed")
+        return not self.stop_event.is_set()
+
+    def _put(self, item, force=False):
+        # Keep checking the stop event so a full queue can't block termination
+        while True:
+            halted = self.stop_event.is_set() or self._alive == 0
+            if halted and not force:
+                return False
+            try:
+                self.queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                if halted:
+                    self._drain()
+
+    def _drain(self):
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _worker(self, index):
+        ip, port, username, password = self.credentials
+        try:
+            conn = self.pool.connect(ip, port, username, password, session=index % self.sessions)
+            sftp = conn.open_sftp()
+        except Exception as e:
+            self.log(f"Channel {index + 1}: failed to open SFTP channel: {str(e)}", "red")
+            self._retire()
+            return
+        broken = False
+        try:
+            while True:
+                task = self.queue.get()
+                if task is None:
+                    return
+                if self.stop_event.is_set():
+                    continue
+                try:
+                    self._upload(sftp, task)
+                except TransferCancelled:
+                    self.log(f"Transfer terminated during upload of {task.local_path}.", "yellow")
+                except Exception as e:
+                    self._record_failure(task, e)
+                    if sftp.get_channel().closed:
+                        # The channel died; leave the remaining work to the others
+                        broken = True
+                        self.log(f"Channel {index + 1} closed unexpectedly.", "red")
+                        return
+        finally:
+            conn.release_sftp(sftp, discard=broken)
+            if broken:
+                self._retire()
+
+    def _retire(self):
+        with self._lock:
+            self._alive -= 1
+
+    def _record_failure(self, task, error):
+        with self._lock:
+            self.failures.append((task, error))
+        self.log(f"Failed to upload {os.path.basename(task.local_path or task.remote_path)}: {str(error)}", "red")
+
+    def _upload(self, sftp, task):
+        if task.local_path is None:
+            self.directories.ensure(sftp, task.remote_path)
+            return
+        self.directories.ensure(sftp, posixpath.dirname(task.remote_path))
+        local = os.stat(task.local_path)
+        digest = self.sender.send(sftp, task)
+        if self.journal is not None:
+            self.journal.mark_complete(task.remote_path, local.st_size, local.st_mtime)
+        if self.preserve_mtime:
+            sftp.utime(task.remote_path, (local.st_atime, local.st_mtime))
+        if self.verifier is not None:
+            self.verifier.add(task.remote_path, task.local_path, digest, task)
+        with self._lock:
+            self.files_done += 1
+        if self.tracker is not None:
+            self.tracker.file_done(task.remote_path)
+        self.log(f"Uploaded {os.path.basename(task.local_path)}", "green")
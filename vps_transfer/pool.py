@@ -0,0 +1,289 @@
+"""
+Shared SSH/SFTP connection pool.
+
+Every worker and remote-tree action used to open its own SSHClient, run a full
+handshake plus password auth and then throw the connection away. The pool keeps
+one authenticated Transport per (host, port, username) alive with keepalives and
+hands out SFTP channels on demand, so repeated operations against the same VPS
+only pay for opening a channel. Leased SFTP channels and lease() blocks keep a
+connection from being reaped or replaced while it is in use.
+"""
+import hashlib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+
+
+class PoolStats:
+    """Counters describing how well the pool is doing its job."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.handshakes = 0
+        self.handshake_time = 0.0
+        self.sftp_opened = 0
+        self.sftp_reused = 0
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'handshakes': self.handshakes,
+                'handshake_time': self.handshake_time,
+                'avg_handshake_time': self.handshake_time / self.handshakes if self.handshakes else 0.0,
+                'sftp_opened': self.sftp_opened,
+                'sftp_reused': self.sftp_reused,
+            }
+
+
+class PooledConnection:
+    """
+    An authenticated SSH connection plus the idle SFTP channels opened on it.
+    `leases` counts the SFTP channels and commands using it right now; a
+    retired connection (replaced or reaped by the pool) is closed when the
+    last of them ends.
+    """
+
+    def __init__(self, key, client, secret, stats, max_idle_sftp):
+        self.key = key
+        self.client = client
+        self.secret = secret
+        self.stats = stats
+        self.max_idle_sftp = max_idle_sftp
+        self.last_used = time.monotonic()
+        self.leases = 0
+        self.retired = False
+        self._lock = threading.Lock()
+        self._idle_sftp = []
+
+    @property
+    def transport(self):
+        return self.client.get_transport()
+
+    def is_alive(self):
+        transport = self.transport
+        return transport is not None and transport.is_active()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            self.leases += 1
+        self.touch()
+
+    def release(self):
+        self.touch()
+        with self._lock:
+            self.leases -= 1
+            close = self.retired and self.leases == 0
+        if close:
+            self.close()
+
+    @contextmanager
+    def lease(self):
+        """Hold the connection for a command or stream that runs outside an SFTP lease."""
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def retire(self):
+        """Close the connection now if nothing holds a lease, else when the last one ends."""
+        with self._lock:
+            self.retired = True
+            close = self.leases == 0
+        if close:
+            self.close()
+
+    def open_sftp(self):
+        """Lease an SFTP channel, reusing an idle one when possible."""
+        self.acquire()
+        with self._lock:
+            while self._idle_sftp:
+                sftp = self._idle_sftp.pop()
+                if not sftp.get_channel().closed:
+                    self.stats.add(sftp_reused=1)
+                    return sftp
+        try:
+            sftp = self.client.open_sftp()
+        except Exception:
+            self.release()
+            raise
+        self.stats.add(sftp_opened=1)
+        return sftp
+
+    def release_sftp(self, sftp, discard=False):
+        """Return a leased SFTP channel so the next caller can reuse it."""
+        try:
+            self._return_sftp(sftp, discard)
+        finally:
+            self.release()
+
+    def _return_sftp(self, sftp, discard):
+        if not discard and self.is_alive() and not sftp.get_channel().closed:
+            with self._lock:
+                if len(self._idle_sftp) < self.max_idle_sftp:
+                    # Reset the working directory so the next user starts clean
+                    try:
+                        sftp.chdir(None)
+                    except Exception:
+                        discard = True
+                    if not discard:
+                        self._idle_sftp.append(sftp)
+                        return
+        try:
+            sftp.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def sftp(self):
+        sftp = self.open_sftp()
+        broken = False
+        try:
+            yield sftp
+        except (EOFError, socket.error, paramiko.SSHException):
+            broken = True
+            raise
+        finally:
+            self.release_sftp(sftp, discard=broken)
+
+    def exec_command(self, command, timeout=None):
+        self.touch()
+        return self.client.exec_command(command, timeout=timeout)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle_sftp = self._idle_sftp, []
+        for sftp in idle:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Keeps authenticated SSH connections keyed by host, port and username.
+    Connections idle for longer than idle_timeout are closed the next time the
+    pool is used; keepalive packets stop NAT boxes from dropping the rest.
+    """
+
+    def __init__(self, keepalive=30, idle_timeout=600, connect_timeout=10, max_idle_sftp=4):
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.max_idle_sftp = max_idle_sftp
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._connecting = {}
+
+    @staticmethod
+    def make_key(host, port, username, session=0):
+        # session > 0 selects an additional, independent SSH connection to the
+        # same server, used to spread parallel transfers over several Transports
+        return (host, int(port), username, session)
+
+    @staticmethod
+    def _secret(password):
+        # Only a digest is kept, to notice when the password in the form changes
+        return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+    def connect(self, host, port, username, password, session=0):
+        """Return a live PooledConnection, performing a handshake only when needed."""
+        key = self.make_key(host, port, username, session)
+        secret = self._secret(password)
+        self.reap_idle()
+
+        while True:
+            with self._lock:
+                conn = self._connections.get(key)
+                if conn is not None and conn.secret == secret and conn.is_alive():
+                    self.stats.add(hits=1)
+                    conn.touch()
+                    return conn
+                # Another thread is already connecting to this host; wait for it
+                pending = self._connecting.get(key)
+                if pending is None:
+                    stale = self._connections.pop(key, None)
+                    pending = self._connecting[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            if stale is not None:
+                # Workers may still hold it (the password changed under them); it closes when they let go
+                stale.retire()
+                self.stats.add(reconnects=1)
+            self.stats.add(misses=1)
+            conn = self._open(key, password, secret)
+            with self._lock:
+                self._connections[key] = conn
+            return conn
+        finally:
+            with self._lock:
+                self._connecting.pop(key, None)
+            pending.set()
+
+    def _open(self, key, password, secret):
+        host, port, username, _session = key
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        started = time.perf_counter()
+        client.connect(
+            host,
+            port=port,
+            username=username,
+            password=password,
+            timeout=self.connect_timeout
+        )
+        self.stats.add(handshakes=1, handshake_time=time.perf_counter() - started)
+        if self.keepalive:
+            client.get_transport().set_keepalive(self.keepalive)
+        return PooledConnection(key, client, secret, self.stats, self.max_idle_sftp)
+
+    @contextmanager
+    def sftp(self, host, port, username, password):
+        """Lease an SFTP channel on the pooled connection for the given server."""
+        conn = self.connect(host, port, username, password)
+        with conn.sftp() as sftp:
+            yield sftp
+
+    def reap_idle(self):
+        if not self.idle_timeout:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # A long transfer doesn't touch the connection, so leased ones are never idle
+            expired = [key for key, conn in self._connections.items()
+                       if not conn.leases and now - conn.last_used > self.idle_timeout]
+            expired = [self._connections.pop(key) for key in expired]
+        for conn in expired:
+            conn.retire()
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._connections.values())
+            self._connections.clear()
+        for conn in conns:
+            conn.close()
@@ -0,0 +1,157 @@
+"""
+Progress accounting.
+
+Byte counts arrive from many places (paramiko callbacks, which report a
+cumulative count per file, segment and delta workers, tar streams) and from
+several threads at once. ProgressTracker turns them into exact per-file and
+aggregate totals, a rolling-window throughput, an ETA and a files/sec rate,
+and hands snapshots to its listener at most `interval` seconds apart so the
+GUI or CLI is not flooded with one update per 32 KB chunk. Since every byte
+passes through it, it is also where a BandwidthLimiter is applied.
+"""
+import threading
+import time
+from collections import deque
+
+from vps_transfer.bandwidth import NORMAL
+
+UPDATE_INTERVAL = 0.1  # 10 Hz
+RATE_WINDOW = 5.0
+
+
+def format_rate(rate):
+    return f"{rate / (1024 * 1024):.2f} MB/s"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def format_stats(stats):
+    """One-line human summary of a snapshot, for the GUI status line and logs."""
+    return (
+        f"{stats['transferred'] / (1024 * 1024):.2f} / {stats['total'] / (1024 * 1024):.2f} MB, "
+        f"{format_rate(stats['rate'])}, {stats['files_per_sec']:.1f} files/s, ETA {format_eta(stats['eta'])}"
+    )
+
+
+class ProgressTracker:
+    """
+    Thread-safe byte and file counters. `on_update(snapshot)` is called from
+    whichever thread reports progress, rate-limited to one call per `interval`.
+    With a `limiter`, reporting transferred bytes blocks until they fit under
+    its limit, which paces whatever transfer is reporting them.
+    """
+
+    def __init__(self, total=0, on_update=None, interval=UPDATE_INTERVAL, window=RATE_WINDOW,
+                 clock=time.monotonic, limiter=None, priority=NORMAL):
+        self.total = total
+        self.transferred = 0
+        self.files_done = 0
+        self.on_update = on_update
+        self.interval = interval
+        self.window = window
+        self.clock = clock
+        self.limiter = limiter
+        self.priority = priority
+        self.started = clock()
+        self.active = {}  # path -> [bytes done, size]
+        self._samples = deque([(self.started, 0)])
+        self._last_update = None
+        self._lock = threading.Lock()
+
+    def add_total(self, size):
+        with self._lock:
+            self.total += size
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+        self.update(force=True)
+
+    def advance(self, delta):
+        """Count `delta` more (or, for a rollback, fewer) bytes transferred."""
+        with self._lock:
+            self.transferred += delta
+        self.throttle(delta)
+        self.update()
+
+    def skip(self, amount):
+        """Count bytes that did not have to be sent (resumed or already complete)."""
+        with self._lock:
+            self.transferred += amount
+        self.update()
+
+    def throttle(self, amount):
+        if self.limiter is not None:
+            self.limiter.consume(amount, self.priority)
+
+    def file_done(self, path=None):
+        with self._lock:
+            self.files_done += 1
+            self.active.pop(path, None)
+        self.update()
+
+    def file_callback(self, path, size, check=None):
+        """
+        A paramiko-style callback(transferred, total) for one file. paramiko
+        reports the cumulative count, so only the difference is added. `check`
+        is called first on every chunk (e.g. to raise when cancelled).
+        """
+        last = [0]
+        with self._lock:
+            self.active[path] = [0, size]
+
+        def callback(transferred, total):
+            if check is not None:
+                check()
+            delta = transferred - last[0]
+            last[0] = transferred
+            with self._lock:
+                self.transferred += delta
+                entry = self.active.get(path)
+                if entry is not None:
+                    entry[0] = transferred
+            self.throttle(delta)
+            self.update()
+        return callback
+
+    def update(self, force=False):
+        if self.on_update is None:
+            return
+        now = self.clock()
+        with self._lock:
+            if not force and self._last_update is not None and now - self._last_update < self.interval:
+                return
+            self._last_update = now
+        self.on_update(self.snapshot())
+
+    def snapshot(self):
+        now = self.clock()
+        with self._lock:
+            samples = self._samples
+            samples.append((now, self.transferred))
+            while len(samples) > 2 and now - samples[1][0] >= self.window:
+                samples.popleft()
+            oldest_time, oldest_bytes = samples[0]
+            span = now - oldest_time
+            rate = (self.transferred - oldest_bytes) / span if span > 0 else 0.0
+            elapsed = now - self.started
+            remaining = max(0, self.total - self.transferred)
+            return {
+                'transferred': self.transferred,
+                'total': self.total,
+                'percent': min(100, int(self.transferred * 100 / self.total)) if self.total > 0 else 0,
+                'rate': max(0.0, rate),
+                'average_rate': self.transferred / elapsed if elapsed > 0 else 0.0,
+                'eta': remaining / rate if rate > 0 else None,
+                'files_done': self.files_done,
+                'files_per_sec': self.files_done / elapsed if elapsed > 0 else 0.0,
+                'elapsed': elapsed,
+                'active': {path: tuple(entry) for path, entry in self.active.items()},
+            }
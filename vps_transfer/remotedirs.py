@@ -0,0 +1,142 @@
+"""
+Remote directory-state cache.
+
+Uploads used to check the target directory of every file with an SFTP chdir,
+and create missing ones one path component at a time from "/", so a tree of
+100k files cost 100k extra round trips before any data moved. The cache
+remembers every directory known to exist, and `prepare` creates the skeleton
+the upload needs ahead of the files, with a single `mkdir -p` per batch run
+over an exec channel. Servers without a shell fall back to SFTP mkdirs, which
+still happen only once per directory.
+"""
+import posixpath
+import stat
+import threading
+
+from vps_transfer.remote import quote, run_command
+from vps_transfer.tracing import Tracer, channel_id
+
+SKELETON_BATCH = 1024  # tasks read ahead before their directories are created
+MAX_COMMAND_LENGTH = 65536  # well below ARG_MAX on any Linux server
+
+
+def parents(path):
+    """`path` and every ancestor of it below "/"."""
+    path = posixpath.normpath(path)
+    while path not in ('/', '.', ''):
+        yield path
+        path = posixpath.dirname(path)
+
+
+class RemoteDirectoryCache:
+    """
+    Remote directories known to exist. Safe to share between upload channels;
+    a directory is created at most once even when several race for it.
+    """
+
+    def __init__(self, log=None, tracer=None):
+        self.log = log or (lambda message, color="white": None)
+        self.tracer = tracer or Tracer(enabled=False)
+        self.use_shell = True
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def known(self, path):
+        with self._lock:
+            return posixpath.normpath(path) in self._known
+
+    def mark(self, path):
+        """Record that `path`, and so all of its parents, exists."""
+        with self._lock:
+            for directory in parents(path):
+                if directory in self._known:
+                    break
+                self._known.add(directory)
+
+    def ensure(self, sftp, remote_dir):
+        """Create `remote_dir` over SFTP unless it is already known to exist."""
+        remote_dir = posixpath.normpath(remote_dir)
+        if remote_dir == '/' or self.known(remote_dir):
+            return
+        missing = []
+        for directory in parents(remote_dir):
+            if self.known(directory):
+                break
+            missing.append(directory)
+        for path in reversed(missing):
+            try:
+                with self.tracer.span('mkdir', category='directory', path=path, channel=channel_id(sftp)):
+                    sftp.mkdir(path)
+                self.log(f"Created directory: {path}", "grey")
+            except IOError:
+                # Either it already exists or another channel just created it
+                if not stat.S_ISDIR(sftp.stat(path).st_mode):
+                    raise
+            with self._lock:
+                self._known.add(path)
+
+    def create(self, conn, sftp, directories):
+        """Create all of `directories` (and their parents) with batched `mkdir -p`."""
+        with self._lock:
+            missing = sorted({posixpath.normpath(d) for d in directories} - self._known - {'/'})
+        if not missing:
+            return
+        if self.use_shell:
+            for batch in self._command_batches(missing):
+                try:
+                    with self.tracer.span('mkdir -p', category='directory', directories=len(batch)):
+                        status, _output, error = run_command(conn, "mkdir -p -- " + " ".join(quote(d) for d in batch))
+                except Exception as e:
+                    # No shell on the server (an SFTP-only account refuses exec)
+                    self.log(f"mkdir -p unavailable ({str(e)}); creating directories over SFTP.", "yellow")
+                    self.use_shell = False
+                    break
+                if status != 0:
+                    self.log(f"mkdir -p failed ({error.strip() or status}); creating directories over SFTP.", "yellow")
+                    self.use_shell = False
+                    break
+                for directory in batch:
+                    self.mark(directory)
+            else:
+                self.log(f"Created {len(missing)} remote directories in one batch", "grey")
+                return
+        for directory in missing:
+            self.ensure(sftp, directory)
+
+    @staticmethod
+    def _command_batches(directories):
+        batch = []
+        length = 0
+        for directory in directories:
+            size = len(quote(directory)) + 1
+            if batch and length + size > MAX_COMMAND_LENGTH:
+                yield batch
+                batch = []
+                length = 0
+            batch.append(directory)
+            length += size
+        if batch:
+            yield batch
+
+    def prepare(self, conn, sftp, tasks, batch=SKELETON_BATCH):
+        """
+        Pass UploadTasks through, reading up to `batch` ahead and creating the
+        directories they need before any of them is handed on. Directory tasks
+        are passed through too, so uploaders see them as already known.
+        """
+        pending = []
+        for task in tasks:
+            pending.append(task)
+            if len(pending) >= batch:
+                self._create_for(conn, sftp, pending)
+                yield from pending
+                pending = []
+        if pending:
+            self._create_for(conn, sftp, pending)
+            yield from pending
+
+    def _create_for(self, conn, sftp, tasks):
+        self.create(conn, sftp, [
+            task.remote_path if task.local_path is None else posixpath.dirname(task.remote_path)
+            for task in tasks
+        ])
@@ -0,0 +1,166 @@
+"""
+Single-pass streaming scanner for local sources.
+
+The upload used to walk every selected directory twice, once to add up sizes
+(with a stat per file) and once to upload, and no bytes moved until the first
+walk had finished. The scanner walks each tree once with os.scandir, whose
+entries already carry the stat data, and hands UploadTasks to the upload
+pipeline through a bounded queue while the walk is still running. The running
+total grows as the walk goes on, and memory stays bounded by the queue size and
+the stack of directories still to visit rather than by the size of the tree.
+"""
+import os
+import posixpath
+import queue
+import stat
+import threading
+
+from vps_transfer.parallel import UploadTask
+from vps_transfer.tracing import Tracer
+
+SCAN_QUEUE_SIZE = 4096
+_DONE = object()
+
+
+def remote_path_for(local_path, common_path, destination):
+    relative = os.path.relpath(local_path, common_path).replace('\\', '/')
+    return posixpath.normpath(posixpath.join(destination.replace('\\', '/'), relative))
+
+
+class LocalScanner:
+    """
+    Iterating yields an UploadTask (with size, mtime and mode) for every
+    directory and file below `sources`, skipping names in `exclusions`.
+    `on_file(size)` is called from the scanning thread for every file found,
+    before the task is queued, so a progress total can grow with the scan.
+    """
+
+    def __init__(self, sources, common_path, destination, exclusions=(), stop_event=None,
+                 log=None, on_file=None, queue_size=SCAN_QUEUE_SIZE, tracer=None):
+        self.sources = list(sources)
+        self.common_path = common_path
+        self.destination = destination
+        self.exclusions = set(exclusions)
+        self.stop_event = stop_event or threading.Event()
+        self._halt = threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.on_file = on_file or (lambda size: None)
+        self.tracer = tracer or Tracer(enabled=False)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.files = 0
+        self.directories = 0
+        self.total_size = 0
+        self.finished = False
+        self.error = None
+
+    def __iter__(self):
+        thread = threading.Thread(target=self.tracer.wrap(self._traced_scan), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            if not self.finished:
+                # The consumer gave up early; let the scanning thread finish
+                self._halt.set()
+                self._drain()
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _drain(self):
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _halted(self):
+        return self._halt.is_set() or self.stop_event.is_set()
+
+    def _put(self, item):
+        while not self._halted():
+            try:
+                self.queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _file_task(self, path, st):
+        self.files += 1
+        self.total_size += st.st_size
+        self.on_file(st.st_size)
+        remote_path = remote_path_for(path, self.common_path, self.destination)
+        return UploadTask(path, remote_path, st.st_size, st.st_mtime, st.st_mode)
+
+    def _traced_scan(self):
+        # The span includes time spent waiting for the uploader to take tasks off a full queue
+        with self.tracer.span('scan', sources=len(self.sources)) as span:
+            self._scan()
+            span.set(files=self.files, directories=self.directories, size=self.total_size)
+
+    def _scan(self):
+        try:
+            for source in self.sources:
+                if os.path.basename(source) in self.exclusions:
+                    self.log(f"Excluded: {os.path.basename(source)}", "yellow")
+                    continue
+                st = os.stat(source)
+                if stat.S_ISDIR(st.st_mode):
+                    if not self._walk(source):
+                        return
+                elif stat.S_ISREG(st.st_mode):
+                    if not self._put(self._file_task(source, st)):
+                        return
+            self.log(
+                f"Scan complete: {self.files} files in {self.directories} directories, "
+                f"{self.total_size / (1024 * 1024):.2f} MB",
+                "blue"
+            )
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            # The sentinel must get through even when stopping, or the consumer hangs
+            while True:
+                try:
+                    self.queue.put(_DONE, timeout=0.2)
+                    break
+                except queue.Full:
+                    if self._halted():
+                        self._drain()
+
+    def _walk(self, top):
+        # Depth-first with an explicit stack; parents are always queued before their contents
+        pending = [top]
+        while pending:
+            directory = pending.pop()
+            self.directories += 1
+            if not self._put(UploadTask(None, remote_path_for(directory, self.common_path, self.destination), 0)):
+                return False
+            subdirectories = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name in self.exclusions:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            # Like os.walk, symlinked directories are not followed
+                            subdirectories.append(entry.path)
+                        elif entry.is_file(follow_symlinks=True):
+                            try:
+                                st = entry.stat()
+                            except OSError as e:
+                                # Deleted since the listing, or unreadable
+                                self.log(f"Error getting size for {entry.path}: {str(e)}", "red")
+                                continue
+                            if not self._put(self._file_task(entry.path, st)):
+                                return False
+            except OSError as e:
+                self.log(f"Error scanning {directory}: {str(e)}", "red")
+            pending.extend(reversed(subdirectories))
+        return True
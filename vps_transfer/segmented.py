@@ -0,0 +1,172 @@
+"""
+Segmented parallel transfer of single large files.
+
+One sftp.put stream is capped by a single channel window and one core's cipher
+throughput. Files above a size threshold are split into byte ranges that are
+written concurrently, at their offsets, over several channels (and optionally
+several SSH sessions). Each segment is retried on a fresh channel if it fails,
+and the finished file is checked by size and, when the server has sha256sum,
+by hash.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from vps_transfer.parallel import TransferCancelled
+from vps_transfer.remote import sha256sum
+
+SEGMENT_THRESHOLD = 256 * 1024 * 1024
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+BLOCK_SIZE = 1024 * 1024
+
+
+def local_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SegmentedTransfer:
+    """
+    Moves one large file in `segments` concurrent byte ranges. `progress` is
+    called with the number of bytes moved since the previous call (negative
+    when a failed segment is rolled back before a retry).
+    """
+
+    def __init__(self, pool, ip, port, username, password, segments=4, sessions=1,
+                 threshold=SEGMENT_THRESHOLD, retries=3, verify_hash=True,
+                 stop_event=None, log=None, progress=None):
+        self.pool = pool
+        self.credentials = (ip, port, username, password)
+        self.segments = max(1, int(segments))
+        self.sessions = max(1, int(sessions))
+        self.threshold = threshold
+        self.retries = retries
+        self.verify_hash = verify_hash
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.progress = progress or (lambda delta: None)
+
+    def applies_to(self, size):
+        return self.segments > 1 and size >= self.threshold
+
+    def split(self, size):
+        count = max(1, min(self.segments, size // MIN_SEGMENT_SIZE or 1))
+        step = -(-size // count)
+        return [(start, min(start + step, size)) for start in range(0, size, step)] or [(0, 0)]
+
+    def connect(self, index=0):
+        ip, port, username, password = self.credentials
+        return self.pool.connect(ip, port, username, password, session=index % self.sessions)
+
+    def upload(self, local_path, remote_path):
+        size = os.path.getsize(local_path)
+        ranges = self.split(size)
+        self.log(f"Uploading {local_path} in {len(ranges)} segments", "blue")
+
+        # Create the remote file at its final size so every segment can seek into it
+        with self.connect().sftp() as sftp:
+            with sftp.open(remote_path, 'wb') as f:
+                f.truncate(size)
+
+        self._run(ranges, lambda sftp, start, end, sent: self._upload_range(sftp, local_path, remote_path, start, end, sent))
+
+        with self.connect().sftp() as sftp:
+            remote_size = sftp.stat(remote_path).st_size
+        self._verify(size, remote_size, local_path, remote_path)
+
+    def download(self, remote_path, local_path):
+        with self.connect().sftp() as sftp:
+            size = sftp.stat(remote_path).st_size
+        ranges = self.split(size)
+        self.log(f"Downloading {remote_path} in {len(ranges)} segments", "blue")
+
+        with open(local_path, 'wb') as f:
+            f.truncate(size)
+
+        self._run(ranges, lambda sftp, start, end, sent: self._download_range(sftp, remote_path, local_path, start, end, sent))
+
+        self._verify(size, os.path.getsize(local_path), local_path, remote_path)
+
+    def _run(self, ranges, transfer_range):
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(self._segment, index, start, end, transfer_range)
+                for index, (start, end) in enumerate(ranges)
+            ]
+            errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def _segment(self, index, start, end, transfer_range):
+        attempt = 0
+        while True:
+            sent = [0]
+            try:
+                with self.connect(index).sftp() as sftp:
+                    transfer_range(sftp, start, end, sent)
+                return
+            except TransferCancelled:
+                raise
+            except Exception as e:
+                # Roll back this segment's progress and start it over on a new channel
+                self.progress(-sent[0])
+                attempt += 1
+                if attempt > self.retries or self.stop_event.is_set():
+                    raise
+                self.log(f"Segment {index + 1} failed ({str(e)}), retrying ({attempt}/{self.retries})...", "yellow")
+
+    def _advance(self, sent, amount):
+        if self.stop_event.is_set():
+            raise TransferCancelled()
+        sent[0] += amount
+        self.progress(amount)
+
+    def _upload_range(self, sftp, local_path, remote_path, start, end, sent):
+        with open(local_path, 'rb') as source, sftp.open(remote_path, 'r+b') as target:
+            target.set_pipelined(True)
+            source.seek(start)
+            target.seek(start)
+            position = start
+            while position < end:
+                block = source.read(min(BLOCK_SIZE, end - position))
+                if not block:
+                    raise IOError(f"{local_path} shrank during upload")
+                target.write(block)
+                position += len(block)
+                self._advance(sent, len(block))
+
+    def _download_range(self, sftp, remote_path, local_path, start, end, sent):
+        with sftp.open(remote_path, 'rb') as source, open(local_path, 'r+b') as target:
+            source.seek(start)
+            source.prefetch(end)
+            target.seek(start)
+            position = start
+            while position < end:
+                block = source.read(min(BLOCK_SIZE, end - position))
+                if not block:
+                    raise IOError(f"{remote_path} shrank during download")
+                target.write(block)
+                position += len(block)
+                self._advance(sent, len(block))
+
+    def _verify(self, expected_size, actual_size, local_path, remote_path):
+        if expected_size != actual_size:
+            raise IOError(f"Size mismatch for {remote_path}: expected {expected_size}, got {actual_size}")
+        if not self.verify_hash:
+            return
+        try:
+            remote_hash = sha256sum(self.connect(), remote_path)
+        except Exception:
+            # No shell on the server (an SFTP-only account refuses exec)
+            remote_hash = None
+        if remote_hash is None:
+            self.log(f"sha256sum not available on the server; verified {remote_path} by size only.", "yellow")
+            return
+        if remote_hash != local_sha256(local_path):
+            raise IOError(f"Checksum mismatch for {remote_path}")
+        self.log(f"Verified {remote_path} (sha256 {remote_hash[:12]}...)", "green")
@@ -0,0 +1,164 @@
+"""
+Incremental sync support.
+
+Remote metadata for the whole destination is fetched in bulk (one `find -printf`
+when the server has GNU find, otherwise one listdir_attr per directory) and
+compared with the local walk so only new or changed files are uploaded.
+Uploaded files get their local mtime, which keeps the next comparison cheap.
+"""
+import os
+import posixpath
+import stat
+
+from vps_transfer.remote import quote, run_command, sha256sum
+from vps_transfer.segmented import local_sha256
+
+
+class RemoteIndex:
+    """Size and mtime of every file below a remote root, keyed by relative path."""
+
+    def __init__(self, root):
+        self.root = root.rstrip('/') or '/'
+        self.files = {}
+        self.dirs = set()
+        self.source = None
+
+    def relative(self, remote_path):
+        return posixpath.relpath(remote_path, self.root)
+
+    @classmethod
+    def fetch(cls, conn, sftp, root):
+        index = cls(root)
+        if not index._fetch_find(conn):
+            index._fetch_sftp(sftp)
+        return index
+
+    def _fetch_find(self, conn):
+        # %y type, %s size, %T@ mtime, %P path relative to root; NUL-separated
+        # records so that any file name survives the trip
+        command = f"find {quote(self.root)} -mindepth 1 -printf '%y %s %T@ %P\\0'"
+        try:
+            status, output, _error = run_command(conn, command)
+        except Exception:
+            # No shell on the server (an SFTP-only account refuses exec)
+            return False
+        if status != 0:
+            return False
+        for record in output.split('\0'):
+            if not record:
+                continue
+            kind, size, mtime, path = record.split(' ', 3)
+            if kind == 'd':
+                self.dirs.add(path)
+            elif kind == 'f':
+                self.files[path] = (int(size), int(float(mtime)))
+        self.source = 'find'
+        return True
+
+    def _fetch_sftp(self, sftp):
+        pending = ['.']
+        while pending:
+            relative_dir = pending.pop()
+            remote_dir = posixpath.normpath(posixpath.join(self.root, relative_dir))
+            try:
+                entries = sftp.listdir_attr(remote_dir)
+            except IOError:
+                continue
+            for entry in entries:
+                path = posixpath.normpath(posixpath.join(relative_dir, entry.filename))
+                if stat.S_ISDIR(entry.st_mode):
+                    self.dirs.add(path)
+                    pending.append(path)
+                elif stat.S_ISREG(entry.st_mode):
+                    self.files[path] = (entry.st_size, int(entry.st_mtime))
+        self.source = 'sftp'
+
+
+class SyncPlanner:
+    """
+    Filters UploadTasks down to the ones that need uploading, lazily, so the
+    uploads start while the scan is still running. With `checksum` set, files
+    whose size matches but whose mtime differs are compared by SHA-256 before
+    being re-sent, and a match gets the local mtime (over `sftp`) so the next
+    sync settles it by mtime alone. `on_skip(size)` is called for every file
+    left out.
+    """
+
+    def __init__(self, index, conn=None, sftp=None, checksum=False, log=None, on_skip=None):
+        self.index = index
+        self.conn = conn
+        self.sftp = sftp
+        self.checksum = checksum
+        self.log = log or (lambda message, color="white": None)
+        self.on_skip = on_skip or (lambda size: None)
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.touched = 0
+        self.skipped_bytes = 0
+
+    def classify(self, task):
+        # Scanned tasks carry their size and mtime; others need a stat
+        if task.mtime is None:
+            local = os.stat(task.local_path)
+            task = task._replace(size=local.st_size, mtime=local.st_mtime)
+        remote = self.index.files.get(self.index.relative(task.remote_path))
+        if remote is None:
+            return 'new'
+        remote_size, remote_mtime = remote
+        if remote_size != task.size:
+            return 'changed'
+        if remote_mtime == int(task.mtime):
+            return 'unchanged'
+        if self.checksum and self.conn is not None:
+            try:
+                remote_digest = sha256sum(self.conn, task.remote_path)
+            except Exception as e:
+                self.checksum = False
+                self.log(f"Sync: no shell access for checksums ({str(e)}); comparing by size and mtime.", "yellow")
+                return 'changed'
+            if remote_digest == local_sha256(task.local_path):
+                self.touch(task)
+                return 'unchanged'
+        return 'changed'
+
+    def touch(self, task):
+        if self.sftp is None:
+            return
+        try:
+            preserve_mtime(self.sftp, task.local_path, task.remote_path)
+            self.touched += 1
+        except (IOError, OSError) as e:
+            self.log(f"Sync: could not set the mtime of {task.remote_path}: {str(e)}", "yellow")
+
+    def filter(self, tasks):
+        for task in tasks:
+            if task.local_path is None:
+                # Directories that already exist need no round trip at all
+                if self.index.relative(task.remote_path) not in self.index.dirs:
+                    yield task
+                continue
+            state = self.classify(task)
+            if state == 'unchanged':
+                self.unchanged += 1
+                self.skipped_bytes += task.size
+                self.on_skip(task.size)
+                continue
+            if state == 'new':
+                self.new += 1
+            else:
+                self.changed += 1
+            yield task
+
+    def summary(self):
+        touched = f", {self.touched} matched by checksum and given the local mtime" if self.touched else ""
+        return (
+            f"Sync: {self.new} new, {self.changed} changed, {self.unchanged} unchanged "
+            f"({self.skipped_bytes / (1024 * 1024):.2f} MB skipped{touched})"
+        )
+
+
+def preserve_mtime(sftp, local_path, remote_path):
+    """Copy the local atime/mtime onto the uploaded remote file."""
+    local = os.stat(local_path)
+    sftp.utime(remote_path, (local.st_atime, local.st_mtime))
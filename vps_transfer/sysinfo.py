@@ -0,0 +1,214 @@
+"""
+Cached server status probe.
+
+Every upload used to run `uptime`, `df`, `free` and `uname` one after another,
+each on its own exec channel, before any file moved. SystemInfoCache runs them
+all in one shell invocation instead, together with a `df -Pk` of every mounted
+filesystem, and keeps the result per server for PROBE_TTL seconds. Jobs start
+the probe in a background thread and carry on, and path_free_space() reads the
+free space of their destination with `df` on that very path.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from vps_transfer.remote import quote, run_command
+
+PROBE_TTL = 300  # seconds a probe result is reused for the same server
+PROBE_TIMEOUT = 15
+
+# (label, command) in display order
+PROBE_COMMANDS = (
+    ("Uptime", "uptime -p"),
+    ("Disk Usage", "df -h /"),
+    ("Memory Usage", "free -h"),
+    ("System Info", "uname -a"),
+)
+MARKER = "@@vps-transfer-probe@@"
+FILESYSTEMS = "filesystems"
+
+
+def probe_script():
+    """One shell command printing every probe section between markers, each followed by its exit status."""
+    sections = list(PROBE_COMMANDS) + [(FILESYSTEMS, "LC_ALL=C df -Pk")]
+    return "; ".join(
+        f"printf '%s %s\\n' {MARKER} '{label}'; {{ {command}; }} 2>&1; printf '%s status %d\\n' {MARKER} $?"
+        for label, command in sections
+    )
+
+
+def parse_probe(output):
+    """{label: (exit status, text)} from the output of probe_script()."""
+    sections = {}
+    label = None
+    lines = []
+    for line in output.splitlines():
+        if not line.startswith(MARKER + " "):
+            lines.append(line)
+            continue
+        rest = line[len(MARKER) + 1:]
+        if rest.startswith("status ") and label is not None:
+            try:
+                status = int(rest.split()[1])
+            except (IndexError, ValueError):
+                status = 1
+            sections[label] = (status, "\n".join(lines).strip())
+            label = None
+        else:
+            label = rest
+        lines = []
+    return sections
+
+
+def parse_df(text):
+    """[(mount point, available bytes)] from `df -Pk` output."""
+    filesystems = []
+    for line in text.splitlines()[1:]:
+        # Filesystem 1024-blocks Used Available Capacity Mounted-on; only the mount point may hold spaces
+        fields = line.split(None, 5)
+        if len(fields) < 6:
+            continue
+        try:
+            filesystems.append((fields[5], int(fields[3]) * 1024))
+        except ValueError:
+            continue
+    return filesystems
+
+
+def path_free_space(conn, path, timeout=PROBE_TIMEOUT):
+    """
+    Bytes available on the filesystem holding `path`, or None when df can't
+    tell. df resolves symlinks and bind mounts itself; a path that doesn't
+    exist yet is measured at its nearest existing parent, and a relative one
+    from the login directory.
+    """
+    command = (
+        f"p={quote(path)}; "
+        'while [ ! -e "$p" ] && [ "$p" != / ] && [ "$p" != . ]; do p=$(dirname -- "$p"); done; '
+        'LC_ALL=C df -Pk -- "$p"'
+    )
+    try:
+        status, output, _error = run_command(conn, command, timeout=timeout)
+    except Exception:
+        return None
+    filesystems = parse_df(output) if status == 0 else []
+    return filesystems[0][1] if filesystems else None
+
+
+class SystemInfo:
+    """One probe of a server: `fields` {label: text}, `errors` {label: text}, and the df data."""
+
+    def __init__(self, fields, errors, filesystems, elapsed):
+        self.fields = fields
+        self.errors = errors
+        self.filesystems = filesystems
+        self.elapsed = elapsed
+        self.fetched_at = time.time()
+        self._fetched = time.monotonic()
+
+    @classmethod
+    def from_output(cls, output, elapsed):
+        sections = parse_probe(output)
+        fields = OrderedDict()
+        errors = OrderedDict()
+        for label, _command in PROBE_COMMANDS:
+            status, text = sections.get(label, (1, "no output"))
+            if status == 0:
+                fields[label] = text
+            else:
+                errors[label] = text or f"exit status {status}"
+        status, text = sections.get(FILESYSTEMS, (1, ""))
+        return cls(fields, errors, parse_df(text) if status == 0 else [], elapsed)
+
+    def age(self):
+        return time.monotonic() - self._fetched
+
+
+class SystemInfoCache:
+    """
+    SystemInfo per (host, port, username), reused for `ttl` seconds. Jobs
+    and the GUI share one instance; a probe already running for a server is
+    waited for rather than started twice. `on_update(server, info)` is
+    called from the probing thread after every fresh probe.
+    """
+
+    def __init__(self, ttl=PROBE_TTL, on_update=None):
+        self.ttl = ttl
+        self.on_update = on_update
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._running = {}  # server -> Event set when its probe finishes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(server):
+        host, port, username = server
+        return (host, str(port), username)
+
+    def get(self, server):
+        """The cached SystemInfo if it is still fresh, else None."""
+        with self._lock:
+            info = self._entries.get(self.make_key(server))
+            if info is None or info.age() > self.ttl:
+                return None
+            return info
+
+    def fetch(self, conn, server, force=False):
+        """Fresh-enough SystemInfo for `server`, probing over `conn` when needed."""
+        key = self.make_key(server)
+        while True:
+            with self._lock:
+                info = self._entries.get(key)
+                if not force and info is not None and info.age() <= self.ttl:
+                    self.hits += 1
+                    return info
+                running = self._running.get(key)
+                if running is None:
+                    running = self._running[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another thread is probing this server; use its result
+            running.wait(PROBE_TIMEOUT)
+            force = False
+            with self._lock:
+                info = self._entries.get(key)
+                if info is not None and info.age() <= self.ttl:
+                    return info
+        try:
+            started = time.perf_counter()
+            _status, output, _error = run_command(conn, probe_script(), timeout=PROBE_TIMEOUT)
+            info = SystemInfo.from_output(output, time.perf_counter() - started)
+            with self._lock:
+                self._entries[key] = info
+        finally:
+            with self._lock:
+                del self._running[key]
+            running.set()
+        if self.on_update is not None:
+            self.on_update(key, info)
+        return info
+
+    def fetch_async(self, pool, host, port, username, password, on_done=None, force=False):
+        """
+        Probe from a background thread; `on_done(info, error)` gets the result
+        (or the exception). Returns the thread.
+        """
+        def probe():
+            try:
+                conn = pool.connect(host, port, username, password)
+                info = self.fetch(conn, (host, port, username), force=force)
+            except Exception as e:
+                if on_done is not None:
+                    on_done(None, e)
+                return
+            if on_done is not None:
+                on_done(info, None)
+
+        thread = threading.Thread(target=probe, daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, server):
+        with self._lock:
+            self._entries.pop(self.make_key(server), None)
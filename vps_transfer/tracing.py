@@ -0,0 +1,322 @@
+"""
+Per-phase tracing and profiling.
+
+A slow transfer can lose its time in the SSH handshake, the system-info
+commands, directory round trips, the size walk or the data itself, and the
+log doesn't say which. A job with tracing on records a span for each phase
+and each file operation (with byte counts and SFTP channel ids) and, when it
+finishes, writes them as Chrome trace-event JSON (open it in chrome://tracing
+or https://ui.perfetto.dev) next to an aggregated text summary under
+~/.vps_transfer/traces. A Profiler can ride along: 'cpu' runs cProfile in the
+job's thread and its channel worker threads, 'memory' runs tracemalloc.
+
+With tracing and profiling both off, span() hands back one shared no-op
+object, so instrumented code pays next to nothing.
+"""
+import cProfile
+import datetime
+import io
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from vps_transfer.journal import journal_dir
+
+PROFILE_MODES = ('cpu', 'memory')
+PROFILE_LINES = 40  # functions or allocation sites listed in a profile summary
+
+
+def trace_dir():
+    return os.path.join(os.path.dirname(journal_dir()), 'traces')
+
+
+def stamped_path(directory, name, extension):
+    """directory/name-YYYYmmdd-HHMMSS.extension, numbered when that file already exists."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f"{name}-{stamp}{extension}")
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(directory, f"{name}-{stamp}-{suffix}{extension}")
+    return path
+
+
+def channel_id(sftp):
+    """The SSH channel id under an SFTP client (paramiko's or the async core's), if it has one."""
+    channel = getattr(sftp, 'sock', None)
+    get_id = getattr(channel, 'get_id', None)
+    return get_id() if get_id is not None else None
+
+
+class Span:
+    """
+    One timed operation, used as a context manager. set() adds arguments
+    (bytes, channel, method...) while it runs; an exception leaving the span
+    is recorded as its 'error' argument.
+    """
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'concurrent', 'start', 'end', 'thread')
+
+    def __init__(self, tracer, name, category, concurrent, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.concurrent = concurrent
+        self.args = args
+        self.start = None
+        self.end = None
+        self.thread = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.thread = threading.current_thread()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._record(self)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collects Spans from any thread. `concurrent` spans are ones that overlap
+    others on the same thread (the async core's files) and are exported as
+    Chrome async events instead of nested slices. wrap() prepares a thread
+    target for the profiler, if there is one.
+    """
+
+    def __init__(self, enabled=True, profiler=None):
+        self.enabled = enabled
+        self.profiler = profiler
+        self.spans = []
+        self.origin = time.perf_counter()
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_params(cls, params):
+        """A Tracer for params['trace'] and params['profile'] ('cpu', 'memory' or None)."""
+        profile = params.get('profile')
+        return cls(enabled=params.get('trace', False), profiler=Profiler(profile) if profile else None)
+
+    @property
+    def active(self):
+        return self.enabled or self.profiler is not None
+
+    def span(self, name, category='phase', concurrent=False, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, concurrent, args)
+
+    def wrap(self, target):
+        if self.profiler is None:
+            return target
+        return self.profiler.wrap(target)
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def chrome_trace(self):
+        """The recorded spans as a Chrome trace-event document."""
+        pid = os.getpid()
+        events = []
+        threads = {}
+        ids = itertools.count(1)
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            tid = span.thread.ident
+            threads.setdefault(tid, span.thread.name)
+            event = {
+                'name': span.name,
+                'cat': span.category,
+                'pid': pid,
+                'tid': tid,
+                'ts': round((span.start - self.origin) * 1e6, 1),
+            }
+            if span.concurrent:
+                event['id'] = next(ids)
+                events.append(dict(event, ph='b', args=span.args))
+                events.append(dict(event, ph='e', ts=round((span.end - self.origin) * 1e6, 1)))
+            else:
+                events.append(dict(event, ph='X', dur=round((span.end - span.start) * 1e6, 1), args=span.args))
+        for tid, name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds')},
+        }
+
+    def aggregate(self):
+        """{(category, name[:method]): [count, seconds, max seconds, bytes]} over the recorded spans."""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            method = span.args.get('method')
+            key = (span.category, f"{span.name}:{method}" if method else span.name)
+            duration = span.end - span.start
+            total = totals.setdefault(key, [0, 0.0, 0.0, 0])
+            total[0] += 1
+            total[1] += duration
+            total[2] = max(total[2], duration)
+            total[3] += span.args.get('bytes') or 0
+        return totals
+
+    def summary(self):
+        """Aggregated text table, slowest first. Times of concurrent spans add up past wall time."""
+        totals = self.aggregate()
+        wall = max(
+            (total[1] for (category, _name), total in totals.items() if category == 'job'),
+            default=time.perf_counter() - self.origin
+        )
+        lines = [
+            f"{'span':<28}{'count':>8}{'total s':>10}{'% wall':>8}{'mean ms':>10}{'max ms':>10}{'MB':>10}{'MB/s':>9}"
+        ]
+        for (category, name), (count, seconds, longest, size) in sorted(
+                totals.items(), key=lambda item: item[1][1], reverse=True):
+            rate = f"{size / 1048576 / seconds:>9.2f}" if size and seconds else f"{'':>9}"
+            lines.append(
+                f"{category + '/' + name:<28.28}{count:>8}{seconds:>10.3f}{seconds / wall * 100 if wall else 0:>7.1f}%"
+                f"{seconds / count * 1000:>10.2f}{longest * 1000:>10.2f}"
+                f"{(f'{size / 1048576:.2f}' if size else ''):>10}{rate}"
+            )
+        return "\n".join(lines)
+
+    def write(self, name):
+        """Write the Chrome trace and its text summary; returns (trace path, summary path)."""
+        path = stamped_path(trace_dir(), name, '.trace.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+        summary_path = path[:-len('.trace.json')] + '.summary.txt'
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary() + "\n")
+        return path, summary_path
+
+
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+
+class Profiler:
+    """
+    'cpu': every thread target passed through wrap() runs under its own
+    cProfile.Profile, merged into one pstats dump at the end. 'memory':
+    tracemalloc runs from start() to stop(); it sees the whole process, so
+    jobs running at the same time share one trace.
+    """
+
+    def __init__(self, mode):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.snapshot = None
+        self.peak = 0
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def wrap(self, target):
+        if self.mode != 'cpu':
+            return target
+
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+            profile.enable()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                profile.disable()
+        return profiled
+
+    def start(self):
+        global _memory_users
+        if self.mode != 'memory':
+            return
+        with _memory_lock:
+            if _memory_users == 0:
+                tracemalloc.start()
+            _memory_users += 1
+
+    def stop(self):
+        global _memory_users
+        if self.mode != 'memory':
+            return
+        with _memory_lock:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak = tracemalloc.get_traced_memory()[1]
+            _memory_users -= 1
+            if _memory_users == 0:
+                tracemalloc.stop()
+
+    def summary(self):
+        if self.mode == 'memory':
+            if self.snapshot is None:
+                return ""
+            lines = [f"Peak traced memory: {self.peak / 1048576:.2f} MB", "Largest allocation sites:"]
+            for statistic in self.snapshot.statistics('lineno')[:PROFILE_LINES]:
+                lines.append(f"  {statistic}")
+            return "\n".join(lines)
+        stats = self._stats()
+        if stats is None:
+            return ""
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+        return output.getvalue()
+
+    def _stats(self):
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = None
+        for profile in profiles:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+    def write(self, name):
+        """Write the profile (a .prof pstats dump for 'cpu') and its text summary; returns the paths."""
+        paths = []
+        summary_path = stamped_path(trace_dir(), name, f'.{self.mode}-profile.txt')
+        if self.mode == 'cpu':
+            stats = self._stats()
+            if stats is not None:
+                path = summary_path[:-len('.txt')] + '.prof'
+                stats.dump_stats(path)
+                paths.append(path)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary())
+        paths.append(summary_path)
+        return paths
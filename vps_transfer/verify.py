@@ -0,0 +1,321 @@
+"""
+Streaming integrity verification.
+
+In verify mode each file is hashed while it is read for upload (or written by
+a download), so the local side costs no extra disk pass. Verifier groups the
+finished files by remote directory and hashes each group on the server with
+one `sha256sum` (`xxhsum` when both ends have xxHash) over an exec channel,
+on background threads while the transfer is still running. Files whose hashes
+differ are handed back to the job to be sent again, and every verified job
+leaves a JSON report under ~/.vps_transfer/reports.
+"""
+import datetime
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from vps_transfer.journal import COPY_BLOCK, journal_dir
+from vps_transfer.remote import quote, run_command
+from vps_transfer.remotedirs import MAX_COMMAND_LENGTH
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+VERIFY_BATCH = 256   # files per remote hash command
+VERIFY_DELAY = 0.5   # seconds a directory waits for more finished files before it is hashed
+VERIFY_WORKERS = 2   # remote hash commands running at once
+VERIFY_RETRIES = 2   # times a file that failed verification is sent again
+
+# Algorithm name -> (remote command, local hash constructor)
+ALGORITHMS = {'sha256': ('sha256sum', hashlib.sha256)}
+if xxhash is not None:
+    ALGORITHMS['xxh64'] = ('xxhsum -H1', xxhash.xxh64)
+
+# One checked file; remote_hash is None when the server listed no hash for it
+Checked = namedtuple('Checked', ['remote_path', 'local_path', 'local_hash', 'remote_hash', 'item'])
+
+
+def report_dir():
+    return os.path.join(os.path.dirname(journal_dir()), 'reports')
+
+
+def choose_algorithm(conn):
+    """xxh64 when the xxhash module is installed and the server has xxhsum, else sha256."""
+    if 'xxh64' in ALGORITHMS:
+        try:
+            if run_command(conn, "command -v xxhsum")[0] == 0:
+                return 'xxh64'
+        except Exception:
+            pass
+    return 'sha256'
+
+
+def hash_file(path, hasher):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _unescape(name):
+    # sha256sum prefixes the line with a backslash and escapes "\" and newlines in the name
+    result = []
+    index = 0
+    while index < len(name):
+        char = name[index]
+        if char == '\\' and index + 1 < len(name):
+            index += 1
+            char = '\n' if name[index] == 'n' else name[index]
+        result.append(char)
+        index += 1
+    return ''.join(result)
+
+
+def parse_hash_output(output):
+    """{name: hex digest} from the output of sha256sum or xxhsum."""
+    hashes = {}
+    for line in output.splitlines():
+        escaped = line.startswith('\\')
+        if escaped:
+            line = line[1:]
+        digest, separator, name = line.partition('  ')
+        if not separator:
+            # Binary mode marker
+            digest, separator, name = line.partition(' *')
+        if not separator:
+            continue
+        hashes[_unescape(name) if escaped else name] = digest.lower()
+    return hashes
+
+
+def hash_batches(directory, items, name=lambda item: item, command='sha256sum'):
+    """Split `items` of one remote directory into lists small enough for one hash command each."""
+    batch = []
+    base = len(quote(directory)) + len(command) + 16
+    length = base
+    for item in items:
+        size = len(quote(name(item))) + 1
+        if batch and (len(batch) >= VERIFY_BATCH or length + size > MAX_COMMAND_LENGTH):
+            yield batch
+            batch = []
+            length = base
+        batch.append(item)
+        length += size
+    if batch:
+        yield batch
+
+
+def remote_hashes(conn, directory, names, command='sha256sum'):
+    """{name: hex digest} for the files `names` in a remote directory, from one command."""
+    if not names:
+        return {}
+    status, output, error = run_command(
+        conn, f"cd -- {quote(directory)} && {command} -- {' '.join(quote(name) for name in names)}"
+    )
+    hashes = parse_hash_output(output)
+    if not hashes and status != 0:
+        raise IOError(error.strip() or f"{command} exited with status {status}")
+    return hashes
+
+
+class Verifier:
+    """
+    Checks transferred files against their source. add() queues a finished
+    file with the digest computed while it moved, or None to have the local
+    copy hashed here (segmented, delta, compressed and tar-extracted files).
+    A directory's files are hashed on the server once VERIFY_BATCH of them
+    are queued or the oldest has waited VERIFY_DELAY. finish() waits for
+    everything queued and returns the files that did not match since the
+    last call, so the job can send them again and add() them anew.
+    """
+
+    def __init__(self, conn, kind, algorithm='sha256', name=None, stop_event=None, log=None):
+        self.conn = conn
+        self.kind = kind  # 'upload' or 'download'
+        self.algorithm = algorithm
+        self.command, self.new_hash = ALGORITHMS[algorithm]
+        self.name = name or kind
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.verified = 0
+        self.mismatched = {}  # remote path -> latest failed Checked
+        self.unverified = {}  # remote path -> reason it could not be checked
+        self.resent = {}      # remote path -> times it was sent again
+        self.started = time.time()
+        self._pending = {}    # remote directory -> queued (remote_path, local_path, digest, item)
+        self._since = {}      # remote directory -> when its oldest queued file arrived
+        self._failed = []
+        self._busy = 0
+        self._flushing = False
+        self._closed = False
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=VERIFY_WORKERS)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @classmethod
+    def for_connection(cls, conn, kind, name=None, stop_event=None, log=None):
+        return cls(conn, kind, choose_algorithm(conn), name, stop_event, log)
+
+    def hasher(self):
+        """A fresh hash object for streaming one file's bytes into."""
+        return self.new_hash()
+
+    def add(self, remote_path, local_path, digest=None, item=None):
+        """Queue a transferred file; `item` is what the job needs to send it again."""
+        directory = posixpath.dirname(remote_path) or '.'
+        with self._lock:
+            self._pending.setdefault(directory, []).append((remote_path, local_path, digest, item))
+            self._since.setdefault(directory, time.monotonic())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, daemon=True)
+                self._thread.start()
+            self._changed.notify_all()
+
+    def resending(self, checked):
+        """Record that the files in `checked` are being sent again."""
+        with self._lock:
+            for record in checked:
+                self.resent[record.remote_path] = self.resent.get(record.remote_path, 0) + 1
+
+    def finish(self):
+        """Wait until every queued file is checked (or the job is stopped); returns new mismatches."""
+        with self._lock:
+            self._flushing = True
+            self._changed.notify_all()
+            while (self._pending or self._busy) and not self.stop_event.is_set():
+                self._changed.wait(VERIFY_DELAY)
+            self._flushing = False
+            failed, self._failed = self._failed, []
+        return failed
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        self._executor.shutdown(wait=False)
+
+    def _dispatch(self):
+        with self._lock:
+            while not self._closed:
+                now = time.monotonic()
+                ready = [
+                    directory for directory, entries in self._pending.items()
+                    if self._flushing or len(entries) >= VERIFY_BATCH or now - self._since[directory] >= VERIFY_DELAY
+                ]
+                for directory in ready:
+                    entries = self._pending.pop(directory)
+                    del self._since[directory]
+                    for batch in hash_batches(directory, entries, self._name, self.command):
+                        self._busy += 1
+                        self._executor.submit(self._check, directory, batch)
+                if not ready:
+                    self._changed.wait(VERIFY_DELAY if self._pending else None)
+
+    @staticmethod
+    def _name(entry):
+        return posixpath.basename(entry[0])
+
+    def _check(self, directory, entries):
+        try:
+            local = {}
+            for remote_path, local_path, digest, _item in entries:
+                if digest is None:
+                    try:
+                        digest = hash_file(local_path, self.hasher())
+                    except OSError as e:
+                        self._unverified(remote_path, f"local file unreadable: {e}")
+                        continue
+                local[remote_path] = digest
+            try:
+                remote = remote_hashes(self.conn, directory, [posixpath.basename(path) for path in local], self.command)
+            except Exception as e:
+                for remote_path in local:
+                    self._unverified(remote_path, str(e))
+                return
+            for remote_path, local_path, _digest, item in entries:
+                if remote_path not in local:
+                    continue
+                record = Checked(
+                    remote_path, local_path, local[remote_path], remote.get(posixpath.basename(remote_path)), item
+                )
+                with self._lock:
+                    if record.local_hash == record.remote_hash:
+                        self.verified += 1
+                        self.mismatched.pop(remote_path, None)
+                        self.unverified.pop(remote_path, None)
+                    else:
+                        self.mismatched[remote_path] = record
+                        self._failed.append(record)
+                if record.local_hash != record.remote_hash:
+                    self.log(f"Verification failed: {remote_path}", "red")
+        except Exception as e:
+            self.log(f"Verification error in {directory}: {str(e)}", "red")
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._changed.notify_all()
+
+    def _unverified(self, remote_path, reason):
+        with self._lock:
+            self.unverified[remote_path] = reason
+        self.log(f"Could not verify {remote_path}: {reason}", "yellow")
+
+    @property
+    def ok(self):
+        return not self.mismatched and not self.unverified
+
+    def summary(self):
+        summary = f"Verification ({self.algorithm}): {self.verified} file(s) match"
+        if self.resent:
+            summary += f", {len(self.resent)} sent again"
+        if self.mismatched:
+            summary += f", {len(self.mismatched)} still differ"
+        if self.unverified:
+            summary += f", {len(self.unverified)} could not be checked"
+        return summary
+
+    def write_report(self, description):
+        """Write the per-job JSON report and return its path."""
+        directory = report_dir()
+        os.makedirs(directory, exist_ok=True)
+        finished = time.time()
+        stamp = datetime.datetime.fromtimestamp(finished).strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(directory, f"{self.name}-{stamp}.json")
+        suffix = 1
+        while os.path.exists(path):
+            suffix += 1
+            path = os.path.join(directory, f"{self.name}-{stamp}-{suffix}.json")
+        with self._lock:
+            report = {
+                'job': description,
+                'kind': self.kind,
+                'algorithm': self.algorithm,
+                'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'finished': datetime.datetime.fromtimestamp(finished).isoformat(timespec='seconds'),
+                'result': 'mismatch' if self.mismatched else 'incomplete' if self.unverified else 'ok',
+                'verified': self.verified,
+                'resent': dict(self.resent),
+                'mismatched': [
+                    {
+                        'path': record.remote_path,
+                        'local_path': record.local_path,
+                        'local_hash': record.local_hash,
+                        'remote_hash': record.remote_hash,
+                    }
+                    for record in self.mismatched.values()
+                ],
+                'unverified': [
+                    {'path': remote_path, 'reason': reason} for remote_path, reason in self.unverified.items()
+                ],
+            }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return path
@@ -0,0 +1,259 @@
+"""
+Concurrent remote tree walking.
+
+Recursive download and delete used to walk the tree depth-first on a single
+SFTP channel, so a wide tree spent nearly all its time waiting on one
+listdir_attr or remove round trip after another. RemoteWalker lists up to
+`channels` directories at once and streams the entries it finds through a
+bounded queue (a slow consumer pauses the listing instead of growing memory).
+ChannelWorkers then runs the per-file work, downloads or removes, over a pool
+of channels in the same way.
+"""
+import posixpath
+import queue
+import stat
+import threading
+from collections import namedtuple
+
+from vps_transfer.tracing import Tracer, channel_id
+
+WALK_CHANNELS = 4
+WALK_QUEUE_SIZE = 4096
+_DONE = object()
+
+# relative is the path below the walk's root, with "/" separators
+RemoteEntry = namedtuple('RemoteEntry', ['path', 'relative', 'attributes', 'is_dir'])
+
+
+class RemoteWalker:
+    """
+    Iterating yields a RemoteEntry for every directory and file below `root`
+    (not the root itself). A directory always comes before anything inside it;
+    otherwise the order is whatever the listings return first. Directories that
+    cannot be listed are logged and collected in `errors`; symbolic links are
+    reported as files and never followed.
+    """
+
+    def __init__(self, pool, ip, port, username, password, root, channels=WALK_CHANNELS,
+                 stop_event=None, log=None, on_file=None, queue_size=WALK_QUEUE_SIZE, tracer=None):
+        self.pool = pool
+        self.credentials = (ip, port, username, password)
+        self.root = posixpath.normpath(root)
+        self.channels = max(1, int(channels))
+        self.stop_event = stop_event or threading.Event()
+        self._halt = threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.on_file = on_file or (lambda size: None)
+        self.tracer = tracer or Tracer(enabled=False)
+        self.entries = queue.Queue(maxsize=queue_size)
+        self.directories = queue.Queue()
+        self.errors = []
+        self.error = None
+        self.files = 0
+        self.total_size = 0
+        self._outstanding = 1  # directories queued or being listed
+        self._alive = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        self.directories.put(self.root)
+        workers = [
+            threading.Thread(target=self.tracer.wrap(self._worker), daemon=True) for _ in range(self.channels)
+        ]
+        self._alive = len(workers)
+        for worker in workers:
+            worker.start()
+        finished = False
+        try:
+            while True:
+                if self.stop_event.is_set():
+                    break
+                try:
+                    entry = self.entries.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if entry is _DONE:
+                    finished = True
+                    break
+                yield entry
+        finally:
+            if not finished:
+                # Stopped, or the consumer gave up early; release the listers
+                self._halt.set()
+                self._drain(self.entries)
+            for _ in workers:
+                self.directories.put(None)
+            for worker in workers:
+                worker.join()
+        if self.error is not None:
+            raise self.error
+
+    @staticmethod
+    def _drain(items):
+        try:
+            while True:
+                items.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _halted(self):
+        return self._halt.is_set() or self.stop_event.is_set()
+
+    def _put(self, entry):
+        while not self._halted():
+            try:
+                self.entries.put(entry, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self):
+        ip, port, username, password = self.credentials
+        try:
+            conn = self.pool.connect(ip, port, username, password)
+            sftp = conn.open_sftp()
+        except Exception as e:
+            # The other workers take over this one's share of the listing
+            self.log(f"Tree walker: failed to open SFTP channel: {str(e)}", "red")
+            with self._lock:
+                self._alive -= 1
+                last = self._alive == 0
+            if last:
+                self.error = IOError("All SFTP channels failed")
+                self._send_done()
+            return
+        try:
+            while True:
+                directory = self.directories.get()
+                if directory is None:
+                    return
+                try:
+                    if not self._halted():
+                        self._list(sftp, directory)
+                except Exception as e:
+                    self.errors.append((directory, e))
+                    self.log(f"Failed to list {directory}: {str(e)}", "red")
+                finally:
+                    self._finish_one()
+        finally:
+            conn.release_sftp(sftp)
+
+    def _list(self, sftp, directory):
+        with self.tracer.span('listdir', category='directory', path=directory, channel=channel_id(sftp)) as span:
+            listing = sftp.listdir_attr(directory)
+            span.set(entries=len(listing))
+        for attributes in listing:
+            path = posixpath.join(directory, attributes.filename)
+            is_dir = stat.S_ISDIR(attributes.st_mode)
+            if not is_dir:
+                with self._lock:
+                    self.files += 1
+                    self.total_size += attributes.st_size
+                self.on_file(attributes.st_size)
+            entry = RemoteEntry(path, posixpath.relpath(path, self.root), attributes, is_dir)
+            if not self._put(entry):
+                return
+            if is_dir:
+                with self._lock:
+                    self._outstanding += 1
+                self.directories.put(path)
+
+    def _finish_one(self):
+        with self._lock:
+            self._outstanding -= 1
+            done = self._outstanding == 0
+        if done:
+            # Every directory has been listed
+            self._send_done()
+
+    def _send_done(self):
+        # The sentinel must get through unless the consumer is gone
+        while True:
+            try:
+                self.entries.put(_DONE, timeout=0.2)
+                return
+            except queue.Full:
+                if self._halted():
+                    return
+
+
+class ChannelWorkers:
+    """
+    Calls `work(sftp, item)` for every item of an iterable on `channels`
+    concurrent SFTP channels, fed through a bounded queue. Failures go to
+    `on_error(item, error)`; the remaining items carry on.
+    """
+
+    def __init__(self, pool, ip, port, username, password, channels=WALK_CHANNELS,
+                 stop_event=None, log=None, on_error=None, tracer=None):
+        self.pool = pool
+        self.credentials = (ip, port, username, password)
+        self.channels = max(1, int(channels))
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda message, color="white": None)
+        self.on_error = on_error or (lambda item, error: None)
+        self.tracer = tracer or Tracer(enabled=False)
+        self.queue = queue.Queue(maxsize=self.channels * 64)
+        self._alive = 0
+        self._lock = threading.Lock()
+
+    def run(self, items, work):
+        """Returns False if stopped before every item was handed out."""
+        workers = [
+            threading.Thread(target=self.tracer.wrap(self._worker), args=(work,), daemon=True)
+            for _ in range(self.channels)
+        ]
+        self._alive = len(workers)
+        for worker in workers:
+            worker.start()
+        completed = True
+        try:
+            for item in items:
+                if not self._put(item):
+                    completed = False
+                    break
+        finally:
+            for _ in workers:
+                self._put(None, force=True)
+            for worker in workers:
+                worker.join()
+        if self._alive == 0 and not self.stop_event.is_set():
+            raise IOError("All SFTP channels failed")
+        return completed and not self.stop_event.is_set()
+
+    def _put(self, item, force=False):
+        while True:
+            halted = self.stop_event.is_set() or self._alive == 0
+            if halted and not force:
+                return False
+            try:
+                self.queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                if halted:
+                    RemoteWalker._drain(self.queue)
+
+    def _worker(self, work):
+        ip, port, username, password = self.credentials
+        try:
+            conn = self.pool.connect(ip, port, username, password)
+            sftp = conn.open_sftp()
+        except Exception as e:
+            self.log(f"Failed to open SFTP channel: {str(e)}", "red")
+            with self._lock:
+                self._alive -= 1
+            return
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                if self.stop_event.is_set():
+                    continue
+                try:
+                    work(sftp, item)
+                except Exception as e:
+                    self.on_error(item, e)
+        finally:
+            conn.release_sftp(sftp)